@@ -0,0 +1,3 @@
+"""
+Benchmarks for the address parser. Run them with python -m benchmarks, see benchmarks/run.py.
+"""
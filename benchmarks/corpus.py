@@ -0,0 +1,112 @@
+import random
+from typing import Iterator, List
+
+__all__ = [
+    'generate_corpus',
+    'iter_corpus'
+]
+
+STREET_STEMS = [
+    'Oxbacks', 'Dana', 'Kungs', 'Drottning', 'Stor', 'Sture', 'Birger Jarls', 'Sveav', 'Hamn', 'Kyrk', 'Skol',
+    'Prästgårds', 'Järnvägs', 'Ängs', 'Björk', 'Lönn', 'Ekbacks', 'Solna', 'Tegnér', 'Fleming'
+]
+STREET_SUFFIXES = ['gatan', 'vägen', 'gränd', 'stigen', 'backen', 'torget']
+AVENUES = ['Oxenstiernas allé', 'Karlavägen', 'Valhallavägen', 'Strandvägen', 'Lidingövägen']
+CITIES = [
+    'Stockholm', 'Göteborg', 'Malmö', 'Uppsala', 'Västerås', 'Örebro', 'Linköping', 'Järfälla', 'Sundbyberg',
+    'Solna', 'Täby', 'Hedeby', 'Umeå', 'Luleå', 'Borås'
+]
+
+# The international examples of main.py, with numbers that are varied by the generator.
+INTERNATIONAL = [
+    '{n} Pennsylvania Ave NW, Washington, DC {zip5}, United States',
+    '{n} Downing Street, Westminster, London SW1A 2AA, United Kingdom',
+    'Champs-Élysées, Paris, France',
+    'Brandenburg Gate, Pariser Platz, Berlin, Germany',
+    '{n} Macquarie St, Sydney NSW {zip4}, Australia',
+    'Calle de Serrano, Madrid, Spain',
+    'Roppongi Hills Mori Tower, 6 Chome-10-{n} Roppongi, Minato City, Tokyo 106-0032, Japan',
+    'Rua da Gloria, Rio de Janeiro - RJ, {zip5}-180, Brazil',
+    'Hans Christian Andersens Blvd. {n}, 1553 København V, Denmark',
+    'Rua Augusta, Lisbon, Portugal',
+    'Hauptstraße {n}, {zip5} Berlin',
+    '{n} rue de Rivoli, {zip5} Paris',
+    'Calle Mayor {n}, {zip5} Madrid',
+]
+
+
+def swedish_address(rnd: random.Random) -> str:
+    """
+    A Swedish address like "Oxbacksgatan 3 lgh 1213 72461 Västerås" or "Danagränd 7B, 174 64 Järfälla".
+    """
+
+    if rnd.random() < 0.2:
+        street = rnd.choice(AVENUES)
+    else:
+        street = rnd.choice(STREET_STEMS) + rnd.choice(STREET_SUFFIXES)
+
+    number = str(rnd.randint(1, 150))
+    if rnd.random() < 0.15:
+        number += rnd.choice('ABCD')
+
+    parts = [f'{street} {number}']
+    if rnd.random() < 0.3:
+        parts.append(f'lgh {rnd.randint(1001, 1904)}')
+
+    postal_code = rnd.randint(10000, 98499)
+    if rnd.random() < 0.5:
+        postal_code = f'{postal_code // 100} {postal_code % 100:02d}'
+
+    separator = rnd.choice([', ', ' ', ' ', '\t'])
+    return f'{" ".join(parts)}{separator}{postal_code} {rnd.choice(CITIES)}'
+
+
+def international_address(rnd: random.Random) -> str:
+    return rnd.choice(INTERNATIONAL).format(
+        n=rnd.randint(1, 200),
+        zip4=rnd.randint(1000, 9999),
+        zip5=rnd.randint(10000, 99999)
+    )
+
+
+def vary(address: str, rnd: random.Random) -> str:
+    """
+    Change the whitespace and case of an address, like the same address sent by another system.
+    """
+
+    choice = rnd.random()
+    if choice < 0.3:
+        return address.upper()
+    if choice < 0.6:
+        return '  '.join(address.split())
+    return f' {address.lower()} '
+
+
+def iter_corpus(size: int, seed: int = 0, swedish_share: float = 0.8, duplicate_share: float = 0.0) -> Iterator[str]:
+    """
+    Generate a reproducible corpus of addresses.
+
+    :param size: The number of addresses.
+    :param seed: The seed of the generator. The same seed always gives the same corpus.
+    :param swedish_share: The share of Swedish addresses, the others are international.
+    :param duplicate_share: The share of addresses that repeat an earlier address with other whitespace or case.
+    :return: An iterator over the addresses.
+    """
+
+    rnd = random.Random(seed)
+    recent: List[str] = []
+    for _ in range(size):
+        if recent and rnd.random() < duplicate_share:
+            yield vary(rnd.choice(recent), rnd)
+            continue
+
+        address = swedish_address(rnd) if rnd.random() < swedish_share else international_address(rnd)
+        if len(recent) < 10000:
+            recent.append(address)
+        else:
+            recent[rnd.randrange(len(recent))] = address
+        yield address
+
+
+def generate_corpus(size: int, seed: int = 0, swedish_share: float = 0.8, duplicate_share: float = 0.0) -> List[str]:
+    return list(iter_corpus(size, seed, swedish_share, duplicate_share))
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Sequence
+
+__all__ = [
+    'load_test'
+]
+
+
+async def post(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str,
+               document: dict) -> int:
+    """
+    Send one request on a keep-alive connection and return the status of the response.
+    """
+
+    body = json.dumps(document).encode('utf-8')
+    writer.write(
+        f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+    )
+    await writer.drain()
+
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    status = int(head.split(' ', 2)[1])
+    length = 0
+    for line in head.split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host: str, port: int, path: str, documents: List[dict], latencies: List[float],
+                 statuses: Counter) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for document in documents:
+            started = time.perf_counter()
+            statuses[await post(reader, writer, host, path, document)] += 1
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+def percentile(values: Sequence[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+def load_test(corpus: Sequence[str], host: str = '127.0.0.1', port: int = 8080, concurrency: int = 64,
+              batch: int = 0, country_code: str = None) -> Dict[str, object]:
+    """
+    Send a corpus to a running service from concurrent keep-alive connections.
+
+    :param corpus: The addresses to send.
+    :param concurrency: The number of connections, each sends its requests one after the other.
+    :param batch: Send this many addresses per request to /parse/batch, 0 sends one address per request to /parse.
+    :param country_code: The country code of all requests, if any.
+    :return: The throughput, the latencies in milliseconds and the number of responses by status.
+    """
+
+    if batch:
+        path = '/parse/batch'
+        documents = [{'addresses': list(corpus[i:i + batch])} for i in range(0, len(corpus), batch)]
+    else:
+        path = '/parse'
+        documents = [{'address': a} for a in corpus]
+    if country_code:
+        for document in documents:
+            document['country_code'] = country_code
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def main() -> None:
+        await asyncio.gather(*(
+            client(host, port, path, documents[i::concurrency], latencies, statuses) for i in range(concurrency)
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(documents),
+        'addresses': len(corpus),
+        'seconds': elapsed,
+        'addresses_per_second': len(corpus) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p90': percentile(latencies, 0.9) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': max(latencies, default=0.0) * 1000
+        },
+        'statuses': {str(status): count for status, count in sorted(statuses.items())}
+    }
@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.corpus import generate_corpus, iter_corpus
+from benchmarks.load import load_test
+
+__all__ = [
+    'compare',
+    'import_time',
+    'main',
+    'run_benchmarks'
+]
+
+ROOT = Path(__file__).absolute().parent.parent
+
+STAGES = [
+    'detect_language',
+    'load_country_config',
+    'compile_country_config',
+    'normalize_address',
+    'create_tokens',
+    'evaluate_address_components',
+    'full_address',
+    'parse_address',
+    'parse_many',
+]
+
+IMPORT_TIME = re.compile(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+src$')
+
+
+def measure(function: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """
+    Run a stage repeat times and report the fastest run.
+
+    :param function: Runs the stage over the whole corpus and returns the number of items it processed.
+    :param repeat: The number of runs.
+    """
+
+    best, items = float('inf'), 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = function()
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        'seconds': best,
+        'items': items,
+        'per_second': items / best if best > 0 else 0.0,
+        'per_item_us': best / items * 1e6 if items else 0.0
+    }
+
+
+def run_benchmarks(corpus: Sequence[str], repeat: int = 3, stages: Sequence[str] = STAGES,
+                   batch_size: int = 1000) -> Dict[str, Dict[str, float]]:
+    """
+    Time each stage of the parser separately over a corpus. The inputs of each stage are computed before it is
+    timed, so a stage is never charged for the work of the stages before it.
+
+    :return: The timings of each stage, see measure.
+    """
+
+    from src import run
+    from src.address import Address, AddressParser, CountryDetector, load_country_config
+    from src.address import country
+
+    app = run(mode='PRODUCTION')
+    logging.getLogger().setLevel('WARNING')
+
+    codes = [CountryDetector().detect(a) for a in corpus]
+    configs = {code: load_country_config(code) for code in dict.fromkeys(codes)}
+    parsers = {code: AddressParser(country_config) for code, country_config in configs.items()}
+    address_parsers = [parsers[code] for code in codes]
+    normalized = [p.normalize_address(a) for p, a in zip(address_parsers, corpus)]
+    tokens = [p.create_tokens(n) for p, n in zip(address_parsers, normalized)]
+    addresses = [
+        Address(app, a, country_code=code, parser=p, components=p.parse_address(a))
+        for a, code, p in zip(corpus, codes, address_parsers)
+    ]
+
+    def detect_language() -> int:
+        detector = CountryDetector()
+        for a in corpus:
+            detector.detect(a)
+        return len(corpus)
+
+    def load_country_configs() -> int:
+        for code in codes:
+            load_country_config(code)
+        return len(codes)
+
+    def compile_country_configs() -> int:
+        for code in configs:
+            country.compile_country_config(code, country.config_files(code))
+        return len(configs)
+
+    def normalize_address() -> int:
+        for p, a in zip(address_parsers, corpus):
+            p.normalize_address(a)
+        return len(corpus)
+
+    def create_tokens() -> int:
+        for p, n in zip(address_parsers, normalized):
+            p.create_tokens(n)
+        return len(corpus)
+
+    def evaluate_address_components() -> int:
+        for p, t, n in zip(address_parsers, tokens, normalized):
+            p.evaluate_address_components(t, n)
+        return len(corpus)
+
+    def full_address() -> int:
+        for address in addresses:
+            address.full_address
+        return len(addresses)
+
+    def parse_address() -> int:
+        for p, a in zip(address_parsers, corpus):
+            p.parse_address(a)
+        return len(corpus)
+
+    def parse_many() -> int:
+        by_country: Dict[str, List[str]] = {}
+        for code, a in zip(codes, corpus):
+            by_country.setdefault(code, []).append(a)
+        for code, group in by_country.items():
+            for _ in parsers[code].parse_many(group, batch_size):
+                pass
+        return len(corpus)
+
+    functions = {
+        'detect_language': detect_language,
+        'load_country_config': load_country_configs,
+        'compile_country_config': compile_country_configs,
+        'normalize_address': normalize_address,
+        'create_tokens': create_tokens,
+        'evaluate_address_components': evaluate_address_components,
+        'full_address': full_address,
+        'parse_address': parse_address,
+        'parse_many': parse_many,
+    }
+
+    results = {}
+    for stage in stages:
+        results[stage] = measure(functions[stage], repeat)
+        print(f'  {stage:<30} {results[stage]["per_second"]:>14,.0f} /s {results[stage]["per_item_us"]:>12.1f} us',
+              file=sys.stderr)
+    return results
+
+
+def import_time(repeat: int = 3) -> float:
+    """
+    Return the fastest time in milliseconds, out of repeat fresh interpreters, to import the src package, as
+    reported by python -X importtime.
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import src'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        for line in completed.stderr.splitlines():
+            match = IMPORT_TIME.match(line.strip())
+            if match:
+                best = min(best, int(match.group(1)) / 1000)
+    return best
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compare two benchmark results.
+
+    :param threshold: The largest accepted loss of throughput, e.g. 0.1 for 10 %.
+    :return: A description of every stage that is slower than the baseline by more than the threshold.
+    """
+
+    regressions = []
+    for size, stages in current['sizes'].items():
+        for stage, timing in stages.items():
+            before = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if not before or not before['per_second']:
+                continue
+            ratio = timing['per_second'] / before['per_second']
+            if ratio < 1 - threshold:
+                regressions.append(f'{stage} at {size} addresses: {timing["per_second"]:,.0f}/s, was '
+                                   f'{before["per_second"]:,.0f}/s ({ratio - 1:+.1%})')
+
+    before = baseline.get('import_ms')
+    if before and current.get('import_ms') and current['import_ms'] > before * (1 + threshold):
+        regressions.append(f'import of src: {current["import_ms"]:.0f} ms, was {before:.0f} ms')
+    return regressions
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    import numpy
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks for the address parser.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench = commands.add_parser('run', help='Time each stage of the parser on synthetic corpora.')
+    bench.add_argument('--sizes', default='1000,10000', help='Comma separated corpus sizes. Default: 1000,10000.')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--swedish-share', type=float, default=0.8)
+    bench.add_argument('--repeat', type=int, default=3, help='Runs per stage, the fastest is reported.')
+    bench.add_argument('--stages', default=','.join(STAGES), help='Comma separated stages. Default: all.')
+    bench.add_argument('--batch-size', type=int, default=1000)
+    bench.add_argument('--output', '-o', help='Write the results to this JSON file.')
+    bench.add_argument('--baseline', help='JSON results of an earlier run to compare with.')
+    bench.add_argument('--threshold', type=float, default=0.1,
+                       help='Accepted loss of throughput compared to the baseline. Default: 0.1.')
+    bench.add_argument('--import-budget-ms', type=float,
+                       help='Fail if importing src takes longer than this many milliseconds.')
+
+    corpus = commands.add_parser('corpus', help='Write a synthetic corpus, one address per line.')
+    corpus.add_argument('--size', type=int, default=10000)
+    corpus.add_argument('--seed', type=int, default=0)
+    corpus.add_argument('--swedish-share', type=float, default=0.8)
+    corpus.add_argument('--duplicate-share', type=float, default=0.0)
+    corpus.add_argument('--output', '-o', help='Output file. Default: stdout.')
+
+    load = commands.add_parser('load', help='Load test a running service, see python -m src serve.')
+    load.add_argument('--host', default='127.0.0.1')
+    load.add_argument('--port', type=int, default=8080)
+    load.add_argument('--size', type=int, default=10000, help='Addresses to send. Default: 10000.')
+    load.add_argument('--seed', type=int, default=0)
+    load.add_argument('--swedish-share', type=float, default=0.8)
+    load.add_argument('--concurrency', type=int, default=64, help='Concurrent connections. Default: 64.')
+    load.add_argument('--batch', type=int, default=0,
+                      help='Addresses per request to /parse/batch, 0 sends single addresses to /parse.')
+    load.add_argument('--country', help='Country code of all requests.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+
+    if arguments.command == 'corpus':
+        addresses = iter_corpus(arguments.size, arguments.seed, arguments.swedish_share, arguments.duplicate_share)
+        lines = (a.replace('\n', ' ') + '\n' for a in addresses)
+        if arguments.output:
+            with open(arguments.output, 'w', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
+        return 0
+
+    if arguments.command == 'load':
+        corpus = generate_corpus(arguments.size, arguments.seed, arguments.swedish_share)
+        result = load_test(corpus, arguments.host, arguments.port, arguments.concurrency, arguments.batch,
+                           arguments.country)
+        print(json.dumps(result, indent=2))
+        return 0 if set(result['statuses']) <= {'200', '429'} else 1
+
+    stages = [s for s in arguments.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f'Unknown stages: {", ".join(sorted(unknown))}', file=sys.stderr)
+        return 2
+
+    results = {'meta': metadata(), 'import_ms': import_time(), 'sizes': {}}
+    print(f'Import of src: {results["import_ms"]:.0f} ms', file=sys.stderr)
+    for size in (int(s) for s in arguments.sizes.split(',')):
+        print(f'{size} addresses:', file=sys.stderr)
+        corpus = generate_corpus(size, arguments.seed, arguments.swedish_share)
+        results['sizes'][str(size)] = run_benchmarks(corpus, arguments.repeat, stages, arguments.batch_size)
+
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+    failures = []
+    if arguments.import_budget_ms is not None and results['import_ms'] > arguments.import_budget_ms:
+        failures.append(f'import of src: {results["import_ms"]:.0f} ms, budget {arguments.import_budget_ms:.0f} ms')
+    if arguments.baseline:
+        baseline = json.loads(Path(arguments.baseline).read_text(encoding='utf-8'))
+        failures.extend(compare(results, baseline, arguments.threshold))
+
+    for failure in failures:
+        print(f'REGRESSION {failure}', file=sys.stderr)
+    return 1 if failures else 0
@@ -1,5 +1,8 @@
+import os
+import threading
+from functools import lru_cache
 from json import load as json_load
-from logging import Logger, getLogger, addLevelName, config as logging_config
+from logging import Logger, getLogger, addLevelName
 from configparser import ConfigParser
 from pathlib import Path
 
@@ -15,45 +18,128 @@ new_levels = {
 }
 
 
-for name, level in new_levels.items():
-    addLevelName(level, name.upper())
-
+def level_method(level: int):
+    """
+    Create a Logger method for a custom level. Like Logger.debug it checks the level before anything else, so pass
+    the arguments of the message separately to skip formatting them when the level is disabled.
+    """
 
     def function(self, message, *args, **kwargs):
         if self.isEnabledFor(level):
+            kwargs.setdefault('stacklevel', 2)
             self._log(level, message, args, **kwargs)
 
+    return function
+
+
+for name, level in new_levels.items():
+    addLevelName(level, name.upper())
     setattr(__import__('logging'), name.upper(), level)
-    setattr(Logger, name.lower(), function)
+    setattr(Logger, name.lower(), level_method(level))
 
 config_folder = Path(f'{ROOT}/config').absolute()
-config_folder.mkdir(exist_ok=True)
 country_folder = Path(f'{config_folder}/countries').absolute()
-country_folder.mkdir(exist_ok=True)
-
 log_config_file = Path(f'{config_folder}/logging/log.json').absolute()
 
-with open(f'{log_config_file}', 'r') as log_config:
-    print(log_config_file)
-    logging_config.dictConfig(json_load(log_config))
-
-logger = getLogger()
-logger.setLevel('DEBUG')
-logger.debug(f'Logging set up with additional levels, VERBOSE(15), DEBUGX(5), TRACE(1).')
-
-logger.debug(f'Running main config file.')
-
 environment_file = Path(f'{ROOT}/.env').absolute()
 main_config_file = Path(f'{config_folder}/config.ini').absolute()
 heuristics_config_file = Path(f'{config_folder}/heuristics.ini').absolute()
+rules_config_file = Path(f'{config_folder}/rules.json').absolute()
+# Compiled rules are only kept between processes when BUACHE_RULES_CACHE names a folder for them.
+rules_cache_folder = Path(os.environ['BUACHE_RULES_CACHE']).absolute() if os.environ.get('BUACHE_RULES_CACHE') else None
+
+"""
+Importing this module only defines the paths and the logging levels. Logging is set up by setup_logging, which run()
+calls, and the main configuration is read the first time CONFIG is used.
+"""
+
+_logging_lock = threading.Lock()
+_logging_configured = False
+_listener = None
+
+
+def setup_logging(use_queue: bool = False) -> None:
+    """
+    Configure logging from log.json. Only the first call has any effect.
+
+    :param use_queue: Move the handlers from log.json behind a QueueHandler. The records are then written to the
+    console and the rotating log files by a QueueListener thread, so no file I/O happens on the thread that logs.
+    """
+
+    global _logging_configured, _listener
+    with _logging_lock:
+        if _logging_configured:
+            return
+
+        from logging import config as logging_config
+
+        config_folder.mkdir(exist_ok=True)
+        country_folder.mkdir(exist_ok=True)
+
+        with open(f'{log_config_file}', 'r') as log_config:
+            log_settings = json_load(log_config)
+
+        # The log files are relative to the working directory, which may not have a logs folder yet.
+        for handler in log_settings.get('handlers', {}).values():
+            if 'filename' in handler:
+                Path(handler['filename']).parent.mkdir(parents=True, exist_ok=True)
+
+        logging_config.dictConfig(log_settings)
+
+        if use_queue:
+            _listener = queue_handlers(getLogger())
+        _logging_configured = True
+
+    logger = getLogger()
+    logger.setLevel('DEBUG')
+    logger.debug(f'Logging set up with additional levels, VERBOSE(15), DEBUGX(5), TRACE(1).')
+    logger.debug(f'Logging configured from {log_config_file}.')
+
+
+def queue_handlers(logger: Logger):
+    """
+    Replace the handlers of a logger with a QueueHandler and start a QueueListener that passes the records on to
+    the original handlers. The listener is stopped, and the queue flushed, when the interpreter exits.
+    """
+
+    import atexit
+    from logging.handlers import QueueHandler, QueueListener
+    from queue import SimpleQueue
+
+    records = SimpleQueue()
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(records))
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+@lru_cache(maxsize=None)
+def load_config() -> ConfigParser:
+    """
+    Read the main configuration, the heuristics and the environment file once.
+    """
+
+    getLogger().debug(f'Running main config file.')
+    try:
+        parser = ConfigParser()
+        parser.read(main_config_file)
+        parser.read(heuristics_config_file)
+        parser.read(environment_file)
+
+    except FileNotFoundError as e:
+        msg = f'Could not read {main_config_file}'
+        getLogger().error(msg)
+        raise ConfigurationError(msg) from e
+
+    return parser
 
-try:
-    CONFIG = ConfigParser()
-    CONFIG.read(main_config_file)
-    CONFIG.read(heuristics_config_file)
-    CONFIG.read(environment_file)
 
-except FileNotFoundError as e:
-    msg = f'Could not read {main_config_file}'
-    logger.error(msg)
-    raise ConfigurationError(msg)
+def __getattr__(name: str):
+    if name == 'CONFIG':
+        return load_config()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
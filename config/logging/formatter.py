@@ -11,22 +11,26 @@ class BuacheFormatter(logging.Formatter):
     level7 = "\x1b[38;5;166m"
     level8 = "\x1b[38;5;160m"
     reset = "\x1b[0m"
-    format = f"[%(asctime)s] [%(name)28s] [%(funcName)28s] [%(levelname)7s] [%(lineno)4d] \n" \
-             "========================================================================================================"\
-             "\n%(message)s\n "
+    format_string = f"[%(asctime)s] [%(name)28s] [%(funcName)28s] [%(levelname)7s] [%(lineno)4d] \n" \
+                    "========================================================================================================"\
+                    "\n%(message)s\n "
 
     FORMATS = {
-        logging.TRACE: level1 + format + reset,
-        logging.DEBUGX: level2 + format + reset,
-        logging.DEBUG: level3 + format + reset,
-        logging.VERBOSE: level4 + format + reset,
-        logging.INFO: level5 + format + reset,
-        logging.WARNING: level6 + format + reset,
-        logging.ERROR: level7 + format + reset,
-        logging.CRITICAL: level8 + format + reset
+        logging.TRACE: level1 + format_string + reset,
+        logging.DEBUGX: level2 + format_string + reset,
+        logging.DEBUG: level3 + format_string + reset,
+        logging.VERBOSE: level4 + format_string + reset,
+        logging.INFO: level5 + format_string + reset,
+        logging.WARNING: level6 + format_string + reset,
+        logging.ERROR: level7 + format_string + reset,
+        logging.CRITICAL: level8 + format_string + reset
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # One formatter per level, built once instead of for every record.
+        self.formatters = {level: logging.Formatter(fmt) for level, fmt in self.FORMATS.items()}
+        self.fallback = logging.Formatter(self.format_string)
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self.formatters.get(record.levelno, self.fallback).format(record)
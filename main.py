@@ -26,7 +26,6 @@ addresses = [
 app = run(mode='DEVELOPMENT')
 for string in addresses:
     address = app.check_address(string)
-    address.components.sort(reverse=True)
     pprint([
         {
             'value': c.component_value,
@@ -34,6 +33,7 @@ for string in addresses:
             'position': c.position,
             'confidence': c.confidence
         }
-        for c in address.components])
+        for c in address.resolve_conflicts()])
+    pprint(address.possible_addresses(3))
 
 unittest.main()
@@ -11,6 +11,7 @@ setup(
     install_requires=[
         'requests',
         'langdetect',
+        'numpy',
         'spacy'
     ],
     classifiers=[
@@ -1,5 +1,6 @@
 import logging
 
+import config
 from src.app import Application
 
 """
@@ -11,8 +12,15 @@ __all__ = [
     'run'
 ]
 logger = logging.getLogger(__name__)
-logger.debug(f'Configuration is loaded.')
 
 
 def run(**kwargs) -> Application:
+    """
+    Set up logging and create the application. Nothing is configured when the package is only imported.
+
+    In PRODUCTION mode log records are written by a background thread, so the parsing threads never wait for the
+    log files.
+    """
+    config.setup_logging(use_queue=kwargs.get('mode') == 'PRODUCTION')
+    logger.debug(f'Configuration is loaded.')
     return Application(**kwargs)
@@ -1,85 +1,151 @@
-import configparser
 import logging
-import os
-from pathlib import Path
-from typing import TYPE_CHECKING
-
-import langdetect
-
-import config
-from config import CONFIG
-from .component import AddressComponentType
+from collections import defaultdict
+from typing import TYPE_CHECKING, List, Sequence
+
+from .cache import ResultCache
+from src.instrumentation import instruments
+from .component import AddressComponent
+from .country import CountryConfig, load_country_config
+from .database import AddressDatabase, AddressMatcher
+from .dedup import Deduplicator
+from .detection import CountryDetector, detect_country
 from .parser import AddressParser
 from .ml_parser import MLAddressParser
+from .pack import CountryPack
+from .pool import ParserPool
+from .phonetic import PhoneticEncoder, PhoneticIndex
+from .spelling import SpellingCorrector
 
 __all__ = [
     'AddressParser',
     'MLAddressParser',
-    'Address'
+    'ParserPool',
+    'ResultCache',
+    'Address',
+    'AddressDatabase',
+    'AddressMatcher',
+    'Deduplicator',
+    'PhoneticEncoder',
+    'PhoneticIndex',
+    'SpellingCorrector',
+    'CountryConfig',
+    'CountryDetector',
+    'CountryPack',
+    'detect_language',
+    'load_country_config'
 ]
 
 if TYPE_CHECKING:
     from .. import Application
 
+log = logging.getLogger(__name__)
+
+
+def detect_language(input_address: str, country_hint: str = None) -> str:
+    """
+    Detect the country code of the input address. Cheap signals like postal codes and country names are tried
+    before language detection, see CountryDetector. A country_hint is returned without any detection.
+    """
+    if not instruments.enabled:
+        return detect_country(input_address, country_hint)
+    with instruments.stage('detect_language'):
+        return detect_country(input_address, country_hint)
+
 
 class Address:
+    __slots__ = ('log', 'app', 'country_code', 'country_config', 'parser', 'components')
+
     def __init__(self,
                  app: 'Application',
                  address_string: str = None,
-                 use_ml: bool = False
+                 use_ml: bool = False,
+                 country_code: str = None,
+                 parser: AddressParser = None,
+                 components: List[AddressComponent] = None
                  ):
-        self.log = logging.getLogger(__name__)
+        self.log = log
         self.app = app
 
-        self.country_code = self.detect_language(address_string)
-        self.log.debug(f'Country code "{self.country_code}" was detected from the input_address.')
-
-        self.load_country_config()
-
-        if use_ml:
-            self.log.info(f'Using machine learning when parsing address.')
-            self.parser = MLAddressParser()
+        if country_code is None:
+            self.country_code = self.detect_language(address_string)
+            self.log.debug('Country code "%s" was detected from the input_address.', self.country_code)
         else:
-            self.log.info(f'Using heuristics when parsing address.')
-            self.parser = AddressParser()
+            self.country_code = country_code
 
-        if address_string is not None:
-            self.log.debug(f'Starting {__name__} with address_string = {address_string.__str__()}')
+        if parser is None:
+            self.country_config = self.load_country_config()
+            parser = self.create_parser(use_ml)
+        else:
+            self.country_config = parser.country_config
+        self.parser = parser
+
+        if components is not None:
+            # The address has already been parsed, e.g. as part of a batch.
+            self.components = components
+        elif address_string is not None:
+            self.log.debug('Starting %s with address_string = %s', __name__, address_string)
             self.components = self.parser.parse_address(address_string)
 
     @property
     def full_address(self) -> str:
-        try:
-            fmt = CONFIG.get('Address', 'FORMAT')
-            components = {c.component_type.name.lower(): c.component_value for c in self.components}
+        with instruments.stage('full_address'):
+            return self.format_address()
+
+    def format_address(self, components: Sequence[AddressComponent] = None) -> str:
+        """
+        Format components with the format of the country, by default the components of the address.
+        """
+        if components is None:
+            components = self.components
+
+        fmt = self.country_config.format
+        if fmt is not None:
+            # Components that were not found are left empty.
+            values = defaultdict(str, {c.component_type.name.lower(): c.component_value for c in components})
             self.log.debugx(fmt)
-            self.log.debugx(components)
-            fa = str(fmt).format(**components)
-        except configparser.NoSectionError as e:
+            self.log.debugx(values)
+            fa = ' '.join(str(fmt).format_map(values).split())
+        else:
             self.log.warning(f'Returning all components as no format is specified for this country. ')
-            fa = " ".join([c.component_value for c in self.components])
+            fa = " ".join([c.component_value for c in components])
 
         return fa
 
-    def detect_language(self, input_address: str) -> str:
+    def resolve_conflicts(self) -> List[AddressComponent]:
         """
-        Detect the language of the input address using language detection techniques.
+        Return the best consistent components of the address, see AddressParser.resolve_conflicts.
         """
-        return langdetect.detect(input_address)
-
-    def load_country_config(self):
-        CONFIG.read(Path(f"{config.country_folder}/default.ini").absolute())
-        country_config_folder = Path(f"{config.country_folder}/{self.country_code}")
-        if country_config_folder.exists():
-            for config_file in country_config_folder.iterdir():
-                CONFIG.read(config_file)
-        else:
-            self.log.warning(f'Failed to load config for {self.country_code}\n'
-                             f'{country_config_folder}')
+        return self.parser.resolve_conflicts(self.components)
 
-        self.log.debug(f'Configuration for "{self.country_code}" is loaded.')
+    def possible_addresses(self, k: int = 5) -> List[str]:
+        """
+        Return up to k most likely readings of the address, formatted with the format of the country. Labelings
+        that differ only in components the format leaves out read the same, so each reading is returned once, at the
+        rank of its best labeling.
+        """
+        labelings = self.parser.rank_possible_addresses(self.parser.generate_possible_addresses(self.components, k))
+        return list(dict.fromkeys(self.format_address(labeling.components) for labeling in labelings))
+
+    def detect_language(self, input_address: str, country_hint: str = None) -> str:
+        """
+        Detect the country code of the input address, see detect_language.
+        """
+        return detect_language(input_address, country_hint)
+
+    def load_country_config(self) -> CountryConfig:
+        return load_country_config(self.country_code)
+
+    def create_parser(self, use_ml: bool = False):
+        """
+        Create a parser for the configuration of the address' country. The parsers of the application are shared,
+        so the spaCy model and the compiled country configuration are only set up once.
+        """
+        if self.app is not None:
+            return self.app.get_parser(self.country_code, use_ml)
+
+        if use_ml:
+            self.log.debug('Using machine learning when parsing address.')
+            return MLAddressParser(self.country_config)
 
-        self.log.debugx(f'Update AddressComponentType order based on configuration.')
-        for ac_type, position in CONFIG.items('AddressComponentType'):
-            self.log.trace(f'{ac_type}: {position}')
-            AddressComponentType[ac_type.upper()].__init__(position)
+        self.log.debug('Using heuristics when parsing address.')
+        return AddressParser(self.country_config)
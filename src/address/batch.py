@@ -0,0 +1,261 @@
+import logging
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import COMPONENT_DTYPE, AddressComponent, ComponentBatch
+from .features import FEATURES, FEATURE_NAMES, TokenFeatures
+
+if TYPE_CHECKING:
+    from .parser import AddressParser
+
+__all__ = [
+    'BatchParser',
+    'TokenBatch'
+]
+
+
+class TokenBatch:
+    """
+    Flat, ragged table with the tokens of many addresses.
+
+    The tokens of address i are the rows address_offsets[i] to address_offsets[i + 1]. Within an address the rows are
+    ordered like a TokenTable, by n-gram size and then by word index. The start and end offsets of a token are
+    relative to its own normalized address.
+
+    Attributes:
+
+        sources: the normalized addresses.
+        address_offsets: the first token row of each address, followed by the number of rows.
+        addresses: the index of the address each token belongs to.
+        starts: start offsets of the tokens.
+        ends: end offsets of the tokens.
+        indexes: word indexes of the tokens.
+        sizes: number of words in the tokens.
+        features: the TokenFeatures of all tokens.
+    """
+
+    __slots__ = ('sources', 'address_offsets', 'addresses', 'starts', 'ends', 'indexes', 'sizes', 'features')
+
+    def __init__(self, sources, address_offsets, addresses, starts, ends, indexes, sizes, features):
+        self.sources = sources
+        self.address_offsets = address_offsets
+        self.addresses = addresses
+        self.starts = starts
+        self.ends = ends
+        self.indexes = indexes
+        self.sizes = sizes
+        self.features = features
+
+    def text(self, row: int) -> str:
+        return self.sources[self.addresses[row]][self.starts[row]:self.ends[row]]
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+
+class BatchParser:
+    """
+    Parses many addresses at once with array operations.
+
+    The normalized addresses of a batch are joined into one buffer of code points. Words, n-grams and token features
+    are found for the whole buffer with array operations, and all tokens of all addresses are scored by the
+    vectorized evaluator in a single call. The results are then split back into one list of AddressComponent objects
+    per address, identical to what AddressParser.parse_address returns for each of them.
+
+    Attributes:
+
+        parser: the AddressParser providing normalizer, n-gram sizes, evaluator and threshold.
+    """
+
+    # Joins the addresses of a batch. It is whitespace, so no word crosses the border between two addresses.
+    SEPARATOR = '\n'
+
+    def __init__(self, parser: 'AddressParser'):
+        self.log = logging.getLogger(__name__)
+        self.parser = parser
+
+    def parse_many(self, input_addresses: Iterable[str], batch_size: int = 10000) -> Iterator[List[AddressComponent]]:
+        """
+        Parses addresses in batches of batch_size, yielding the components of each address in input order.
+        """
+
+        iterator = iter(input_addresses)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield from self.parse_batch(batch)
+
+    def parse_batch(self, input_addresses: Sequence[str]) -> List[List[AddressComponent]]:
+        """
+        Parses a batch of addresses.
+
+        :param input_addresses: The addresses to parse.
+        :return: A list with the AddressComponent objects of each address.
+        """
+
+        return self.parse_records(input_addresses).to_lists()
+
+    def parse_records(self, input_addresses: Sequence[str]) -> ComponentBatch:
+        """
+        Parses a batch of addresses into a ComponentBatch. No AddressComponent objects are created until an address
+        of the result is accessed.
+
+        :param input_addresses: The addresses to parse.
+        :return: The components of all addresses.
+        """
+
+        with instruments.stage('tokenize_batch'):
+            tokens = self.tokenize(input_addresses)
+        if instruments.enabled:
+            instruments.observe_many('tokens_per_address', np.diff(tokens.address_offsets))
+
+        with instruments.stage('evaluate_batch'):
+            results, confidences = self.parser.evaluator.evaluate(tokens.features)
+
+        with instruments.stage('create_components_batch'):
+            accepted = results & (confidences > self.parser.threshold)
+
+            rows, columns = accepted.nonzero()
+            order = np.lexsort((rows, columns, tokens.addresses[rows]))
+            rows, columns = rows[order], columns[order]
+
+            type_values = np.array([t.value for t in self.parser.evaluator.component_types], dtype=np.uint8)
+            records = np.empty(len(rows), dtype=COMPONENT_DTYPE)
+            records['address'] = tokens.addresses[rows]
+            records['type'] = type_values[columns] if len(type_values) else 0
+            records['start'] = tokens.starts[rows]
+            records['end'] = tokens.ends[rows]
+            records['position'] = tokens.indexes[rows]
+            records['confidence'] = confidences[rows, columns]
+            batch = ComponentBatch(tokens.sources, records)
+
+        self.log.debug('Parsed a batch of %d addresses with %d tokens.', len(input_addresses), len(tokens))
+        return batch
+
+    def tokenize(self, input_addresses: Sequence[str]) -> TokenBatch:
+        """
+        Normalizes and tokenizes a batch of addresses and computes the features of all tokens.
+        """
+
+        sources = [self.parser.normalizer.normalize(a) for a in input_addresses]
+        lengths = np.fromiter(map(len, sources), dtype=np.int64, count=len(sources))
+        bases = np.zeros(len(sources) + 1, dtype=np.int64)
+        np.cumsum(lengths + len(self.SEPARATOR), out=bases[1:])
+
+        buffer = self.SEPARATOR.join(sources)
+        codes = np.frombuffer(buffer.encode('utf-32-le'), dtype=np.uint32)
+        classes = CharacterClasses(codes)
+
+        # Words are the runs of non whitespace characters.
+        word = ~classes.space
+        previous = np.concatenate(([False], word[:-1]))
+        following = np.concatenate((word[1:], [False]))
+        word_starts = np.flatnonzero(word & ~previous)
+        word_ends = np.flatnonzero(word & ~following) + 1
+
+        word_addresses = np.searchsorted(bases, word_starts, side='right') - 1
+        first_words = np.searchsorted(word_starts, bases[:-1])
+        word_indexes = np.arange(len(word_starts)) - first_words[word_addresses]
+
+        starts, ends, indexes, sizes, addresses = [], [], [], [], []
+        for size in self.parser.tokenizer.sizes:
+            last = np.arange(size - 1, len(word_starts))
+            first = last - (size - 1)
+            valid = word_addresses[first] == word_addresses[last]
+            first, last = first[valid], last[valid]
+            starts.append(word_starts[first])
+            ends.append(word_ends[last])
+            indexes.append(word_indexes[first])
+            sizes.append(np.full(len(first), size, dtype=np.int64))
+            addresses.append(word_addresses[first])
+
+        starts, ends, indexes, sizes, addresses = (
+            np.concatenate(c) if c else np.empty(0, dtype=np.int64)
+            for c in (starts, ends, indexes, sizes, addresses)
+        )
+        order = np.lexsort((indexes, sizes, addresses))
+        starts, ends, indexes, sizes, addresses = (c[order] for c in (starts, ends, indexes, sizes, addresses))
+
+        features = TokenFeatures(self.features(buffer, classes, starts, ends, indexes))
+        address_offsets = np.searchsorted(addresses, np.arange(len(sources) + 1))
+        local_starts = starts - bases[addresses]
+        local_ends = ends - bases[addresses]
+
+        return TokenBatch(sources, address_offsets, addresses, local_starts, local_ends, indexes, sizes, features)
+
+    def features(self, buffer: str, classes: 'CharacterClasses', starts: np.ndarray, ends: np.ndarray,
+                 indexes: np.ndarray) -> np.ndarray:
+        """
+        Computes the feature matrix for tokens given as spans of the buffer. Features without a vectorized version
+        are computed from the text of each token with the function in FEATURES.
+        """
+
+        lengths = ends - starts
+        last = ends - 1
+
+        def count(indicator: np.ndarray) -> np.ndarray:
+            cumulative = np.zeros(len(indicator) + 1, dtype=np.int64)
+            np.cumsum(indicator, out=cumulative[1:])
+            return cumulative[ends] - cumulative[starts]
+
+        digits = count(classes.digit)
+        alphas = count(classes.alpha)
+        decimal = count(classes.decimal) == lengths
+
+        def nth_is(n: int, characters: str) -> np.ndarray:
+            index = np.minimum(starts + n, len(classes.codes) - 1)
+            return np.isin(classes.codes[index], [ord(c) for c in characters]) & (lengths > n)
+
+        numbers = np.zeros(len(starts), dtype=np.float64)
+        for row in np.flatnonzero(decimal).tolist():
+            numbers[row] = float(buffer[starts[row]:ends[row]])
+
+        columns = {
+            'position': indexes,
+            'length': lengths,
+            'is_digit': digits == lengths,
+            'is_alpha': alphas == lengths,
+            'first_is_upper': classes.upper[starts],
+            'first_is_alpha': classes.alpha[starts],
+            'last_is_alpha': classes.alpha[last],
+            'starts_with_lgh': nth_is(0, 'lL') & nth_is(1, 'gG') & nth_is(2, 'hH'),
+            'number': numbers,
+            'slash_count': 2 * count(classes.codes == ord('/')) - lengths,
+            'hyphen_count': 2 * count(classes.codes == ord('-')) - lengths,
+            'alpha_count': 2 * alphas - lengths,
+        }
+
+        matrix = np.empty((len(starts), len(FEATURE_NAMES)), dtype=np.float64)
+        for column, name in enumerate(FEATURE_NAMES):
+            if name in columns:
+                matrix[:, column] = columns[name]
+            else:
+                texts = (buffer[s:e] for s, e in zip(starts.tolist(), ends.tolist()))
+                matrix[:, column] = np.fromiter(map(FEATURES[name], texts), dtype=np.float64, count=len(starts))
+        return matrix
+
+
+class CharacterClasses:
+    """
+    Character class flags for every code point of a buffer. The classes are computed once per distinct character.
+    """
+
+    __slots__ = ('codes', 'space', 'digit', 'decimal', 'alpha', 'upper')
+
+    def __init__(self, codes: np.ndarray):
+        self.codes = codes
+        distinct, inverse = np.unique(codes, return_inverse=True)
+        characters = [chr(c) for c in distinct.tolist()]
+
+        def flags(method) -> np.ndarray:
+            return np.fromiter(map(method, characters), dtype=bool, count=len(characters))[inverse]
+
+        self.space = flags(str.isspace)
+        self.digit = flags(str.isdigit)
+        self.decimal = flags(str.isdecimal)
+        self.alpha = flags(str.isalpha)
+        self.upper = flags(str.isupper)
@@ -0,0 +1,308 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from src.instrumentation import instruments
+from .component import AddressComponent, CompactComponent, compact, expand
+from .country import CountryConfig
+
+__all__ = [
+    'ResultCache'
+]
+
+WHITESPACE = re.compile(r'\s+')
+
+# Part of every key. Change it when the parser produces different results for the same configuration, so the
+# results of older versions in a persistent cache are not used.
+CACHE_VERSION = 3
+
+# The largest number of keys looked up in the persistent cache with one query.
+SQL_CHUNK_SIZE = 500
+
+
+class ResultCache:
+    """
+    Cache of parse results in front of AddressParser.
+
+    Addresses are canonicalized before they are used as keys: surrounding whitespace is removed, inner whitespace is
+    collapsed to single spaces and, with fold_case, the case is folded. Addresses that only differ in that way share
+    the result of the first of them that was parsed. The key also holds the country code, the fingerprint of the
+    country configuration and the options of the parser, see AddressParser.options, so results are not used any more
+    as soon as the heuristics or the country files change, and parsers with different options do not share results.
+
+    Results are kept in an in-memory LRU with a maximum size and an optional time to live. With a path, they are also
+    stored in an SQLite database that is shared between processes and runs. The persistent tier is only asked when
+    the in-memory tier misses. Expired results are removed from it when a process first opens it. Results of other
+    configurations are kept, because other processes may still use them, until purge is called.
+
+    Attributes:
+
+        maxsize: the number of results kept in memory.
+        ttl: seconds a result is valid, or None to keep results until they are evicted.
+        path: the SQLite database of the persistent tier, or None without a persistent tier.
+        fold_case: whether addresses that only differ in case share their result.
+        hits: lookups answered from memory.
+        persistent_hits: lookups answered from the persistent tier.
+        misses: lookups that had to be parsed.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 100000,
+            ttl: float = None,
+            path: Union[str, Path] = None,
+            fold_case: bool = True
+    ):
+        self.log = logging.getLogger(__name__)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = None if path is None else str(path)
+        self.fold_case = fold_case
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        self._entries: 'OrderedDict[str, Tuple[float, Tuple[CompactComponent, ...]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict:
+        # Worker processes get the settings but start with an empty memory tier and their own connection.
+        return {
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'path': self.path,
+            'fold_case': self.fold_case
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def canonical(self, input_address: str) -> str:
+        address = WHITESPACE.sub(' ', input_address).strip()
+        return address.casefold() if self.fold_case else address
+
+    def key(self, input_address: str, country_config: CountryConfig, options: str = '') -> str:
+        return '\x1f'.join((
+            str(CACHE_VERSION),
+            country_config.country_code,
+            country_config.fingerprint,
+            options,
+            self.canonical(input_address)
+        ))
+
+    def get(
+            self,
+            input_address: str,
+            country_config: CountryConfig,
+            options: str = ''
+    ) -> Optional[List[AddressComponent]]:
+        """
+        Return the cached components of an address, or None if the address has to be parsed.
+        """
+
+        return self.get_many([input_address], country_config, options)[0]
+
+    def get_many(
+            self,
+            input_addresses: Sequence[str],
+            country_config: CountryConfig,
+            options: str = ''
+    ) -> List[Optional[List[AddressComponent]]]:
+        """
+        Return the cached components of several addresses, with None for each address that has to be parsed.
+        Every call returns new AddressComponent objects, so callers can change them freely.
+
+        :param input_addresses: The addresses to look up.
+        :param country_config: The configuration the addresses are parsed with.
+        :param options: The options of the parser that change its results, see AddressParser.options.
+        :return: The components of each address, or None.
+        """
+
+        keys = [self.key(a, country_config, options) for a in input_addresses]
+        found: Dict[str, Tuple[CompactComponent, ...]] = {}
+        now = time.time()
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if self.ttl is not None and now - entry[0] > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        persistent = self.read(missing, now) if missing and self.path else {}
+        if persistent:
+            with self._lock:
+                for key, (created, value) in persistent.items():
+                    self.store(key, created, value)
+
+        results = []
+        hits = persistent_hits = 0
+        for key in keys:
+            if key in found:
+                hits += 1
+                results.append(expand(found[key]))
+            elif key in persistent:
+                persistent_hits += 1
+                results.append(expand(persistent[key][1]))
+            else:
+                results.append(None)
+
+        misses = len(keys) - hits - persistent_hits
+        with self._lock:
+            self.hits += hits
+            self.persistent_hits += persistent_hits
+            self.misses += misses
+
+        if instruments.enabled:
+            for result, count in (('hit', hits), ('persistent_hit', persistent_hits), ('miss', misses)):
+                if count:
+                    instruments.increment('cache_lookups_total', count, (('cache', 'result'), ('result', result)))
+        return results
+
+    def put(
+            self,
+            input_address: str,
+            country_config: CountryConfig,
+            components: List[AddressComponent],
+            options: str = ''
+    ) -> None:
+        self.put_many([input_address], country_config, [components], options)
+
+    def put_many(
+            self,
+            input_addresses: Sequence[str],
+            country_config: CountryConfig,
+            components: Sequence[List[AddressComponent]],
+            options: str = ''
+    ) -> None:
+        """
+        Store the components of several addresses in both tiers, see get_many.
+        """
+
+        now = time.time()
+        rows = {self.key(a, country_config, options): compact(c) for a, c in zip(input_addresses, components)}
+        with self._lock:
+            for key, value in rows.items():
+                self.store(key, now, value)
+
+        if self.path:
+            self.write(rows, country_config, now)
+
+    def store(self, key: str, created: float, value: Tuple[CompactComponent, ...]) -> None:
+        # The caller holds the lock.
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            'size': len(self._entries)
+        }
+
+    def clear(self) -> None:
+        """
+        Remove every result from both tiers.
+        """
+
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            with self.connection() as connection:
+                connection.execute('DELETE FROM results')
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Return the SQLite connection of the current thread, creating the database if it does not exist.
+        """
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, country_code TEXT, fingerprint TEXT, created REAL, components TEXT)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS results_country ON results (country_code, fingerprint)')
+            connection.commit()
+            self._local.connection = connection
+            self.expire(connection)
+        return connection
+
+    def read(self, keys: Sequence[str], now: float) -> Dict[str, Tuple[float, Tuple]]:
+        connection = self.connection()
+        rows = {}
+        for start in range(0, len(keys), SQL_CHUNK_SIZE):
+            chunk = keys[start:start + SQL_CHUNK_SIZE]
+            query = f'SELECT key, created, components FROM results WHERE key IN ({",".join("?" * len(chunk))})'
+            for key, created, components in connection.execute(query, chunk):
+                if self.ttl is None or now - created <= self.ttl:
+                    rows[key] = (created, tuple(tuple(c) for c in json.loads(components)))
+        return rows
+
+    def write(self, rows: Dict[str, Tuple], country_config: CountryConfig, now: float) -> None:
+        with self.connection() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO results (key, country_code, fingerprint, created, components) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (key, country_config.country_code, country_config.fingerprint, now,
+                     json.dumps(value, ensure_ascii=False))
+                    for key, value in rows.items()
+                ]
+            )
+
+    def expire(self, connection: sqlite3.Connection) -> None:
+        """
+        Delete the persistent results that are older than the time to live.
+        """
+
+        if self.ttl is None:
+            return
+
+        with connection:
+            deleted = connection.execute('DELETE FROM results WHERE created < ?', (time.time() - self.ttl,)).rowcount
+        if deleted:
+            self.log.info(f'Removed {deleted} expired cached results.')
+
+    def purge(self, country_config: CountryConfig) -> int:
+        """
+        Delete the persistent results of all other configurations of a country, and those of older versions of the
+        cache. Processes that still use one of them have to parse their addresses again, so this is only done on
+        request, after every process was updated.
+
+        :param country_config: The configuration whose results are kept.
+        :return: The number of deleted results.
+        """
+
+        if not self.path:
+            return 0
+
+        code, fingerprint = country_config.country_code, country_config.fingerprint
+        with self.connection() as connection:
+            deleted = connection.execute(
+                'DELETE FROM results WHERE country_code = ? AND (fingerprint != ? OR key NOT LIKE ?)',
+                (code, fingerprint, f'{CACHE_VERSION}\x1f%')
+            ).rowcount
+        self.log.info(f'Removed {deleted} cached results of other configurations of "{code}".')
+        return deleted
@@ -1,4 +1,7 @@
 from enum import Enum, auto
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 
 class AddressComponentType(Enum):
@@ -19,43 +22,161 @@ class AddressComponentType(Enum):
 
 
 class AddressComponent:
-    def __init__(self, component_type: AddressComponentType, component_value: str, confidence: float, position: int):
+    """
+    One component found in an address.
+
+    Components are created for every accepted token and component type, so they are plain slotted objects without
+    a __dict__.
+
+    A component covers the words from position on. Their number is the number of words of the value, unless words
+    is set. It is set when the value was replaced, e.g. by a spelling correction, so the component still covers the
+    words of the token it was found in.
+    """
+
+    __slots__ = ('component_type', 'component_value', 'confidence', 'position', 'words')
+
+    def __init__(self, component_type: AddressComponentType, component_value: str, confidence: float, position: int,
+                 words: int = None):
         self.position = position
         self.component_type = component_type
         self.component_value = component_value
         self.confidence = confidence
+        self.words = words
 
     @property
-    def component_type(self) -> AddressComponentType:
-        return self._component_type
+    def span(self) -> int:
+        """
+        The number of words the component covers, at least one.
+        """
+        return max(1, self.words or len(self.component_value.split()))
 
-    @component_type.setter
-    def component_type(self, value: AddressComponentType) -> None:
-        self._component_type = value
+    def __repr__(self) -> str:
+        return (f'AddressComponent({self.component_type.name}, {self.component_value!r}, '
+                f'confidence={self.confidence}, position={self.position})')
 
-    @property
-    def confidence(self) -> float:
-        return self._confidence
+    def __lt__(self, other_component: 'AddressComponent') -> bool:
+        return self.confidence < other_component.confidence
 
-    @confidence.setter
-    def confidence(self, value: float) -> None:
-        self._confidence = value
 
-    @property
-    def position(self) -> int:
-        return self._position
+# (component type value, component value, position, confidence, words), used to send and store components cheaply.
+CompactComponent = Tuple[int, str, int, float, Optional[int]]
+
+
+def compact(components: Iterable[AddressComponent]) -> Tuple[CompactComponent, ...]:
+    return tuple((c.component_type.value, c.component_value, c.position, c.confidence, c.words) for c in components)
+
+
+def expand(compact_components: Iterable[CompactComponent]) -> List[AddressComponent]:
+    types = COMPONENT_TYPES
+    return [
+        AddressComponent(types[type_value], value, confidence, position, words)
+        for type_value, value, position, confidence, words in compact_components
+    ]
+
+
+# Component types by value, faster than calling AddressComponentType.
+COMPONENT_TYPES = {t.value: t for t in AddressComponentType}
+
+
+def as_dict(result: Tuple[str, str, Sequence[AddressComponent]]) -> dict:
+    """
+    Return an (address, country code, components) result as a JSON compatible dict.
+    """
+
+    string, country_code, components = result
+    return {
+        'address': string,
+        'country_code': country_code,
+        'components': [
+            {
+                'type': c.component_type.name,
+                'value': c.component_value,
+                'position': c.position,
+                'confidence': c.confidence
+            }
+            for c in components
+        ]
+    }
 
-    @position.setter
-    def position(self, value: int) -> None:
-        self._position = value
+
+# One row per component of a ComponentBatch. Values are spans of the source address, the text is not copied.
+COMPONENT_DTYPE = np.dtype([
+    ('address', np.int32),
+    ('type', np.uint8),
+    ('start', np.int32),
+    ('end', np.int32),
+    ('position', np.int32),
+    ('confidence', np.float64),
+])
+
+
+class ComponentBatch:
+    """
+    The components of a batch of addresses, as one structured NumPy array.
+
+    A row holds the index of the address, the component type value, the span of the value in the normalized address,
+    the position and the unrounded confidence. That is 25 bytes per component, instead of an AddressComponent object
+    and a copy of its value. The components of address i are the rows offsets[i] to offsets[i + 1].
+
+    AddressComponent objects are only created when an address is accessed, batch[i] returns the same list that
+    AddressParser.parse_address returns for the address. Code that only needs some fields can work on records
+    directly.
+
+    Attributes:
+
+        sources: the normalized addresses the spans refer to.
+        records: the components of all addresses, a COMPONENT_DTYPE array ordered by address.
+        offsets: the first row of each address, followed by the number of rows.
+    """
+
+    __slots__ = ('sources', 'records', 'offsets')
+
+    def __init__(self, sources: Sequence[str], records: np.ndarray, offsets: np.ndarray = None):
+        self.sources = sources
+        self.records = records
+        if offsets is None:
+            offsets = np.searchsorted(records['address'], np.arange(len(sources) + 1))
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def __getitem__(self, index: int) -> List[AddressComponent]:
+        return expand(self.compact(index))
+
+    def __iter__(self) -> Iterator[List[AddressComponent]]:
+        for index in range(len(self.sources)):
+            yield self[index]
 
     @property
-    def component_value(self) -> str:
-        return self._component_value
+    def nbytes(self) -> int:
+        return self.records.nbytes + self.offsets.nbytes
 
-    @component_value.setter
-    def component_value(self, value: str) -> None:
-        self._component_value = value
+    def records_of(self, index: int) -> np.ndarray:
+        """
+        Return the rows of one address, a view of records.
+        """
 
-    def __lt__(self, other_component: 'AddressComponent') -> bool:
-        return self.confidence < other_component.confidence
+        return self.records[self.offsets[index]:self.offsets[index + 1]]
+
+    def value(self, row: int) -> str:
+        record = self.records[row]
+        return self.sources[record['address']][record['start']:record['end']]
+
+    def compact(self, index: int) -> Tuple[CompactComponent, ...]:
+        """
+        Return the components of one address as CompactComponent tuples, without creating AddressComponent objects.
+        Confidences are rounded to two decimals, like in AddressParser.
+        """
+
+        source = self.sources[index]
+        rows = self.records_of(index)
+        return tuple(
+            (type_value, source[start:end], position, round(confidence, 2), None)
+            for type_value, start, end, position, confidence in zip(
+                rows['type'].tolist(), rows['start'].tolist(), rows['end'].tolist(), rows['position'].tolist(),
+                rows['confidence'].tolist())
+        )
+
+    def to_lists(self) -> List[List[AddressComponent]]:
+        return list(self)
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import threading
+import time
+from configparser import ConfigParser, Error as ConfigParserError
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+import config
+from src.exceptions import ConfigurationError, RuleException
+from src.instrumentation import instruments
+from .component import AddressComponentType
+from .heuristics import HeuristicDefinition
+from .rules import compile_rules, read_rules
+
+__all__ = [
+    'CountryConfig',
+    'install_country_config',
+    'load_country_config'
+]
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY = 'default'
+HEURISTICS_SECTION = 'AddressHeuristics'
+ABBREVIATION_SECTIONS = ['Abbreviations', 'AddressAbbreviations']
+
+# Seconds between checks of the file modification times of a cached snapshot.
+CHECK_INTERVAL = 1.0
+
+
+class CountryConfig(NamedTuple):
+    """
+    Immutable snapshot of the configuration used to parse addresses from one country.
+
+    The snapshot is compiled from the main configuration, the heuristics, the rules, the default country
+    configuration and the files for the country itself, in that order. Files ending in .json declare rules, see
+    rules.read_rules, all other files are INI files. It is shared between all addresses of the country and is never
+    changed after it is created, which makes it safe to use from several threads at once.
+
+    Attributes:
+
+        country_code: the code of the country the snapshot belongs to.
+        positions: the expected position of each AddressComponentType in an address.
+        abbreviations: full forms mapped to all of their abbreviations.
+        multipliers: heuristic multipliers mapped by component name and option, e.g. ['street_number']['is_digit'].
+        threshold: any component with a lower confidence than this is discarded.
+        format: format string used to create the full address or None if the country has none.
+        rules: the validated heuristic definitions of each AddressComponentType.
+        fingerprint: a hash of the content of all files the snapshot was compiled from.
+    """
+    country_code: str
+    positions: Mapping[AddressComponentType, int]
+    abbreviations: Mapping[str, Tuple[str, ...]]
+    multipliers: Mapping[str, Mapping[str, float]]
+    threshold: float
+    format: Optional[str]
+    rules: Mapping[AddressComponentType, Tuple[HeuristicDefinition, ...]]
+    fingerprint: str
+
+    def position(self, component_type: Union[AddressComponentType, str]) -> int:
+        """
+        Return the expected position of a component type, given as a member or as a name like "street_number".
+        """
+        if isinstance(component_type, str):
+            component_type = AddressComponentType[component_type.upper()]
+        return self.positions[component_type]
+
+    def multiplier(self, component_name: str, option: str) -> Optional[float]:
+        """
+        Return the multiplier of a heuristic or None if the heuristic is not configured for the component.
+        """
+        return self.multipliers.get(component_name.lower(), {}).get(option.lower())
+
+
+# country_code -> (time of the last check, file stamps, snapshot)
+_snapshots: Dict[str, Tuple[float, Tuple, CountryConfig]] = {}
+_lock = threading.Lock()
+
+# country_code -> snapshot that is used instead of the configuration files, see install_country_config
+_installed: Dict[str, CountryConfig] = {}
+
+
+def config_files(country_code: str) -> List[Path]:
+    """
+    Return the configuration files for a country in the order they are read. Later files override earlier ones.
+    """
+    files = [
+        Path(config.main_config_file),
+        Path(config.heuristics_config_file),
+        Path(config.rules_config_file),
+        Path(config.environment_file),
+        Path(f'{config.country_folder}/default.ini')
+    ]
+
+    country_config_folder = Path(f'{config.country_folder}/{country_code}')
+    if country_code != DEFAULT_COUNTRY and country_config_folder.is_dir():
+        files.extend(sorted(p for p in country_config_folder.iterdir() if p.is_file()))
+
+    return [f for f in files if f.exists()]
+
+
+def config_fingerprint(country_code: str, files: List[Path] = None) -> str:
+    """
+    Return the fingerprint of the configuration files of a country without compiling them. It is the fingerprint of
+    the CountryConfig that compile_country_config returns for the same files.
+    """
+
+    digest = hashlib.sha1(country_code.encode('utf8'))
+    for file in config_files(country_code) if files is None else files:
+        digest.update(file.read_text(encoding='utf8').encode('utf8'))
+    return digest.hexdigest()
+
+
+def stamp(files: List[Path]) -> Tuple:
+    return tuple((str(f), f.stat().st_mtime_ns) for f in files)
+
+
+def install_country_config(country_config: CountryConfig) -> None:
+    """
+    Make load_country_config return a snapshot for its country from now on, without reading any configuration files.
+    Used for the snapshots of country packs, see CountryPack.install.
+    """
+
+    _installed[country_config.country_code] = country_config
+
+
+def load_country_config(country_code: str) -> CountryConfig:
+    """
+    Return the configuration snapshot for a country.
+
+    Snapshots are cached by country code and are only compiled again when a file they were compiled from has been
+    modified, added or removed. The files are checked at most once every CHECK_INTERVAL seconds. A snapshot that was
+    installed with install_country_config is returned as it is.
+
+    :param country_code: The code of the country, the same as the name of its folder under config/countries.
+    :return: The CountryConfig for the country.
+    """
+
+    installed = _installed.get(country_code)
+    if installed is not None:
+        return installed
+
+    now = time.monotonic()
+    cached = _snapshots.get(country_code)
+    if cached is not None and now - cached[0] < CHECK_INTERVAL:
+        return cached[2]
+
+    with instruments.stage('load_country_config'), _lock:
+        files = config_files(country_code)
+        stamps = stamp(files)
+
+        cached = _snapshots.get(country_code)
+        if cached is not None and cached[1] == stamps:
+            snapshot = cached[2]
+        else:
+            snapshot = compile_country_config(country_code, files)
+            log.debug(f'Configuration for "{country_code}" is loaded.')
+
+        _snapshots[country_code] = (now, stamps, snapshot)
+        return snapshot
+
+
+def compile_country_config(country_code: str, files: List[Path]) -> CountryConfig:
+    """
+    Read the configuration files for a country and compile them into a CountryConfig.
+    """
+
+    country_config_folder = Path(f'{config.country_folder}/{country_code}')
+    if country_code != DEFAULT_COUNTRY and not country_config_folder.is_dir():
+        log.warning(f'Failed to load config for {country_code}\n'
+                    f'{country_config_folder}')
+
+    parser = ConfigParser()
+    declarations = []
+    digest = hashlib.sha1(country_code.encode('utf8'))
+    try:
+        for file in files:
+            content = file.read_text(encoding='utf8')
+            digest.update(content.encode('utf8'))
+            if file.suffix == '.json':
+                declarations.append((str(file), read_rules(content, str(file))))
+            else:
+                parser.read_string(content, source=str(file))
+
+        positions = {
+            AddressComponentType[option.upper()]: int(value)
+            for option, value in parser.items('AddressComponentType')
+        }
+
+        abbreviations = {}
+        for section in ABBREVIATION_SECTIONS:
+            if not parser.has_section(section):
+                continue
+            for full_form, value in parser.items(section):
+                variants = abbreviations.setdefault(full_form, [])
+                for variant in value.split(','):
+                    variant = variant.strip()
+                    if variant and variant not in variants:
+                        variants.append(variant)
+
+        multipliers = {}
+        for section in parser.sections():
+            parts = section.split('.')
+            if parts[0] != HEURISTICS_SECTION or len(parts) < 2 or parts[1] == 'evaluation':
+                continue
+            options = multipliers.setdefault(parts[1].lower(), {})
+            for option in parser.options(section):
+                options[option] = float(parser.get(section, option))
+
+        threshold = parser.getfloat(f'{HEURISTICS_SECTION}.evaluation', 'threshold')
+        fmt = parser.get('Address', 'FORMAT', fallback=None)
+        rules = compile_rules(declarations, parser)
+    except RuleException as e:
+        log.error(f'Invalid rules for "{country_code}": {e}')
+        raise
+    except (ConfigParserError, KeyError, ValueError, OSError) as e:
+        msg = f'Could not compile the configuration for "{country_code}"'
+        log.error(msg)
+        raise ConfigurationError(msg) from e
+
+    return CountryConfig(
+        country_code=country_code,
+        positions=MappingProxyType(positions),
+        abbreviations=MappingProxyType({k: tuple(v) for k, v in abbreviations.items()}),
+        multipliers=MappingProxyType({k: MappingProxyType(v) for k, v in multipliers.items()}),
+        threshold=threshold,
+        format=fmt,
+        rules=MappingProxyType(rules),
+        fingerprint=digest.hexdigest()
+    )
@@ -0,0 +1,360 @@
+import csv
+import logging
+import re
+from array import array
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import AddressComponent, AddressComponentType
+from .sections import SectionFile, StringTable, pack_strings, write_sections
+
+if TYPE_CHECKING:
+    from .phonetic import PhoneticIndex
+
+__all__ = [
+    'AddressDatabase',
+    'AddressMatcher'
+]
+
+MAGIC = b'BUACHEDB'
+VERSION = 1
+
+# The string tables of the database and the component type whose values each of them holds.
+TABLES = {
+    AddressComponentType.STREET_NAME: 'streets',
+    AddressComponentType.STREET_NUMBER: 'numbers',
+    AddressComponentType.POSTAL_CODE: 'postal_codes',
+    AddressComponentType.CITY: 'cities',
+}
+
+# The columns of the rows of a register, by the table they go to.
+COLUMNS = {
+    'streets': 'street',
+    'numbers': 'number',
+    'postal_codes': 'postal_code',
+    'cities': 'city',
+}
+
+ADDRESS_DTYPE = np.dtype([
+    ('postal_code', '<u4'),
+    ('street', '<u4'),
+    ('number', '<u4'),
+    ('city', '<u4'),
+])
+
+# The id of an empty value in the address rows.
+MISSING = np.iinfo(np.uint32).max
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def canonical(table: str, value: str) -> str:
+    """
+    Return the key a value is stored and looked up with: case folded, with single spaces, and without any spaces
+    for postal codes.
+    """
+
+    value = WHITESPACE.sub(' ', value).strip().casefold()
+    return value.replace(' ', '') if table == 'postal_codes' else value
+
+
+class AddressDatabase:
+    """
+    A register of known addresses, compiled offline into one memory mapped file.
+
+    The file has a sorted table of distinct keys for street names, street numbers, postal codes and cities, each
+    with the spelling the key was first seen with and the number of rows it occurs in. Every address of the register
+    is a row of four ids into those tables, sorted by postal code, street and number, so the streets and numbers of a
+    postal code are found with binary search as well.
+
+    Opening the database only reads the section table. Lookups do binary search directly on the mapping, so little
+    memory is resident, pages that are not used are never read, and processes that open the same file share its
+    pages. Workers reopen the file when the database is pickled.
+
+    Attributes:
+
+        path: the database file.
+        tables: the key table of each component type that is in the database.
+        addresses: the address rows, an ADDRESS_DTYPE array.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        :param path: A file written by compile.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.load_database(path)
+
+    def load_database(self, path: Union[str, Path]) -> None:
+        self.path = str(path)
+        self.sections = SectionFile(self.path, MAGIC, VERSION)
+        self.tables: Dict[AddressComponentType, StringTable] = {
+            component_type: StringTable(self.sections, name) for component_type, name in TABLES.items()
+        }
+        self.names = {name: StringTable(self.sections, f'{name}.names') for name in TABLES.values()}
+        self.counts = {name: self.sections.array(f'{name}.counts') for name in TABLES.values()}
+        self.addresses = self.sections.array('addresses').view(ADDRESS_DTYPE)
+        self.log.debug(f'Opened the address database {self.path} with {len(self.addresses)} addresses.')
+
+    def __getstate__(self) -> dict:
+        return {'path': self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['path'])
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    @classmethod
+    def compile(cls, rows: Iterable[Mapping[str, str]], path: Union[str, Path],
+                columns: Mapping[str, str] = None) -> 'AddressDatabase':
+        """
+        Compile rows of a register into a database file.
+
+        :param rows: Mappings with the street, number, postal code and city of an address. Missing or empty values
+        are allowed.
+        :param path: The file to write.
+        :param columns: The key of each value in the rows by table, see COLUMNS.
+        :return: The compiled database.
+        """
+
+        log = logging.getLogger(__name__)
+        columns = {**COLUMNS, **(columns or {})}
+        names = list(TABLES.values())
+
+        # key -> id in the order of appearance, with the first spelling and the number of rows of each id
+        ids: Dict[str, Dict[str, int]] = {name: {} for name in names}
+        spellings: Dict[str, List[str]] = {name: [] for name in names}
+        counts: Dict[str, array] = {name: array('I') for name in names}
+        # the address rows, as one array of ids per table
+        rows_of: Dict[str, array] = {name: array('I') for name in names}
+
+        for row in rows:
+            for name in names:
+                value = row.get(columns[name]) or ''
+                key = canonical(name, value)
+                if not key:
+                    rows_of[name].append(MISSING)
+                    continue
+                table = ids[name]
+                index = table.get(key)
+                if index is None:
+                    index = table[key] = len(table)
+                    spellings[name].append(WHITESPACE.sub(' ', value).strip())
+                    counts[name].append(0)
+                counts[name][index] += 1
+                rows_of[name].append(index)
+
+        sections = {}
+        remapped = {}
+        for name in names:
+            keys = list(ids[name])
+            order = np.array(sorted(range(len(keys)), key=lambda i: keys[i].encode('utf-8')), dtype=np.int64)
+            # old id -> new id, with MISSING kept as it is
+            rank = np.empty(len(keys), dtype=np.uint32)
+            rank[order] = np.arange(len(keys), dtype=np.uint32)
+            old = np.frombuffer(rows_of[name], dtype=np.uint32)
+            present = old != MISSING
+            remapped[name] = np.full(len(old), MISSING, dtype=np.uint32)
+            remapped[name][present] = rank[old[present]]
+
+            sections[f'{name}.offsets'], sections[f'{name}.data'] = pack_strings(keys[i] for i in order.tolist())
+            sections[f'{name}.names.offsets'], sections[f'{name}.names.data'] = \
+                pack_strings(spellings[name][i] for i in order.tolist())
+            sections[f'{name}.counts'] = np.frombuffer(counts[name], dtype=np.uint32)[order].astype('<u4')
+
+        addresses = np.empty(len(remapped['streets']), dtype=ADDRESS_DTYPE)
+        addresses['postal_code'] = remapped['postal_codes']
+        addresses['street'] = remapped['streets']
+        addresses['number'] = remapped['numbers']
+        addresses['city'] = remapped['cities']
+        addresses = np.unique(addresses)
+        sections['addresses'] = addresses.view(np.uint8)
+
+        digest = write_sections(path, MAGIC, sections, VERSION)
+        log.info(f'Compiled {len(addresses)} addresses into {path} ({digest}).')
+        return cls(path)
+
+    @classmethod
+    def compile_csv(cls, csv_path: Union[str, Path], path: Union[str, Path], columns: Mapping[str, str] = None,
+                    delimiter: str = ',', encoding: str = 'utf-8') -> 'AddressDatabase':
+        """
+        Compile a CSV register with a header row into a database file, reading it as a stream.
+        """
+
+        with open(csv_path, encoding=encoding, newline='') as source:
+            return cls.compile(csv.DictReader(source, delimiter=delimiter), path, columns)
+
+    def lookup(self, component_type: AddressComponentType, value: str) -> int:
+        """
+        Return the id of a value in the table of its component type, or -1 if it is not in the database.
+        """
+
+        table = self.tables.get(component_type)
+        if table is None:
+            return -1
+        return table.find(canonical(TABLES[component_type], value))
+
+    def name(self, component_type: AddressComponentType, index: int) -> str:
+        return self.names[TABLES[component_type]][index]
+
+    def count(self, component_type: AddressComponentType, index: int) -> int:
+        return int(self.counts[TABLES[component_type]][index])
+
+    def vocabularies(
+            self,
+            component_types: Iterable[AddressComponentType]
+    ) -> Dict[AddressComponentType, List[Tuple[str, int]]]:
+        """
+        Return the names of some component types with the number of rows they occur in, the input of
+        SpellingCorrector.compile and PhoneticIndex.compile.
+
+        :param component_types: The component types to return the names of, each must have a table.
+        :return: (spelling, count) pairs of each component type, in key order.
+        """
+
+        vocabularies = {}
+        for component_type in component_types:
+            names, counts = self.names[TABLES[component_type]], self.counts[TABLES[component_type]]
+            vocabularies[component_type] = [(names[i], int(counts[i])) for i in range(len(names))]
+        return vocabularies
+
+    def match_components(self, component_type: AddressComponentType, component_value: str,
+                         limit: int = 10) -> Tuple[Optional[str], float]:
+        """
+        Find the best match of a component value in the database.
+
+        A value that is in the database matches with confidence 1. Otherwise the most common value that starts with
+        it matches, with the share of the match that the value covers as confidence, so "sundby" matches
+        "Sundbyberg" with 0.6. Postal codes and street numbers only match exactly.
+
+        :param component_type: The type of the component. Types without a table never match.
+        :param component_value: The value to match.
+        :param limit: The number of values starting with the value that are compared.
+        :return: The spelling of the match in the register and the confidence, or (None, 0.0).
+        """
+
+        with instruments.stage('match_components'):
+            table = self.tables.get(component_type)
+            if table is None:
+                return None, 0.0
+
+            name = TABLES[component_type]
+            key = canonical(name, component_value)
+            if not key:
+                return None, 0.0
+
+            index = table.find(key)
+            if index >= 0:
+                return self.names[name][index], 1.0
+            if component_type in (AddressComponentType.POSTAL_CODE, AddressComponentType.STREET_NUMBER):
+                return None, 0.0
+
+            candidates = list(table.prefixed(key, limit))
+            if not candidates:
+                return None, 0.0
+            best = max(candidates, key=lambda i: self.counts[name][i])
+            return self.names[name][best], len(key) / len(table.key(best).decode('utf-8'))
+
+    def rows(self, postal_code: str) -> np.ndarray:
+        """
+        Return the address rows of a postal code, a view of the database.
+        """
+
+        index = self.lookup(AddressComponentType.POSTAL_CODE, postal_code)
+        if index < 0:
+            return self.addresses[:0]
+        postal_codes = self.addresses['postal_code']
+        start = np.searchsorted(postal_codes, index, side='left')
+        end = np.searchsorted(postal_codes, index, side='right')
+        return self.addresses[start:end]
+
+    def contains_address(self, postal_code: str, street: str, number: str = None) -> bool:
+        """
+        Return whether the register has a street, and optionally a number on it, in a postal code.
+        """
+
+        rows = self.rows(postal_code)
+        street_id = self.lookup(AddressComponentType.STREET_NAME, street)
+        if street_id < 0 or not len(rows):
+            return False
+        streets = rows['street']
+        start = np.searchsorted(streets, street_id, side='left')
+        end = np.searchsorted(streets, street_id, side='right')
+        if number is None:
+            return end > start
+        number_id = self.lookup(AddressComponentType.STREET_NUMBER, number)
+        return number_id >= 0 and bool(np.any(rows['number'][start:end] == number_id))
+
+    def close(self) -> None:
+        self.sections.close()
+
+
+class AddressMatcher:
+    """
+    Validates and corrects parsed components against an AddressDatabase.
+
+    Components of the types in the database are replaced by their match, with the spelling of the register and the
+    confidence multiplied by the confidence of the match. Street names and cities without a good enough match are
+    looked up in the phonetic index if there is one, and match the most common name that sounds the same with
+    phonetic_score. Components without a good enough match are dropped, unless keep_unmatched is set. Other
+    component types are kept as they are. When a street name and a postal code are both matched but the register has
+    no such street in the postal code, the confidence of the street is multiplied by mismatch_factor.
+
+    Attributes:
+
+        database: the register to match against.
+        min_score: the lowest match confidence that is accepted.
+        keep_unmatched: whether components that do not match are kept unchanged.
+        mismatch_factor: the factor for streets that are not in the matched postal code.
+        phonetic: a PhoneticIndex of the names in the database, or None.
+        phonetic_score: the confidence of a phonetic match.
+    """
+
+    def __init__(self, database: AddressDatabase, min_score: float = 0.5, keep_unmatched: bool = False,
+                 mismatch_factor: float = 0.5, phonetic: 'PhoneticIndex' = None, phonetic_score: float = 0.8):
+        self.log = logging.getLogger(__name__)
+        self.database = database
+        self.min_score = min_score
+        self.keep_unmatched = keep_unmatched
+        self.mismatch_factor = mismatch_factor
+        self.phonetic = phonetic
+        self.phonetic_score = phonetic_score
+
+    def match_address(self, address_components: List[AddressComponent]) -> List[AddressComponent]:
+        """
+        Match the components of one address, see the class description.
+
+        :param address_components: The components of the address.
+        :return: New AddressComponent objects for the validated and corrected components, in the same order.
+        """
+
+        result, corrected = [], []
+        for component in address_components:
+            if component.component_type not in TABLES:
+                result.append(component)
+                continue
+            value, score = self.database.match_components(component.component_type, component.component_value)
+            if (value is None or score < self.min_score) and self.phonetic is not None:
+                match = self.phonetic.match_phonetic(component.component_type, component.component_value)
+                if match is not None:
+                    value, score = match, self.phonetic_score
+            if value is not None and score >= self.min_score:
+                match = AddressComponent(component.component_type, value, round(component.confidence * score, 2),
+                                         component.position, component.span)
+                result.append(match)
+                corrected.append(match)
+            elif self.keep_unmatched:
+                result.append(component)
+
+        streets = [c for c in corrected if c.component_type is AddressComponentType.STREET_NAME]
+        postal_codes = [c.component_value for c in corrected if c.component_type is AddressComponentType.POSTAL_CODE]
+        if postal_codes:
+            for street in streets:
+                if not any(self.database.contains_address(p, street.component_value) for p in postal_codes):
+                    street.confidence = round(street.confidence * self.mismatch_factor, 2)
+        return result
@@ -0,0 +1,173 @@
+import threading
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from src.instrumentation import instruments
+from .component import AddressComponent, AddressComponentType
+from .country import CountryConfig
+
+__all__ = [
+    'ComponentDecoder',
+    'Labeling'
+]
+
+# (position group of the last component, bit mask of the types of that group that were used)
+State = Tuple[int, int]
+
+# A labeling under construction, as a linked list from its last component: (component, rest) or None.
+Chain = Optional[Tuple[AddressComponent, 'Chain']]
+
+
+class Labeling(NamedTuple):
+    """
+    One consistent reading of an address.
+
+    Attributes:
+
+        score: the sum of the confidences of the components.
+        components: non-overlapping components in word order, at most one of each type.
+    """
+    score: float
+    components: Tuple[AddressComponent, ...]
+
+
+class ComponentDecoder:
+    """
+    Chooses the best non-overlapping components of an address with dynamic programming.
+
+    The parser finds every (token, type) pair that passes the threshold, so the same words come back with several
+    types and unigrams overlap with the bigrams that contain them. A labeling covers the words of the address from
+    left to right, giving every word either to one component or to none. It is consistent when its component types
+    follow the positions of [AddressComponentType] in the country configuration: a component never has a lower
+    position than the component before it, types with the same position may come in any order, and every type is
+    used at most once. Types with a negative position are never used. The score of a labeling is the sum of the
+    confidences of its components.
+
+    The decoder is a Viterbi search over the words, where the state is the position group of the last component and
+    the types of that group used so far. With beam = k every (word, state) cell keeps its k best partial labelings,
+    which gives the k best labelings overall. The work grows with tokens × types × beam.
+
+    Attributes:
+
+        groups: the position group of each usable component type, and its bit within the group.
+    """
+
+    _cache: Dict[str, Tuple[str, 'ComponentDecoder']] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, positions: Mapping[AddressComponentType, int]):
+        """
+        :param positions: The expected position of each component type, like CountryConfig.positions.
+        """
+
+        distinct = sorted({p for p in positions.values() if p >= 0})
+        group_of = {p: g for g, p in enumerate(distinct)}
+
+        self.groups: Dict[AddressComponentType, Tuple[int, int]] = {}
+        used_bits: Dict[int, int] = {}
+        for component_type in sorted(positions, key=lambda t: t.value):
+            position = positions[component_type]
+            if position < 0:
+                continue
+            group = group_of[position]
+            bit = used_bits.get(group, 1)
+            used_bits[group] = bit << 1
+            self.groups[component_type] = (group, bit)
+
+    @classmethod
+    def for_country(cls, country_config: CountryConfig) -> 'ComponentDecoder':
+        """
+        Return the decoder for a country, creating it only once for each version of the country configuration.
+        """
+
+        cached = cls._cache.get(country_config.country_code)
+        if cached is not None and cached[0] == country_config.fingerprint:
+            return cached[1]
+
+        with cls._lock:
+            decoder = cls(country_config.positions)
+            cls._cache[country_config.country_code] = (country_config.fingerprint, decoder)
+            return decoder
+
+    def transition(self, state: State, component_type: AddressComponentType) -> Optional[State]:
+        """
+        Return the state after a component of a type, or None if the type cannot follow the state.
+        """
+
+        slot = self.groups.get(component_type)
+        if slot is None:
+            return None
+        group, bit = slot
+        last_group, mask = state
+        if group > last_group:
+            return group, bit
+        if group == last_group and not mask & bit:
+            return group, mask | bit
+        return None
+
+    def decode(self, components: Iterable[AddressComponent], beam: int = 1) -> List[Labeling]:
+        """
+        Find the best labelings of an address.
+
+        :param components: The candidate components of one address, as returned by AddressParser.parse_address.
+        :param beam: The number of labelings to return.
+        :return: Up to beam labelings, the best first. An address without candidates has one empty labeling.
+        """
+
+        with instruments.stage('decode_components'):
+            return self.search(components, max(1, beam))
+
+    def search(self, components: Iterable[AddressComponent], beam: int) -> List[Labeling]:
+        # word index -> the candidates that start at it, with the word index after them
+        starting: Dict[int, List[Tuple[int, AddressComponent]]] = {}
+        words = 0
+        for component in components:
+            end = component.position + component.span
+            starting.setdefault(component.position, []).append((end, component))
+            words = max(words, end)
+
+        # cells[i][state] holds partial labelings (score, chain) covering the words before i
+        cells: List[Dict[State, List[Tuple[float, Chain]]]] = [{} for _ in range(words + 1)]
+        cells[0][(-1, 0)] = [(0.0, None)]
+
+        for word in range(words):
+            candidates = starting.get(word, ())
+            following = cells[word + 1]
+            for state, labelings in cells[word].items():
+                labelings = self.prune(labelings, beam)
+                # The word is not part of any component.
+                following.setdefault(state, []).extend(labelings)
+                for end, component in candidates:
+                    next_state = self.transition(state, component.component_type)
+                    if next_state is None:
+                        continue
+                    target = cells[end].setdefault(next_state, [])
+                    for score, chain in labelings:
+                        target.append((score + component.confidence, (component, chain)))
+            cells[word] = {}
+
+        final = sorted((labeling for labelings in cells[words].values() for labeling in labelings),
+                       key=lambda labeling: -labeling[0])[:beam]
+        return [Labeling(round(score, 2), self.unwind(chain)) for score, chain in final]
+
+    @staticmethod
+    def prune(labelings: List[Tuple[float, Chain]], beam: int) -> List[Tuple[float, Chain]]:
+        if len(labelings) <= beam:
+            return labelings
+        # Only the score is compared, equal scores keep the order they were found in.
+        return sorted(labelings, key=lambda labeling: -labeling[0])[:beam]
+
+    @staticmethod
+    def unwind(chain: Chain) -> Tuple[AddressComponent, ...]:
+        components = []
+        while chain is not None:
+            component, chain = chain
+            components.append(component)
+        return tuple(reversed(components))
+
+    @staticmethod
+    def rank(labelings: Sequence[Labeling]) -> List[Labeling]:
+        """
+        Order labelings from the best to the worst, by score and then by the number of components.
+        """
+
+        return sorted(labelings, key=lambda labeling: (-labeling.score, -len(labeling.components)))
@@ -0,0 +1,401 @@
+import json
+import logging
+import re
+import shutil
+import tempfile
+import zlib
+from collections import deque
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import AddressComponent, AddressComponentType
+
+if TYPE_CHECKING:
+    from .. import Application
+
+__all__ = [
+    'Deduplicator',
+    'DisjointSet',
+    'MinHasher'
+]
+
+WHITESPACE = re.compile(r'\s+')
+NOT_DIGITS = re.compile(r'\D+')
+
+# The multiplier of the rolling hash of the characters of an n-gram.
+GRAM_MULTIPLIER = np.uint64(0x100000001b3)
+
+# Pairs whose estimated similarity is this close below the threshold get their exact similarity computed.
+ESTIMATE_MARGIN = 0.1
+# LSH buckets up to this size have all their pairs compared, larger ones are compared with their first record.
+SMALL_BUCKET = 16
+# Blocks up to this size skip LSH and have all their pairs compared.
+SMALL_BLOCK = 64
+
+# (record id, address)
+Record = Tuple[str, str]
+
+
+class MinHasher:
+    """
+    MinHash signatures of the character n-grams of strings, and locality sensitive hashing of the signatures.
+
+    The n-grams of all strings of a block are hashed together from one UTF-32 buffer, and every one of the num_perm
+    hash functions is a multiply-shift hash of the n-gram hash, so the signatures of a block of strings are computed
+    with a few array operations. Signatures are split into bands
+    of rows values, and two strings become a candidate pair when all values of one band are the same. The chance of
+    that is 1 - (1 - s^rows)^bands for strings with Jaccard similarity s, which rises steeply around
+    (1 / bands)^(1 / rows).
+
+    Attributes:
+
+        ngram_size: the number of characters of an n-gram.
+        num_perm: the number of hash functions, bands × rows.
+        bands: the number of bands.
+        rows: the number of values in a band.
+    """
+
+    def __init__(self, ngram_size: int = 3, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f'num_perm {num_perm} is not a multiple of bands {bands}.')
+
+        self.ngram_size = ngram_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        random = np.random.default_rng(seed)
+        # Odd multipliers and offsets of the multiply-shift hashes, the arithmetic wraps around at 64 bits.
+        self.multipliers = random.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.offsets = random.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.band_multipliers = random.integers(1, 2 ** 63, self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def shingles(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the distinct 64 bit hashes of the n-grams of several texts. Texts shorter than an n-gram are padded
+        with spaces.
+
+        :return: The hashes, and the offset of the hashes of each text followed by the number of hashes. The hashes
+        of text i are hashes[offsets[i]:offsets[i + 1]], sorted.
+        """
+
+        size = self.ngram_size
+        texts = [text.ljust(size) for text in texts]
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+        codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+        count = len(codes) - size + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for index in range(size):
+                hashes = hashes * GRAM_MULTIPLIER + codes[index:index + count]
+
+        # Only the n-grams that start and end in the same text.
+        owners = np.repeat(np.arange(len(texts)), lengths)[:count]
+        valid = np.arange(count) - starts[owners] <= lengths[owners] - size
+        owners, hashes = owners[valid], hashes[valid]
+
+        order = np.lexsort((hashes, owners))
+        owners, hashes = owners[order], hashes[order]
+        distinct = np.ones(len(hashes), dtype=bool)
+        distinct[1:] = (hashes[1:] != hashes[:-1]) | (owners[1:] != owners[:-1])
+        owners, hashes = owners[distinct], hashes[distinct]
+        return hashes, np.searchsorted(owners, np.arange(len(texts) + 1))
+
+    def signatures(self, hashes: np.ndarray, offsets: np.ndarray, chunk_size: int = 1024) -> np.ndarray:
+        """
+        Return the MinHash signatures of texts from their n-gram hashes, see shingles, one row of num_perm values per
+        text. The hashes of chunk_size texts are computed together.
+        """
+
+        texts = len(offsets) - 1
+        result = np.empty((texts, self.num_perm), dtype=np.uint32)
+        with np.errstate(over='ignore'):
+            for start in range(0, texts, chunk_size):
+                end = min(texts, start + chunk_size)
+                low, high = offsets[start], offsets[end]
+                values = (hashes[low:high, None] * self.multipliers + self.offsets) >> np.uint64(32)
+                result[start:end] = np.minimum.reduceat(values, offsets[start:end] - low, axis=0)
+        return result
+
+    def buckets(self, signatures: np.ndarray) -> Iterator[np.ndarray]:
+        """
+        Yield the indexes of the texts that share all values of a band, for every band and every group of at least
+        two texts.
+        """
+
+        with np.errstate(over='ignore'):
+            for band in range(self.bands):
+                values = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+                keys = (values * self.band_multipliers).sum(axis=1)
+                order = np.argsort(keys, kind='stable')
+                keys = keys[order]
+                bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [len(keys)]))
+                for group in np.flatnonzero(np.diff(bounds) > 1).tolist():
+                    yield order[bounds[group]:bounds[group + 1]]
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Return the Jaccard similarity of two sorted arrays of distinct hashes.
+    """
+
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+
+def find_duplicates(path: str, hasher: MinHasher, threshold: float) -> List[Tuple[str, str]]:
+    """
+    Find the pairs of duplicate records in one partition file, comparing only records of the same block. Runs in a
+    worker process.
+
+    :param path: A partition written by Deduplicator.partition, one JSON list [block key, record id, text] per line.
+    :return: Pairs of record ids whose texts have a Jaccard similarity of at least threshold.
+    """
+
+    blocks: Dict[str, List[Tuple[str, str]]] = {}
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            block, record_id, text = json.loads(line)
+            blocks.setdefault(block, []).append((record_id, text))
+
+    pairs = []
+    for records in blocks.values():
+        if len(records) > 1:
+            pairs.extend(match_block(records, hasher, threshold))
+    return pairs
+
+
+def match_block(records: Sequence[Tuple[str, str]], hasher: MinHasher, threshold: float) -> List[Tuple[str, str]]:
+    """
+    Find the duplicate pairs of one block with MinHash LSH.
+
+    Candidate pairs come from the LSH buckets, or are all pairs in a block of at most SMALL_BLOCK records. The
+    similarity of a set of pairs is estimated at once as the share of equal values in their signatures, and only the
+    pairs that come close to threshold are compared exactly. All pairs of small buckets are collected and compared
+    together. A large bucket is compared with its first record,
+    the records that do not match it with the first of the rest, and so on, so a large bucket of near identical
+    texts costs one estimate and an exact comparison per record.
+    """
+
+    hashes, offsets = hasher.shingles([text for _, text in records])
+    signatures = hasher.signatures(hashes, offsets)
+    # (first, other) -> whether they are duplicates, the same pair often shares several bands
+    verdicts: Dict[Tuple[int, int], bool] = {}
+
+    def verify(pairs: np.ndarray) -> np.ndarray:
+        estimates = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        matched = np.zeros(len(pairs), dtype=bool)
+        for index in np.flatnonzero(estimates >= threshold - ESTIMATE_MARGIN).tolist():
+            key = (int(pairs[index, 0]), int(pairs[index, 1]))
+            verdict = verdicts.get(key)
+            if verdict is None:
+                a, b = key
+                verdict = verdicts[key] = jaccard(hashes[offsets[a]:offsets[a + 1]],
+                                                  hashes[offsets[b]:offsets[b + 1]]) >= threshold
+            matched[index] = verdict
+        return matched
+
+    if len(records) <= SMALL_BLOCK:
+        verify(np.array(list(combinations(range(len(records)), 2)), dtype=np.int64))
+        return [(records[a][0], records[b][0]) for (a, b), verdict in verdicts.items() if verdict]
+
+    small = set()
+    for bucket in hasher.buckets(signatures):
+        if len(bucket) <= SMALL_BUCKET:
+            small.update(combinations(bucket.tolist(), 2))
+            continue
+        remaining = bucket
+        while len(remaining) > 1:
+            first, others = remaining[0], remaining[1:]
+            matched = verify(np.column_stack((np.full(len(others), first), others)))
+            remaining = others[~matched]
+    if small:
+        verify(np.array(sorted(small), dtype=np.int64))
+
+    return [(records[a][0], records[b][0]) for (a, b), verdict in verdicts.items() if verdict]
+
+
+class DisjointSet:
+    """
+    Union-find over hashable items, with path halving and union by size. Only items that were joined are stored.
+    """
+
+    def __init__(self):
+        self.parents: Dict[str, str] = {}
+        self.sizes: Dict[str, int] = {}
+
+    def find(self, item: str) -> str:
+        parents = self.parents
+        parents.setdefault(item, item)
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    def union(self, a: str, b: str) -> None:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.sizes.get(a, 1) < self.sizes.get(b, 1):
+            a, b = b, a
+        self.parents[b] = a
+        self.sizes[a] = self.sizes.get(a, 1) + self.sizes.pop(b, 1)
+
+    def groups(self) -> Iterator[List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for item in self.parents:
+            groups.setdefault(self.find(item), []).append(item)
+        return iter(groups.values())
+
+
+class Deduplicator:
+    """
+    Finds records whose addresses were typed differently but are the same address.
+
+    Addresses are parsed and decoded in batches, in the worker pool of the application if it has one. Every record
+    is then put in the blocks of its cheap keys: its postal code, the first prefix_length characters of its street
+    name and the first address_prefix_length characters of its normalized address. The last block catches the
+    duplicates whose components were parsed differently. Records are written to partition files on disk by the hash
+    of their block, so the input is streamed and memory use does not depend on its size.
+
+    The partitions are then processed in parallel. Within every block, candidate pairs come from MinHash LSH over
+    the character n-grams of the normalized addresses, from AddressParser.normalize_address, and are kept when the
+    Jaccard similarity of their n-grams is at least threshold. Records that are connected by such pairs,
+    through any of their blocks, form one cluster.
+
+    Attributes:
+
+        app: the application that parses the addresses.
+        threshold: the lowest Jaccard similarity of duplicates.
+        hasher: the MinHasher of the n-grams.
+        prefix_length: the number of characters of the street name prefix key.
+        address_prefix_length: the number of characters of the normalized address prefix key.
+        partitions: the number of partition files.
+        workers: the number of processes that match the partitions, None for one per CPU.
+    """
+
+    def __init__(
+            self,
+            app: 'Application',
+            threshold: float = 0.6,
+            ngram_size: int = 3,
+            num_perm: int = 64,
+            bands: int = 16,
+            prefix_length: int = 4,
+            address_prefix_length: int = 8,
+            partitions: int = 64,
+            workers: int = None
+    ):
+        """
+        :param app: The application that parses the addresses.
+        :param threshold: The lowest Jaccard similarity of the n-grams of two duplicate addresses.
+        :param ngram_size: The number of characters of an n-gram.
+        :param num_perm: The length of the MinHash signatures.
+        :param bands: The number of LSH bands, num_perm must be a multiple of it. More bands find more candidates.
+        :param prefix_length: The number of characters of the street name prefix key.
+        :param address_prefix_length: The number of characters of the normalized address prefix key.
+        :param partitions: The number of partition files the blocks are spread over.
+        :param workers: The number of processes that match the partitions. Defaults to one per CPU.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.app = app
+        self.threshold = threshold
+        self.hasher = MinHasher(ngram_size, num_perm, bands)
+        self.prefix_length = prefix_length
+        self.address_prefix_length = address_prefix_length
+        self.partitions = partitions
+        self.workers = workers
+
+    def block_keys(self, components: Iterable[AddressComponent], normalized: str) -> List[str]:
+        """
+        Return the blocks of an address, from its decoded components and its normalized form.
+        """
+
+        keys = []
+        for component in components:
+            if component.component_type is AddressComponentType.POSTAL_CODE:
+                postal_code = NOT_DIGITS.sub('', component.component_value) or component.component_value.casefold()
+                keys.append(f'P:{postal_code}')
+            elif component.component_type is AddressComponentType.STREET_NAME:
+                keys.append(f'S:{component.component_value.casefold()[:self.prefix_length]}')
+        keys.append(f'N:{normalized[:self.address_prefix_length]}')
+        return keys
+
+    def prepare(self, records: Iterable[Record], country_code: str = None,
+                batch_size: int = 1000) -> Iterator[Tuple[str, str, List[str]]]:
+        """
+        Parse records lazily and yield the id, the normalized address and the block keys of each of them.
+        """
+
+        ids = deque()
+
+        def addresses() -> Iterator[str]:
+            for record_id, address in records:
+                ids.append(record_id)
+                yield address
+
+        for address, code, components in self.app.parse_many(addresses(), country_code, batch_size, decode=True):
+            normalized = WHITESPACE.sub(' ', self.app.get_parser(code).normalize_address(address)).strip().casefold()
+            yield ids.popleft(), normalized, self.block_keys(components, normalized)
+
+    def partition(self, records: Iterable[Record], directory: Path, country_code: str = None,
+                  batch_size: int = 1000) -> Tuple[int, List[Path]]:
+        """
+        Write every record to the partition of each of its blocks.
+
+        :return: The number of records and the partition files that are not empty.
+        """
+
+        paths = [directory / f'partition-{i:05d}.jsonl' for i in range(self.partitions)]
+        files = [open(path, 'w', encoding='utf-8') for path in paths]
+        count = 0
+        try:
+            for record_id, normalized, keys in self.prepare(records, country_code, batch_size):
+                for key in keys:
+                    target = files[zlib.crc32(key.encode('utf-8')) % self.partitions]
+                    target.write(json.dumps([key, record_id, normalized], ensure_ascii=False))
+                    target.write('\n')
+                count += 1
+        finally:
+            for file in files:
+                file.close()
+        return count, [path for path in paths if path.stat().st_size]
+
+    def deduplicate(self, records: Iterable[Record], country_code: str = None, batch_size: int = 1000,
+                    temporary_directory: str = None) -> Iterator[List[str]]:
+        """
+        Find the clusters of duplicate records.
+
+        :param records: (record id, address) pairs. They are consumed lazily, ids must be unique strings.
+        :param country_code: Country code of all addresses. If omitted it is detected for each address.
+        :param batch_size: The number of addresses parsed together.
+        :param temporary_directory: Where the partition files are written. Defaults to the system temporary directory.
+        :return: An iterator over the clusters of at least two record ids, each sorted.
+        """
+
+        directory = Path(tempfile.mkdtemp(prefix='buache-dedup-', dir=temporary_directory))
+        try:
+            with instruments.stage('dedup_partition'):
+                count, paths = self.partition(records, directory, country_code, batch_size)
+            self.log.info(f'Partitioned {count} records into {len(paths)} partitions.')
+
+            clusters = DisjointSet()
+            with instruments.stage('dedup_match'):
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [executor.submit(find_duplicates, str(p), self.hasher, self.threshold) for p in paths]
+                    for future in futures:
+                        for a, b in future.result():
+                            clusters.union(a, b)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        for group in clusters.groups():
+            yield sorted(group)
@@ -0,0 +1,310 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Pattern, Tuple
+
+from src.instrumentation import instruments
+
+__all__ = [
+    'CountryDetector',
+    'CountrySignals',
+    'SIGNALS',
+    'detect_country'
+]
+
+DEFAULT_COUNTRY = 'default'
+
+# Scores of the signals. A country name or ISO code at the end of the address decides on its own.
+POSTAL_CODE_SCORE = 1
+CHARACTER_SCORE = 1
+STREET_WORD_SCORE = 2
+
+# The lowest score that is trusted without asking langdetect.
+MIN_SCORE = 2
+
+# Street words at least this long also match as the ending of a word, like "gatan" in "Oxbacksgatan".
+MIN_SUFFIX_LENGTH = 4
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+DIGITS = re.compile(r'\d')
+WORD = re.compile(r'\S+')
+
+
+class CountrySignals(NamedTuple):
+    """
+    Cheap signals that an address belongs to a country.
+
+    The code is the code of the country configuration, which is the language code returned by langdetect.
+
+    Attributes:
+
+        code: the country code returned when the signals match.
+        names: country names and ISO codes, lower case, that decide the country when they end an address.
+        postal_codes: patterns matching postal codes, with the score of a match.
+        characters: letters that are typical for the language, mostly diacritics.
+        street_words: words that are typical for street names, lower case. Words of at least MIN_SUFFIX_LENGTH
+            letters also match the end of a word.
+    """
+    code: str
+    names: FrozenSet[str]
+    postal_codes: Tuple[Tuple[Pattern, int], ...] = ()
+    characters: FrozenSet[str] = frozenset()
+    street_words: Tuple[str, ...] = ()
+
+
+def postal(pattern: str, score: int = POSTAL_CODE_SCORE) -> Tuple[Pattern, int]:
+    return re.compile(rf'(?<![\w-]){pattern}(?![\w-])'), score
+
+
+SIGNALS: Tuple[CountrySignals, ...] = (
+    CountrySignals(
+        code='sv',
+        names=frozenset({'sweden', 'sverige', 'se', 'swe'}),
+        postal_codes=(postal(r'\d{3} \d{2}', 2), postal(r'\d{5}')),
+        characters=frozenset('åäö'),
+        street_words=('gatan', 'vägen', 'gränd', 'gränden', 'stigen', 'backen', 'torget', 'allé', 'lgh'),
+    ),
+    CountrySignals(
+        code='da',
+        names=frozenset({'denmark', 'danmark', 'dk', 'dnk'}),
+        postal_codes=(postal(r'\d{4}'),),
+        characters=frozenset('æøå'),
+        street_words=('gade', 'vej', 'stræde', 'blvd.', 'allé'),
+    ),
+    CountrySignals(
+        code='no',
+        names=frozenset({'norway', 'norge', 'nor'}),
+        postal_codes=(postal(r'\d{4}'),),
+        characters=frozenset('æøå'),
+        street_words=('gata', 'gaten', 'veien', 'vegen', 'allé'),
+    ),
+    CountrySignals(
+        code='fi',
+        names=frozenset({'finland', 'suomi', 'fi', 'fin'}),
+        postal_codes=(postal(r'\d{5}'),),
+        characters=frozenset('äö'),
+        street_words=('katu', 'tie', 'kuja', 'polku'),
+    ),
+    CountrySignals(
+        code='de',
+        names=frozenset({'germany', 'deutschland', 'de', 'deu'}),
+        postal_codes=(postal(r'\d{5}'),),
+        characters=frozenset('äöüß'),
+        street_words=('straße', 'strasse', 'str.', 'platz', 'weg', 'gasse', 'allee'),
+    ),
+    CountrySignals(
+        code='nl',
+        names=frozenset({'netherlands', 'nederland', 'nl', 'nld'}),
+        postal_codes=(postal(r'\d{4} ?[A-Z]{2}', 2),),
+        street_words=('straat', 'laan', 'plein', 'gracht', 'weg'),
+    ),
+    CountrySignals(
+        code='fr',
+        names=frozenset({'france', 'fr', 'fra'}),
+        postal_codes=(postal(r'\d{5}'),),
+        characters=frozenset('àâçèéêëîïôœùûÿ'),
+        street_words=('rue', 'avenue', 'boulevard', 'place', 'quai', 'élysées'),
+    ),
+    CountrySignals(
+        code='es',
+        names=frozenset({'spain', 'españa', 'espana', 'es', 'esp'}),
+        postal_codes=(postal(r'\d{5}'),),
+        characters=frozenset('áéíñóú¿¡'),
+        street_words=('calle', 'avenida', 'plaza', 'paseo', 'carrer'),
+    ),
+    CountrySignals(
+        code='pt',
+        names=frozenset({'portugal', 'brazil', 'brasil', 'pt', 'prt', 'br', 'bra'}),
+        postal_codes=(postal(r'\d{4}-\d{3}', 2), postal(r'\d{5}-\d{3}', 2)),
+        characters=frozenset('ãõçáéíóúâêô'),
+        street_words=('rua', 'avenida', 'praça', 'travessa', 'largo'),
+    ),
+    CountrySignals(
+        code='it',
+        names=frozenset({'italy', 'italia', 'ita'}),
+        postal_codes=(postal(r'\d{5}'),),
+        characters=frozenset('àèéìòù'),
+        street_words=('via', 'viale', 'piazza', 'corso', 'vicolo'),
+    ),
+    CountrySignals(
+        code='pl',
+        names=frozenset({'poland', 'polska', 'pl', 'pol'}),
+        postal_codes=(postal(r'\d{2}-\d{3}', 2),),
+        characters=frozenset('ąćęłńóśźż'),
+        street_words=('ulica', 'ul.', 'aleja', 'al.', 'plac'),
+    ),
+    CountrySignals(
+        code='en',
+        names=frozenset({
+            'united states', 'united states of america', 'usa', 'us', 'united kingdom', 'uk', 'gb', 'gbr',
+            'england', 'scotland', 'wales', 'ireland', 'australia', 'aus', 'canada', 'can', 'new zealand', 'nz'
+        }),
+        postal_codes=(
+            postal(r'\d{5}-\d{4}', 2),
+            postal(r'[A-Z]{1,2}\d[A-Z\d]? \d[A-Z]{2}', 2),
+            postal(r'[A-Z]\d[A-Z] \d[A-Z]\d', 2),
+        ),
+        street_words=('street', 'st', 'st.', 'road', 'rd', 'rd.', 'avenue', 'ave', 'ave.', 'lane', 'drive', 'dr.'),
+    ),
+    CountrySignals(
+        code='ja',
+        names=frozenset({'japan', 'nippon', 'jp', 'jpn'}),
+        postal_codes=(postal(r'\d{3}-\d{4}', 2),),
+        street_words=('chome', 'chome-'),
+    ),
+)
+
+
+class CountryDetector:
+    """
+    Detects the country of an address from cheap signals, with langdetect as a fallback.
+
+    The signals are tried in order of cost:
+
+        1. A country name or ISO code ending the address decides the country.
+        2. Postal code patterns, typical letters and typical street words add to the score of each country. The
+           country with the highest score is used if the score is at least MIN_SCORE and no other country has the
+           same score.
+        3. Otherwise langdetect is asked, seeded so the result is the same on every run.
+
+    Results are cached by the normalized suffix of the address, the last suffix_words words in lower case with
+    every digit replaced by 0, so addresses ending in the same postal code pattern and city skip detection.
+
+    Attributes:
+
+        signals: the CountrySignals of all known countries.
+        cache_size: the number of suffixes that are cached.
+        suffix_words: the number of words in a cache key.
+        seed: the seed of langdetect.
+        default: the code returned when nothing can be detected.
+    """
+
+    def __init__(
+            self,
+            signals: Iterable[CountrySignals] = SIGNALS,
+            cache_size: int = 10000,
+            suffix_words: int = 2,
+            seed: int = 0,
+            default: str = DEFAULT_COUNTRY
+    ):
+        self.log = logging.getLogger(__name__)
+        self.signals = tuple(signals)
+        self.cache_size = cache_size
+        self.suffix_words = suffix_words
+        self.seed = seed
+        self.default = default
+
+        self.names: Dict[str, str] = {name: s.code for s in self.signals for name in s.names}
+        self.longest_name = max((len(WORD.findall(name)) for name in self.names), default=1)
+        self.street_words = [
+            (frozenset(s.street_words), tuple(w for w in s.street_words if len(w) >= MIN_SUFFIX_LENGTH))
+            for s in self.signals
+        ]
+
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def detect(self, input_address: str, country_hint: Optional[str] = None) -> str:
+        """
+        Return the country code of an address.
+
+        :param input_address: The address.
+        :param country_hint: A known country code. It is returned as is and no detection is done.
+        :return: The country code.
+        """
+
+        if country_hint:
+            if instruments.enabled:
+                instruments.increment('country_detections_total', 1, (('method', 'hint'),))
+            return country_hint
+
+        key = self.suffix(input_address)
+        with self._lock:
+            code = self._cache.get(key)
+            if code is not None:
+                self._cache.move_to_end(key)
+        if code is not None:
+            if instruments.enabled:
+                instruments.increment('cache_lookups_total', 1, (('cache', 'country'), ('result', 'hit')))
+                instruments.increment('country_detections_total', 1, (('method', 'cache'),))
+            return code
+
+        code = self.from_signals(input_address)
+        method = 'signals'
+        if code is None:
+            code = self.from_language(input_address)
+            method = 'langdetect'
+
+        if instruments.enabled:
+            instruments.increment('cache_lookups_total', 1, (('cache', 'country'), ('result', 'miss')))
+            instruments.increment('country_detections_total', 1, (('method', method),))
+
+        with self._lock:
+            self._cache[key] = code
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return code
+
+    def suffix(self, input_address: str) -> str:
+        words = WORD.findall(input_address.lower())
+        return DIGITS.sub('0', ' '.join(words[-self.suffix_words:]))
+
+    def from_signals(self, input_address: str) -> Optional[str]:
+        """
+        Return the country code decided by the signals or None if they are not conclusive.
+        """
+
+        words = PUNCTUATION.sub(' ', input_address).split()
+        for size in range(min(self.longest_name, len(words)), 0, -1):
+            ending = words[-size:]
+            name = ' '.join(ending).lower()
+            # Two and three letter codes only count in upper case, so words like "de" are not mistaken for them.
+            if name in self.names and (len(name) > 3 or ending[0].isupper()):
+                return self.names[name]
+
+        lower = input_address.lower()
+        characters = set(lower)
+        lower_words = lower.replace(',', ' ').split()
+        scores: Dict[str, int] = {}
+        for signals, (exact, endings) in zip(self.signals, self.street_words):
+            score = CHARACTER_SCORE * len(characters & signals.characters)
+            for pattern, postal_score in signals.postal_codes:
+                if pattern.search(input_address):
+                    score += postal_score
+                    break
+            if any(w in exact or (endings and w.endswith(endings)) for w in lower_words):
+                score += STREET_WORD_SCORE
+            if score:
+                scores[signals.code] = max(score, scores.get(signals.code, 0))
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked and ranked[0][1] >= MIN_SCORE and (len(ranked) == 1 or ranked[0][1] > ranked[1][1]):
+            self.log.debugx('Detected "%s" from signals with the scores %s.', ranked[0][0], ranked[:3])
+            return ranked[0][0]
+        return None
+
+    def from_language(self, input_address: str) -> str:
+        """
+        Detect the language of the address with a seeded langdetect, or return the default if it fails.
+        """
+
+        from langdetect import DetectorFactory, detect
+        from langdetect.lang_detect_exception import LangDetectException
+
+        DetectorFactory.seed = self.seed
+        try:
+            return detect(input_address)
+        except LangDetectException:
+            self.log.debug('Unable to detect the language of "%s", using "%s".', input_address, self.default)
+            return self.default
+
+
+_detector = CountryDetector()
+
+
+def detect_country(input_address: str, country_hint: Optional[str] = None) -> str:
+    """
+    Return the country code of an address, using the shared CountryDetector.
+    """
+    return _detector.detect(input_address, country_hint)
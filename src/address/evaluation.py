@@ -0,0 +1,179 @@
+import threading
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import AddressComponentType
+from .country import CountryConfig
+from .features import TokenFeatures
+from .heuristics import HeuristicDefinition, HeuristicPlan, BOOL, COUNT, DISTANCE
+
+__all__ = [
+    'VectorizedEvaluator'
+]
+
+
+class VectorizedEvaluator:
+    """
+    Evaluates all tokens of an address against all component types at once.
+
+    The heuristic plans of every component type are laid out as columns of one table. The table is evaluated against a
+    TokenFeatures matrix with array operations, so no Python code runs per token and component type. For each pair
+    the result is the same as from HeuristicPlan.evaluate:
+
+        The scores of passing heuristics are multiplied into a confidence and the scores of failing heuristics into a
+        no confidence. If the no confidence is higher and some heuristic failed, the result is False with the
+        difference as confidence. If the confidence is higher and some heuristic passed, the result is True with the
+        difference as confidence. Anything else is inconclusive, which is reported as False with a confidence of 0.
+
+    Attributes:
+
+        component_types: the component types in the order of the result columns.
+
+    Methods:
+
+        for_country: return the cached evaluator for a country configuration.
+        evaluate: evaluate a TokenFeatures matrix.
+    """
+
+    _cache: Dict[str, Tuple[str, 'VectorizedEvaluator']] = {}
+    _lock = threading.Lock()
+
+    def __init__(
+            self,
+            country_config: CountryConfig,
+            definitions: Mapping[AddressComponentType, Sequence[HeuristicDefinition]] = None
+    ):
+        """
+        Compile the heuristic plans of a country into columns.
+
+        :param country_config: The configuration providing multipliers and expected positions.
+        :param definitions: Heuristic definitions per component type. Defaults to the rules of the country.
+        """
+
+        self.component_types = tuple(AddressComponentType)
+        plans = HeuristicPlan.for_country(country_config, definitions)
+
+        kinds, features, operations, values, multipliers, guards, starts, present = [], [], [], [], [], [], [], []
+        for type_index, component_type in enumerate(self.component_types):
+            records = plans[component_type].records
+            if not records:
+                continue
+
+            starts.append(len(kinds))
+            present.append(type_index)
+            for kind, feature, operation, value, multiplier, guard in records:
+                kinds.append(kind)
+                features.append(feature)
+                operations.append(operation)
+                values.append(np.nan if value is None else value)
+                multipliers.append(multiplier)
+                guards.append(guard)
+
+        self.features = np.asarray(features, dtype=np.intp)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.multipliers = np.asarray(multipliers, dtype=np.float64)
+        self.starts = np.asarray(starts, dtype=np.intp)
+        self.present = np.asarray(present, dtype=np.intp)
+
+        kinds = np.asarray(kinds)
+        self.distances = np.flatnonzero(kinds == DISTANCE)
+        self.counts = np.flatnonzero(kinds == COUNT)
+        self.count_targets = ~np.isnan(self.values[self.counts])
+
+        # Bool heuristics are grouped by operation so each operation is applied to all of its columns at once.
+        self.bools: List[Tuple] = []
+        bool_columns = np.flatnonzero(kinds == BOOL)
+        for operation in dict.fromkeys(operations[c] for c in bool_columns):
+            columns = np.asarray([c for c in bool_columns if operations[c] is operation], dtype=np.intp)
+            self.bools.append((operation, columns, self.values[columns]))
+
+        guards = np.asarray(guards, dtype=np.intp)
+        self.guarded = np.flatnonzero(guards >= 0)
+        self.guard_features = guards[self.guarded]
+
+    @classmethod
+    def for_country(cls, country_config: CountryConfig) -> 'VectorizedEvaluator':
+        """
+        Return the evaluator for a country, compiling it only once for each version of the country configuration.
+        """
+
+        cached = cls._cache.get(country_config.country_code)
+        if cached is not None and cached[0] == country_config.fingerprint:
+            return cached[1]
+
+        with cls._lock:
+            evaluator = cls(country_config)
+            cls._cache[country_config.country_code] = (country_config.fingerprint, evaluator)
+            return evaluator
+
+    def evaluate(self, token_features: TokenFeatures) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate every token against every component type.
+
+        :param token_features: The features of the tokens.
+        :return: A tuple of a boolean matrix with the results and a float matrix with the confidences. Both have one row
+        per token and one column per entry in component_types.
+        """
+
+        matrix = token_features.matrix
+        token_count = matrix.shape[0]
+        results = np.zeros((token_count, len(self.component_types)), dtype=bool)
+        confidences = np.zeros((token_count, len(self.component_types)), dtype=np.float64)
+        if token_count == 0 or len(self.starts) == 0:
+            return results, confidences
+
+        x = matrix[:, self.features]
+        passed = np.ones(x.shape, dtype=bool)
+        scores = np.empty(x.shape, dtype=np.float64)
+
+        for operation, columns, values in self.bools:
+            passed[:, columns] = operation(x[:, columns], values)
+            scores[:, columns] = self.multipliers[columns]
+
+        if len(self.counts):
+            count = x[:, self.counts]
+            passed[:, self.counts] = count > 0
+            count = np.where(self.count_targets, np.abs(count - self.values[self.counts]), count)
+            scores[:, self.counts] = 1 + count * self.multipliers[self.counts]
+
+        if len(self.distances):
+            distance = np.abs(x[:, self.distances] - self.values[self.distances])
+            scores[:, self.distances] = 1 / (distance * self.multipliers[self.distances] + 1)
+
+        applies = np.ones(x.shape, dtype=bool)
+        if len(self.guarded):
+            applies[:, self.guarded] = matrix[:, self.guard_features] != 0
+
+        failed = ~passed & applies
+        passed &= applies
+
+        confidence = np.multiply.reduceat(np.where(passed, scores, 1.0), self.starts, axis=1)
+        no_confidence = np.multiply.reduceat(np.where(failed, scores, 1.0), self.starts, axis=1)
+        any_passed = np.logical_or.reduceat(passed, self.starts, axis=1)
+        any_failed = np.logical_or.reduceat(failed, self.starts, axis=1)
+
+        is_false = (no_confidence > confidence) & any_failed
+        is_true = (confidence > no_confidence) & any_passed & ~is_false
+
+        if instruments.enabled:
+            self.instrument(token_count, ~(is_true | is_false))
+
+        results[:, self.present] = is_true
+        confidences[:, self.present] = np.where(
+            is_false, no_confidence - confidence, np.where(is_true, confidence - no_confidence, 0.0))
+
+        return results, confidences
+
+    def instrument(self, token_count: int, inconclusive: np.ndarray) -> None:
+        """
+        Count the heuristics that were evaluated and the inconclusive tokens of each component type.
+        """
+
+        records = np.diff(np.append(self.starts, len(self.features)))
+        counts = inconclusive.sum(axis=0)
+        for column, type_index in enumerate(self.present.tolist()):
+            labels = (('component_type', self.component_types[type_index].name),)
+            instruments.increment('heuristics_evaluated_total', token_count * int(records[column]), labels)
+            instruments.increment('inconclusive_evaluations_total', int(counts[column]), labels)
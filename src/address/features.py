@@ -0,0 +1,91 @@
+from typing import Callable, Dict, Sequence
+
+import numpy as np
+
+__all__ = [
+    'FEATURES',
+    'FEATURE_NAMES',
+    'TokenFeatures',
+    'token_features'
+]
+
+
+def balance(token: str, matches: int) -> int:
+    """
+    Count one up for each matching character and one down for each other character, see HeuristicDefinition.
+    """
+    return 2 * matches - len(token)
+
+
+# Features computed from the text of a token. The position of the token is added as the first feature.
+FEATURES: Dict[str, Callable[[str], float]] = {
+    'length': len,
+    'is_digit': str.isdigit,
+    'is_alpha': str.isalpha,
+    'first_is_upper': lambda token: token[:1].isupper(),
+    'first_is_alpha': lambda token: token[:1].isalpha(),
+    'last_is_alpha': lambda token: token[-1:].isalpha(),
+    'starts_with_lgh': lambda token: token.lower().startswith('lgh'),
+    'number': lambda token: float(token) if token.isdecimal() else 0,
+    'slash_count': lambda token: balance(token, token.count('/')),
+    'hyphen_count': lambda token: balance(token, token.count('-')),
+    'alpha_count': lambda token: balance(token, sum(c.isalpha() for c in token)),
+}
+
+FEATURE_NAMES = ('position',) + tuple(FEATURES)
+
+
+def token_features(token: str, position: int) -> tuple:
+    """
+    Compute the features of a single token, in the order of FEATURE_NAMES.
+    """
+    return (position, *[function(token) for function in FEATURES.values()])
+
+
+class TokenFeatures:
+    """
+    Matrix with one row per token and one column per feature in FEATURE_NAMES.
+
+    The features are computed once per token and shared by the heuristics of all component types. Feature matrices of
+    several addresses can be stacked into one with concatenate and evaluated together.
+
+    Attributes:
+
+        matrix: a float matrix of shape (tokens, features).
+    """
+
+    __slots__ = ('matrix',)
+
+    COLUMNS = {name: column for column, name in enumerate(FEATURE_NAMES)}
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[str], positions: Sequence[int]) -> 'TokenFeatures':
+        """
+        Compute the features of tokens.
+
+        :param tokens: The text of the tokens.
+        :param positions: The position of each token in its address.
+        :return: The TokenFeatures of the tokens.
+        """
+
+        count = len(tokens)
+        matrix = np.empty((count, len(FEATURE_NAMES)), dtype=np.float64)
+        matrix[:, 0] = np.asarray(positions, dtype=np.float64)
+        for column, function in enumerate(FEATURES.values(), start=1):
+            matrix[:, column] = np.fromiter(map(function, tokens), dtype=np.float64, count=count)
+        return cls(matrix)
+
+    @classmethod
+    def concatenate(cls, features: Sequence['TokenFeatures']) -> 'TokenFeatures':
+        if not features:
+            return cls(np.empty((0, len(FEATURE_NAMES)), dtype=np.float64))
+        return cls(np.concatenate([f.matrix for f in features]))
+
+    def column(self, name: str) -> np.ndarray:
+        return self.matrix[:, self.COLUMNS[name]]
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
@@ -1,170 +1,179 @@
-import logging
-import math
-from typing import List, Tuple, Optional
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, NamedTuple, Sequence, Tuple, Optional
 
-from src.exceptions import InconclusiveEvaluationException, ComponentEvaluationException
+from .component import AddressComponentType
+from .features import FEATURE_NAMES
 
+if TYPE_CHECKING:
+    from .country import CountryConfig
+    from .rules import RuleSet
 
-class AddressHeuristics:
-    """
-    This class contains heuristics used to evaluate whether a token matches certain patterns.
-    The heuristics can be added using the add_bool, add_count, and add_distance methods.
-    The evaluate method applies all heuristics to the input and calculates a confidence score based on how
-    many of the heuristics matched the input. If no heuristics match the input, the method raises an
-    InconclusiveEvaluationException.
+BOOL = 'bool'
+COUNT = 'count'
+DISTANCE = 'distance'
 
-    Attributes:
 
-        log: a logging instance.
-        heuristics: a list to store the heuristics to be evaluated.
+class HeuristicDefinition(NamedTuple):
+    """
+    Declarative description of a single heuristic, evaluated against one feature of a token.
 
-    Methods:
+    The kinds of heuristics:
 
-        add_bool: add a boolean check to the heuristics list.
-        add_count: add a count check to the heuristics list.
-        add_distance: add a distance check to the heuristics list.
-        evaluate: evaluate a single token using all heuristics in the list.
+        bool: operation(feature, value) decides the result, the score is the multiplier.
+        count: the feature is a count that was increased for each matching and decreased for each other character.
+            The result is whether it is positive. The score is 1 + count * multiplier, where count is replaced by
+            its distance to value if a value is given.
+        distance: always passes with the score 1 / (|feature - value| * multiplier + 1). Without a value the
+            expected position of the component type in the country configuration is used.
 
-    Exceptions:
+    Attributes:
 
-        InconclusiveEvaluationException: raised when no heuristics match the input.
-        ComponentEvaluationException: raised when an error occurs during heuristic evaluation.
+        kind: one of BOOL, COUNT and DISTANCE.
+        option: the option in the AddressHeuristics.<component> section holding the multiplier. The heuristic is not
+            used if the option is not configured.
+        feature: the name of the token feature the heuristic reads.
+        operation: comparison used by bool heuristics.
+        value: the value compared with, or the target of count and distance heuristics.
+        multiplier: a fixed multiplier, used for heuristics without an option.
+        guard: the name of a feature that has to be true for the heuristic to apply to a token.
     """
-    def __init__(self):
-        """
-        Initializes an instance of the AddressHeuristics class.
-        """
+    kind: str
+    option: Optional[str]
+    feature: str
+    operation: Optional[Callable] = None
+    value: Optional[float] = None
+    multiplier: Optional[float] = None
+    guard: Optional[str] = None
 
-        self.log = logging.getLogger(__name__)
-        self.heuristics = []
 
-    def add(self, heuristic_type, **kwargs):
-        func = getattr(self, f'add_{heuristic_type}', 'add_bool')
-        func(**kwargs)
-
-    def add_bool(self, **kwargs) -> None:
-        """
-        Adds a boolean heuristic function to the heuristics list.
+class HeuristicPlan:
+    """
+    The heuristics of one component type, compiled for one country.
 
-        Args:
-            kwargs: keyword arguments representing the function parameters.
+    Each HeuristicDefinition that is configured for the country becomes a record of
+    (kind, feature, operation, value, multiplier, guard), where feature and guard are column indexes into
+    FEATURE_NAMES (guard is -1 without a guard), the multiplier is a float and the value of distance heuristics is
+    already resolved to the expected position. The records are compiled into a Python function by rules.RuleSet, so
+    evaluating a token is a single call.
 
-        Returns:
-            None.
-        """
+    Attributes:
 
-        def function() -> Tuple:
-            return kwargs.get('operation')(*kwargs.get('values')), float(kwargs.get('multiplier'))
+        component_type: the AddressComponentType the plan evaluates.
+        records: the compiled heuristics, in definition order.
+        function: the compiled records, called by evaluate.
 
-        self.log.trace(f"Add boolean check for: {kwargs.get('operation')}. \nUsing values: {kwargs.get('values')}"
-                       f"\nMultiplier is set to: {kwargs.get('multiplier')}")
-        self.heuristics.append(function)
+    Methods:
 
-    def add_count(self, **kwargs) -> None:
+        compile: compile the definitions of a component type for a country.
+        for_country: return the cached plans of all component types for a country.
+        evaluate: evaluate the features of a single token.
+    """
 
+    __slots__ = ('component_type', 'records', 'function')
+
+    _cache: Dict[str, Tuple[str, Dict[AddressComponentType, 'HeuristicPlan']]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, component_type: AddressComponentType, records: Sequence[Tuple], function: Callable = None):
+        self.component_type = component_type
+        self.records = tuple(records)
+        if function is None:
+            from .rules import RuleSet
+            function = RuleSet.compile({component_type: self.records}).functions[component_type]
+        self.function = function
+
+    @classmethod
+    def compile(
+            cls,
+            component_type: AddressComponentType,
+            definitions: Sequence[HeuristicDefinition],
+            country_config: 'CountryConfig'
+    ) -> 'HeuristicPlan':
         """
-        Adds a count heuristic function to the heuristics list.
+        Compile heuristic definitions with the multipliers and positions of a country.
 
-        Args:
-            kwargs: keyword arguments representing the function parameters.
-
-        Returns:
-            None.
+        :param component_type: The component type the definitions belong to.
+        :param definitions: The heuristic definitions.
+        :param country_config: The configuration providing multipliers and expected positions.
+        :return: The compiled HeuristicPlan.
         """
 
-        def function() -> Tuple:
-            count = 0
-            for v in kwargs.get('list'):
-                if 'values' in kwargs.keys():
-                    v = [v] + [w for w in kwargs.get('values')]
-                if kwargs.get('operation')(*v):
-                    count += 1
-                else:
-                    count -= 1
-
-            result = (count > 0)
-            if 'target' in kwargs.keys():
-                count = math.sqrt(math.pow((count - kwargs.get('target')), 2))
-
-            score = 1 + (count * float(kwargs.get('multiplier')))
-
-            return result, score
-
-        msg = f"Add count check for: {kwargs.get('list')}. " \
-              f"\nChecking if each value is: {kwargs.get('operation')}. " \
-              f"\nUsing values: {kwargs.get('values')}" \
-              f"\nMultiplier for check is: {kwargs.get('multiplier')}"
-
-        if 'target' in kwargs.keys():
-            msg += f"\nTarget: {kwargs.get('target')}"
-
-        self.log.trace(msg)
+        return cls(component_type, cls.records_for(component_type, definitions, country_config))
 
-        self.heuristics.append(function)
-
-    def add_distance(self, **kwargs) -> None:
+    @staticmethod
+    def records_for(
+            component_type: AddressComponentType,
+            definitions: Sequence[HeuristicDefinition],
+            country_config: 'CountryConfig'
+    ) -> List[Tuple]:
         """
-        Adds a distance heuristic function to the heuristics list.
-
-        Args:
-            kwargs: keyword arguments representing the function parameters.
-
-        Returns:
-            None.
+        Return the records of the definitions that are configured for a country, see compile.
         """
 
-        def function() -> Tuple:
-            count = math.sqrt(math.pow(kwargs.get('count') - kwargs.get('target'), 2))
-            score = 1 / (count * float(kwargs.get('multiplier')) + 1)
-            return True, score
-
-        self.log.trace(f"Add distance check between {kwargs.get('count')} and {kwargs.get('target')}. "
-                       f"Multiplier is: {kwargs.get('multiplier')}")
-        self.heuristics.append(function)
-
-    def evaluate(self, **kwargs) -> Tuple[bool, float]:
+        records = []
+        for definition in definitions:
+            multiplier = definition.multiplier
+            if definition.option is not None:
+                multiplier = country_config.multiplier(component_type.name, definition.option)
+
+            value = definition.value
+            if definition.kind == DISTANCE and value is None:
+                value = country_config.positions.get(component_type)
+
+            if multiplier is None or (definition.kind == DISTANCE and value is None):
+                continue
+
+            records.append((
+                definition.kind,
+                FEATURE_NAMES.index(definition.feature),
+                definition.operation,
+                None if value is None else float(value),
+                float(multiplier),
+                -1 if definition.guard is None else FEATURE_NAMES.index(definition.guard)
+            ))
+
+        return records
+
+    @classmethod
+    def for_country(
+            cls,
+            country_config: 'CountryConfig',
+            definitions: Mapping[AddressComponentType, Sequence[HeuristicDefinition]] = None,
+            rule_set: 'RuleSet' = None
+    ) -> Dict[AddressComponentType, 'HeuristicPlan']:
+        """
+        Return the plans of all component types for a country, compiled once for each version of its configuration.
+        The functions of the plans are compiled together, see RuleSet.for_country, unless the rules were already
+        compiled into rule_set, like the ones of a CountryPack. Plans for other definitions than the rules of the
+        country are compiled on every call.
         """
-        Evaluate a single token using all heuristics.
 
-        Args:
-        token (str): The token to evaluate.
-        position (int): The position of the token in the input.
+        if definitions is not None:
+            return {ct: cls.compile(ct, definitions.get(ct, []), country_config) for ct in AddressComponentType}
+
+        cached = cls._cache.get(country_config.country_code)
+        if cached is not None and cached[0] == country_config.fingerprint:
+            return cached[1]
+
+        from .rules import RuleSet
+        with cls._lock:
+            records = {
+                ct: cls.records_for(ct, country_config.rules.get(ct, ()), country_config) for ct in AddressComponentType
+            }
+            if rule_set is None:
+                rule_set = RuleSet.for_country(country_config, records)
+            plans = {ct: cls(ct, records[ct], rule_set.functions[ct]) for ct in AddressComponentType}
+            cls._cache[country_config.country_code] = (country_config.fingerprint, plans)
+            return plans
+
+    def evaluate(self, token_features: Sequence[float]) -> Tuple[bool, float]:
+        """
+        Evaluate a single token.
 
-        Returns:
-        A tuple of a boolean indicating whether the token matches the heuristics and a float indicating the confidence in the match.
+        :param token_features: The features of the token, in the order of FEATURE_NAMES.
+        :return: A tuple of a boolean indicating whether the token matches the component type and a float indicating the
+        confidence in the match.
+        :raises InconclusiveEvaluationException: If neither the passing nor the failing heuristics are decisive.
         """
-        self.log.trace(f'Checking {len(self.heuristics)} heuristics.')
-
-        confidence_set = []
-        no_confidence_set = []
-        confidence = 1.0
-        no_confidence = 1.0
-        for heuristic in self.heuristics:
-            try:
-                result, score = heuristic(**kwargs)
-                if result:
-                    confidence *= score
-                    confidence_set.append(True)
-                else:
-                    no_confidence *= score
-                    no_confidence_set.append(True)
-            except TypeError as e:
-                self.log.warning(f'Confidence: {confidence}')
-                self.log.warning(f'No Confidence: {no_confidence}')
-                self.log.warning(f'Confidence is set: {confidence_set}')
-                self.log.warning(f'Confidence: {no_confidence_set}')
-                self.log.warning(f'Heuristic: {heuristic}')
-                raise ComponentEvaluationException from e
-
-        diff = no_confidence - confidence
-
-        if no_confidence > confidence and any(no_confidence_set):
-            self.log.debugx(f'Tests failed with confidence: {no_confidence}')
-            return False, diff
-        elif confidence > no_confidence and any(confidence_set):
-            self.log.debugx(f'Tests passed with confidence: {confidence}')
-            return True, -diff
-        else:
-            self.log.debugx(f'Tests were inconclusive.')
-            raise InconclusiveEvaluationException(f'Unable to determine if "{kwargs.get("token")}" matches any heuristic')
 
+        return self.function(token_features)
@@ -1,6 +1,216 @@
-import spacy
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.instrumentation import instruments
+from .component import AddressComponent, AddressComponentType
+from .country import CountryConfig, load_country_config
+from .decoder import ComponentDecoder, Labeling
+from .detection import SIGNALS
+from .normalizer import AbbreviationNormalizer
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from spacy.tokens import Span
+
+__all__ = [
+    'ENTITY_TYPES',
+    'EntityType',
+    'MLAddressParser',
+    'load_model'
+]
+
+DEFAULT_MODEL = 'en_core_web_sm'
+
+# Pipeline components that named entity recognition does not need. They are not loaded at all.
+EXCLUDED_COMPONENTS = ('parser', 'tagger', 'lemmatizer', 'attribute_ruler', 'senter', 'morphologizer')
+
+
+class EntityType(NamedTuple):
+    """
+    How an entity label of the model is turned into an address component.
+
+    Attributes:
+
+        component_type: the component type of the entity.
+        confidence: the confidence of a component found this way. The small pipelines do not expose entity
+            probabilities, so every label has a fixed confidence.
+        numeric_type: the component type used instead if the entity is a number of at least four digits, e.g. a
+            postal code.
+        country_type: the component type used instead if the entity is the name of a country.
+    """
+    component_type: AddressComponentType
+    confidence: float
+    numeric_type: Optional[AddressComponentType] = None
+    country_type: Optional[AddressComponentType] = None
+
+
+ENTITY_TYPES: Dict[str, EntityType] = {
+    'GPE': EntityType(AddressComponentType.CITY, 0.9, country_type=AddressComponentType.COUNTRY),
+    'LOC': EntityType(AddressComponentType.STATE, 0.6, country_type=AddressComponentType.COUNTRY),
+    'FAC': EntityType(AddressComponentType.STREET_NAME, 0.85, numeric_type=AddressComponentType.STREET_NUMBER),
+    'ORG': EntityType(AddressComponentType.BUILDING, 0.5),
+    'PERSON': EntityType(AddressComponentType.CO, 0.5),
+    'CARDINAL': EntityType(AddressComponentType.STREET_NUMBER, 0.8, numeric_type=AddressComponentType.POSTAL_CODE),
+    'DATE': EntityType(AddressComponentType.STREET_NUMBER, 0.4, numeric_type=AddressComponentType.POSTAL_CODE),
+}
+
+COUNTRY_NAMES = frozenset(name for signals in SIGNALS for name in signals.names if len(name) > 3)
+
+# (model name, excluded components) -> the loaded model, shared by all parsers of the process.
+_models: Dict[Tuple[str, Tuple[str, ...]], 'Language'] = {}
+_models_lock = threading.Lock()
+
+
+def load_model(name: str = DEFAULT_MODEL, exclude: Sequence[str] = EXCLUDED_COMPONENTS) -> 'Language':
+    """
+    Return the spaCy model of the process, loading it the first time it is asked for.
+    """
+
+    key = (name, tuple(exclude))
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            # spaCy takes seconds to import, so it is only imported when a model is needed.
+            import spacy
+
+            with instruments.stage('load_model'):
+                model = spacy.load(name, exclude=list(exclude))
+            logging.getLogger(__name__).info(f'Loaded the spaCy model "{name}" with the pipeline {model.pipe_names}.')
+            _models[key] = model
+        return model
 
 
 class MLAddressParser:
-    def __init__(self):
-        self.nlp = spacy.load('en_core_web_sm')
+    """
+    Parses addresses with the named entity recognizer of a spaCy model.
+
+    The model is loaded once per process and shared by all parsers, see load_model. Addresses are normalized like
+    in AddressParser, and every entity the model finds is turned into an AddressComponent with the mapping in
+    ENTITY_TYPES. The position of a component is the index of its first word, like in AddressParser.
+
+    Attributes:
+
+        country_config: the configuration of the country the parser is for.
+        nlp: the shared spaCy model.
+        entity_types: the mapping from entity labels to component types.
+        batch_size: the number of addresses the model processes together by default.
+        n_process: the number of processes spaCy uses by default.
+    """
+
+    def __init__(
+            self,
+            country_config: CountryConfig = None,
+            model: str = DEFAULT_MODEL,
+            entity_types: Dict[str, EntityType] = None,
+            batch_size: int = 256,
+            n_process: int = 1
+    ):
+        """
+        :param country_config: The configuration of the country to parse addresses for. Defaults to the default
+        country configuration.
+        :param model: The name of the spaCy model.
+        :param entity_types: The mapping from entity labels to component types. Defaults to ENTITY_TYPES.
+        :param batch_size: The number of addresses the model processes together by default.
+        :param n_process: The number of processes spaCy uses by default. spaCy starts them again for every call of
+        parse_many and parse_batch, so more than one only pays off for long streams.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.country_config = country_config or load_country_config('default')
+        self.normalizer = AbbreviationNormalizer.for_country(self.country_config)
+        self.decoder = ComponentDecoder.for_country(self.country_config)
+        self.nlp = load_model(model)
+        self.entity_types = ENTITY_TYPES if entity_types is None else entity_types
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    def parse_address(self, input_address: str) -> List[AddressComponent]:
+        """
+        Parses an input address string and returns a list of AddressComponent objects.
+
+        :param input_address: A string representing the input address to be parsed.
+        :return: A list of AddressComponent objects.
+        """
+
+        with instruments.stage('parse_address_ml'):
+            return self.create_address_components(self.nlp(self.normalizer.normalize(input_address)))
+
+    def parse_many(
+            self,
+            input_addresses: Iterable[str],
+            batch_size: int = None,
+            n_process: int = None
+    ) -> Iterator[List[AddressComponent]]:
+        """
+        Parses several input address strings with nlp.pipe, yielding the components of each in input order. The
+        input is consumed lazily.
+
+        :param input_addresses: An iterable of strings representing the input addresses to be parsed.
+        :param batch_size: The number of addresses the model processes together. Defaults to batch_size of the parser.
+        :param n_process: The number of processes spaCy uses. Defaults to n_process of the parser.
+        :return: An iterator over lists of AddressComponent objects.
+        """
+
+        normalized = (self.normalizer.normalize(a) for a in input_addresses)
+        for doc in self.nlp.pipe(normalized, batch_size=batch_size or self.batch_size,
+                                 n_process=n_process or self.n_process):
+            yield self.create_address_components(doc)
+
+    def parse_batch(self, input_addresses: Sequence[str]) -> List[List[AddressComponent]]:
+        """
+        Parses a batch of input address strings with the batch_size and n_process of the parser, see parse_many.
+        """
+
+        with instruments.stage('parse_batch_ml'):
+            return list(self.parse_many(input_addresses))
+
+    def resolve_conflicts(self, components: List[AddressComponent]) -> List[AddressComponent]:
+        """
+        Chooses the best consistent components of an address, see AddressParser.resolve_conflicts.
+        """
+
+        return list(self.decoder.decode(components)[0].components)
+
+    def generate_possible_addresses(self, components: List[AddressComponent], k: int = 5) -> List[Labeling]:
+        return self.decoder.decode(components, k)
+
+    def rank_possible_addresses(self, labelings: Sequence[Labeling]) -> List[Labeling]:
+        return self.decoder.rank(labelings)
+
+    def create_address_components(self, doc) -> List[AddressComponent]:
+        """
+        Creates an AddressComponent for every entity of a parsed document that has a component type.
+        """
+
+        components = []
+        for ent in doc.ents:
+            component = self.create_address_component(ent, doc.text)
+            if component is not None:
+                components.append(component)
+        return components
+
+    def create_address_component(self, ent: 'Span', text: str) -> Optional[AddressComponent]:
+        entity_type = self.entity_types.get(ent.label_)
+        if entity_type is None:
+            return None
+
+        value = ent.text
+        component_type = entity_type.component_type
+        digits = value.replace(' ', '')
+        if entity_type.numeric_type is not None and digits.isdigit() and len(digits) >= 4:
+            component_type = entity_type.numeric_type
+        elif entity_type.country_type is not None and value.lower() in COUNTRY_NAMES:
+            component_type = entity_type.country_type
+
+        return AddressComponent(
+            component_type=component_type,
+            component_value=value,
+            position=len(text[:ent.start_char].split()),
+            confidence=entity_type.confidence
+        )
+
@@ -0,0 +1,113 @@
+import re
+import threading
+from typing import Dict, Mapping, Optional, Pattern, Tuple
+
+from .country import CountryConfig
+
+__all__ = [
+    'AbbreviationNormalizer'
+]
+
+
+class AbbreviationNormalizer:
+    """
+    Replaces abbreviations with their full forms in a single left to right pass over the input.
+
+    All abbreviations of a country are compiled into one regular expression. The alternatives are arranged as a trie,
+    so abbreviations sharing a prefix share the same branch and the cost of a match depends on the length of the
+    abbreviation rather than on the number of abbreviations. The longest abbreviation matching at a position wins, so
+    "g." is preferred over "g" when both are declared. Abbreviations only match whole words and case is ignored.
+
+    Whitespace is collapsed to single spaces, so tokens spanning several words, and everything computed from them,
+    do not depend on the spacing of the input.
+
+    Attributes:
+
+        replacements: lower cased abbreviations mapped to their full forms.
+        pattern: the compiled pattern or None if there are no abbreviations.
+
+    Methods:
+
+        for_country: return the cached normalizer for a country configuration.
+        normalize: replace all abbreviations in a string and collapse its whitespace.
+    """
+
+    _cache: Dict[str, Tuple[str, 'AbbreviationNormalizer']] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, abbreviations: Mapping[str, Tuple[str, ...]], pattern: str = None):
+        """
+        Compile the normalizer.
+
+        :param abbreviations: Full forms mapped to all of their abbreviations, like CountryConfig.abbreviations.
+        :param pattern: The source of the pattern for the abbreviations, as built by compile, to skip building it.
+        """
+
+        self.replacements = {}
+        for full_form, variants in abbreviations.items():
+            for variant in variants:
+                self.replacements.setdefault(variant.lower(), full_form)
+
+        if pattern is not None:
+            self.pattern = re.compile(pattern, flags=re.IGNORECASE)
+        else:
+            self.pattern = self.compile(self.replacements.keys())
+
+    @classmethod
+    def for_country(cls, country_config: CountryConfig, pattern: str = None) -> 'AbbreviationNormalizer':
+        """
+        Return the normalizer for a country, compiling it only once for each version of the country configuration.
+        """
+
+        cached = cls._cache.get(country_config.country_code)
+        if cached is not None and cached[0] == country_config.fingerprint:
+            return cached[1]
+
+        with cls._lock:
+            normalizer = cls(country_config.abbreviations, pattern)
+            cls._cache[country_config.country_code] = (country_config.fingerprint, normalizer)
+            return normalizer
+
+    @staticmethod
+    def compile(abbreviations) -> Optional[Pattern]:
+        trie = {}
+        for abbreviation in abbreviations:
+            node = trie
+            for char in abbreviation:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        if not trie:
+            return None
+
+        return re.compile(fr'(?<!\w){trie_pattern(trie)}(?!\w)', flags=re.IGNORECASE)
+
+    def normalize(self, input_address: str) -> str:
+        """
+        Replace all abbreviations in the input with their full forms, and runs of whitespace with a single space.
+
+        :param input_address: The string to normalize.
+        :return: The normalized string.
+        """
+
+        if self.pattern is not None:
+            input_address = self.pattern.sub(self.replace, input_address)
+        return ' '.join(input_address.split())
+
+    def replace(self, match) -> str:
+        return self.replacements[match.group(0).lower()]
+
+
+def trie_pattern(node: dict) -> str:
+    """
+    Create the regular expression for a trie node. Longer branches are tried before the node itself ends a match.
+    """
+
+    branches = [re.escape(char) + trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+
+    pattern = f'(?:{"|".join(branches)})'
+    if '' in node:
+        return f'{pattern}?'
+    return branches[0] if len(branches) == 1 else pattern
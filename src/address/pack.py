@@ -0,0 +1,235 @@
+import logging
+import marshal
+import math
+import sys
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.exceptions import ConfigurationError
+from .component import AddressComponentType
+from .country import CountryConfig, compile_country_config, config_files, config_fingerprint, install_country_config
+from .features import FEATURE_NAMES
+from .heuristics import HeuristicDefinition, HeuristicPlan
+from .normalizer import AbbreviationNormalizer
+from .rules import KINDS, OPERATORS, SYMBOLS, RuleSet
+from .sections import SectionFile, StringTable, pack_strings, write_sections
+
+__all__ = [
+    'CountryPack'
+]
+
+MAGIC = b'BUACHECP'
+VERSION = 1
+
+# component type, kind, feature, operator, guard and whether the rule has an option, -1 for none
+RULE_COLUMNS = 6
+OPERATOR_SYMBOLS = tuple(OPERATORS)
+
+
+def optional(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def plan_records(country_config: CountryConfig) -> Dict[AddressComponentType, List[Tuple]]:
+    return {
+        ct: HeuristicPlan.records_for(ct, country_config.rules[ct], country_config) for ct in AddressComponentType
+    }
+
+
+class CountryPack:
+    """
+    The configuration of a country compiled into one binary file, which is opened without reading or compiling any
+    configuration files.
+
+    A pack is a SectionFile with everything a CountryConfig is made of as arrays and string tables: the expected
+    positions, the abbreviations, the heuristic multipliers, the threshold, the address format and the validated
+    rules. It also holds what is expensive to build from them, the source of the abbreviation pattern and the
+    compiled RuleSet, marshalled like a .pyc file. Opening a pack maps it into memory, creates the snapshot from the
+    tables and hands the pattern and the rules to AbbreviationNormalizer and HeuristicPlan. Processes that are forked
+    after a pack was opened, or that open the same file, share its pages.
+
+    The fingerprint of the snapshot is the digest of the pack content, so everything that is cached by fingerprint,
+    like the results in a ResultCache, is invalidated when another pack is used.
+
+    A pack is refused when it was built from other configuration files than the ones of its country, so a stale pack
+    is not used after the configuration changed. Deployments that ship packs without the configuration files open
+    them with check_source=False.
+
+    Attributes:
+
+        path: the pack file.
+        country_code: the country the pack was built for.
+        digest: the hex digest of the pack content.
+        source_fingerprint: the fingerprint of the configuration files the pack was built from.
+        country_config: the CountryConfig of the pack.
+        rule_set: the compiled rules of the country.
+    """
+
+    def __init__(self, path: Union[str, Path], check_source: bool = True):
+        """
+        :param path: A file written by build.
+        :param check_source: Compare the fingerprint the pack was built from with the configuration files of its
+        country, and raise a ConfigurationError if they differ.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.path = str(path)
+        self.sections = SectionFile(self.path, MAGIC, VERSION)
+        self.digest = self.sections.digest
+        self.country_code = self.text('country_code')
+        self.source_fingerprint = self.text('fingerprint')
+        if check_source:
+            self.check_source()
+
+        self.country_config = CountryConfig(
+            country_code=self.country_code,
+            positions=MappingProxyType(self.read_positions()),
+            abbreviations=MappingProxyType(self.read_abbreviations()),
+            multipliers=MappingProxyType({k: MappingProxyType(v) for k, v in self.read_multipliers().items()}),
+            threshold=float(self.sections.array('settings')[0]),
+            format=self.text('format') if 'format' in self.sections else None,
+            rules=MappingProxyType(self.read_rules()),
+            fingerprint=self.digest
+        )
+
+        if self.text('rules.python') == sys.implementation.cache_tag:
+            self.rule_set = RuleSet(marshal.loads(self.sections.view('rules.code')), self.digest)
+        else:
+            self.log.debug(f'{self.path} was built with another Python version, its rules are compiled again.')
+            self.rule_set = RuleSet.compile(plan_records(self.country_config), self.digest)
+
+        pattern = self.text('abbreviations.pattern') if 'abbreviations.pattern' in self.sections else None
+        AbbreviationNormalizer.for_country(self.country_config, pattern=pattern)
+        HeuristicPlan.for_country(self.country_config, rule_set=self.rule_set)
+
+    def __getstate__(self) -> dict:
+        # The process that sends the pack to workers has already compared it with the configuration files.
+        return {'path': self.path, 'check_source': False}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def check_source(self) -> None:
+        """
+        Raise a ConfigurationError if the configuration files of the country are not the ones the pack was built from.
+        """
+
+        fingerprint = config_fingerprint(self.country_code)
+        if fingerprint != self.source_fingerprint:
+            self.close()
+            msg = (f'{self.path} was built from another configuration of "{self.country_code}" than the configuration '
+                   f'files, build it again. Open it with check_source=False to use it without the configuration files.')
+            self.log.error(msg)
+            raise ConfigurationError(msg)
+
+    def text(self, name: str) -> str:
+        return bytes(self.sections.view(name)).decode('utf-8')
+
+    def strings(self, name: str) -> List[str]:
+        table = StringTable(self.sections, name)
+        return [table[i] for i in range(len(table))]
+
+    def read_positions(self) -> Dict[AddressComponentType, int]:
+        positions = self.sections.array('positions').reshape(-1, 2).tolist()
+        return {AddressComponentType(component_type): position for component_type, position in positions}
+
+    def read_abbreviations(self) -> Dict[str, Tuple[str, ...]]:
+        abbreviations: Dict[str, List[str]] = {}
+        for full_form, variant in zip(self.strings('abbreviations.forms'), self.strings('abbreviations.variants')):
+            abbreviations.setdefault(full_form, []).append(variant)
+        return {full_form: tuple(variants) for full_form, variants in abbreviations.items()}
+
+    def read_multipliers(self) -> Dict[str, Dict[str, float]]:
+        multipliers: Dict[str, Dict[str, float]] = {}
+        names = zip(self.strings('multipliers.components'), self.strings('multipliers.options'))
+        for (component, option), value in zip(names, self.sections.array('multipliers.values').tolist()):
+            multipliers.setdefault(component, {})[option] = value
+        return multipliers
+
+    def read_rules(self) -> Dict[AddressComponentType, Tuple[HeuristicDefinition, ...]]:
+        rules: Dict[AddressComponentType, List[HeuristicDefinition]] = {ct: [] for ct in AddressComponentType}
+        columns = self.sections.array('rules.columns').reshape(-1, RULE_COLUMNS).tolist()
+        numbers = self.sections.array('rules.numbers').reshape(-1, 2).tolist()
+        for (component_type, kind, feature, symbol, guard, has_option), (value, multiplier), option in zip(
+                columns, numbers, self.strings('rules.options')):
+            rules[AddressComponentType(component_type)].append(HeuristicDefinition(
+                KINDS[kind],
+                option if has_option else None,
+                FEATURE_NAMES[feature],
+                None if symbol < 0 else OPERATORS[OPERATOR_SYMBOLS[symbol]],
+                None if math.isnan(value) else value,
+                None if math.isnan(multiplier) else multiplier,
+                None if guard < 0 else FEATURE_NAMES[guard]
+            ))
+        return {ct: tuple(definitions) for ct, definitions in rules.items()}
+
+    @classmethod
+    def build(cls, country_code: str, path: Union[str, Path]) -> 'CountryPack':
+        """
+        Compile the configuration files of a country into a pack.
+
+        :param country_code: The country, the same as the name of its folder under config/countries.
+        :param path: The file to write.
+        :return: The opened pack.
+        """
+
+        country_config = compile_country_config(country_code, config_files(country_code))
+        sections = {
+            'country_code': country_code.encode('utf-8'),
+            'fingerprint': country_config.fingerprint.encode('utf-8'),
+            'settings': np.array([country_config.threshold], dtype='<f8'),
+            'positions': np.array([[ct.value, p] for ct, p in country_config.positions.items()], dtype='<i4'),
+        }
+        if country_config.format is not None:
+            sections['format'] = country_config.format.encode('utf-8')
+
+        pairs = [(full_form, v) for full_form, variants in country_config.abbreviations.items() for v in variants]
+        sections['abbreviations.forms.offsets'], sections['abbreviations.forms.data'] = \
+            pack_strings(full_form for full_form, _ in pairs)
+        sections['abbreviations.variants.offsets'], sections['abbreviations.variants.data'] = \
+            pack_strings(variant for _, variant in pairs)
+        pattern = AbbreviationNormalizer(country_config.abbreviations).pattern
+        if pattern is not None:
+            sections['abbreviations.pattern'] = pattern.pattern.encode('utf-8')
+
+        options = [(c, o, v) for c, values in country_config.multipliers.items() for o, v in values.items()]
+        sections['multipliers.components.offsets'], sections['multipliers.components.data'] = \
+            pack_strings(c for c, _, _ in options)
+        sections['multipliers.options.offsets'], sections['multipliers.options.data'] = \
+            pack_strings(o for _, o, _ in options)
+        sections['multipliers.values'] = np.array([v for _, _, v in options], dtype='<f8')
+
+        definitions = [(ct, d) for ct in AddressComponentType for d in country_config.rules[ct]]
+        sections['rules.columns'] = np.array([[
+            ct.value,
+            KINDS.index(d.kind),
+            FEATURE_NAMES.index(d.feature),
+            -1 if d.operation is None else OPERATOR_SYMBOLS.index(SYMBOLS[d.operation]),
+            -1 if d.guard is None else FEATURE_NAMES.index(d.guard),
+            d.option is not None
+        ] for ct, d in definitions], dtype='<i2').reshape(-1, RULE_COLUMNS)
+        sections['rules.numbers'] = np.array(
+            [[optional(d.value), optional(d.multiplier)] for _, d in definitions], dtype='<f8').reshape(-1, 2)
+        sections['rules.options.offsets'], sections['rules.options.data'] = \
+            pack_strings(d.option or '' for _, d in definitions)
+
+        sections['rules.code'] = marshal.dumps(RuleSet.compile(plan_records(country_config)).code)
+        sections['rules.python'] = sys.implementation.cache_tag.encode('utf-8')
+
+        digest = write_sections(path, MAGIC, sections, VERSION)
+        logging.getLogger(__name__).info(f'Compiled the country pack {path} for "{country_code}", digest {digest}.')
+        return cls(path)
+
+    def install(self) -> None:
+        """
+        Make load_country_config return the snapshot of the pack for its country, instead of compiling the
+        configuration files. Parsers that are created for the country from then on use the pack.
+        """
+
+        install_country_config(self.country_config)
+
+    def close(self) -> None:
+        self.sections.close()
@@ -1,11 +1,20 @@
 import logging
-import re
-from typing import List, Tuple
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
-import src.address.helpers
-from config import CONFIG
 from src.exceptions import MissingAddressComponentEvaluation, InconclusiveEvaluationException, AddressComponentException
-from .component import AddressComponentType, AddressComponent
+from src.instrumentation import instruments
+from .component import AddressComponentType, AddressComponent, ComponentBatch
+from .batch import BatchParser
+from .cache import ResultCache
+from .country import CountryConfig, load_country_config
+from .decoder import ComponentDecoder, Labeling
+from .evaluation import VectorizedEvaluator
+from .features import TokenFeatures, token_features
+from .heuristics import HeuristicPlan
+from .normalizer import AbbreviationNormalizer
+from .spelling import SpellingCorrector
+from .tokenizer import Token, TokenTable, Tokenizer
 
 
 class AddressParser:
@@ -23,12 +32,44 @@ class AddressParser:
     making it easier to analyze and process this type of data.
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            country_config: CountryConfig = None,
+            ngram_sizes: Sequence[int] = (1, 2),
+            cache: ResultCache = None,
+            spelling: SpellingCorrector = None
+    ):
         """
-        Constructor for the AddressParser class. Initializes a logger instance for logging purposes.
+        Constructor for the AddressParser class. Initializes a logger instance for logging purposes and prepares
+        everything that does not depend on the input address, so that one parser can be reused for many addresses
+        of the same country.
+
+        :param country_config: The configuration of the country to parse addresses for. Defaults to the default
+        country configuration.
+        :param ngram_sizes: The number of words to combine into tokens, by default single words and pairs of words.
+        :param cache: A ResultCache to look up and store parse results in. Without a cache every address is parsed.
+        :param spelling: A SpellingCorrector for the street names and cities of the country. Only the components
+        chosen by resolve_conflicts and generate_possible_addresses are corrected, so the cache holds what was parsed
+        and a new index takes effect immediately.
         """
 
         self.log = logging.getLogger(__name__)
+        self.country_config = country_config or load_country_config('default')
+
+        # Any component with a lower confidence than this is discarded.
+        self.threshold = self.country_config.threshold
+
+        self.normalizer = AbbreviationNormalizer.for_country(self.country_config)
+        self.tokenizer = Tokenizer(ngram_sizes)
+        # The options that change the results for the same configuration, part of the keys of the cache.
+        self.options = f'ngrams={",".join(map(str, self.tokenizer.sizes))}'
+        self.evaluator = VectorizedEvaluator.for_country(self.country_config)
+        self.batch_parser = BatchParser(self)
+        self.decoder = ComponentDecoder.for_country(self.country_config)
+        self.cache = cache
+        self.spelling = spelling
+
+        self.plans = HeuristicPlan.for_country(self.country_config)
 
     def parse_address(self, input_address: str) -> List[AddressComponent]:
         """
@@ -38,11 +79,142 @@ class AddressParser:
         :return: A list of AddressComponent objects.
         """
 
-        normalized_address = self.normalize_address(input_address)
-        tokens = self.create_tokens(normalized_address)
-        address_components = self.create_address_components(tokens, normalized_address)
+        with instruments.stage('parse_address'):
+            if self.cache is not None:
+                cached = self.cache.get(input_address, self.country_config, self.options)
+                if cached is not None:
+                    return cached
 
-        return address_components
+            normalized_address = self.normalize_address(input_address)
+            tokens = self.create_tokens(normalized_address)
+            if instruments.enabled:
+                instruments.observe('tokens_per_address', len(tokens))
+            address_components = self.create_address_components(tokens, normalized_address)
+
+            if self.cache is not None:
+                self.cache.put(input_address, self.country_config, address_components, self.options)
+            return address_components
+
+    def parse_many(self, input_addresses: Iterable[str], batch_size: int = 1000) -> Iterator[List[AddressComponent]]:
+        """
+        Parses several input address strings, yielding the list of AddressComponent objects for each of them in
+        input order. The input is consumed lazily and parsed in batches of batch_size addresses, so arbitrarily
+        large inputs can be streamed through the parser.
+
+        :param input_addresses: An iterable of strings representing the input addresses to be parsed.
+        :param batch_size: The number of addresses to evaluate together.
+        :return: An iterator over lists of AddressComponent objects.
+        """
+
+        iterator = iter(input_addresses)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield from self.parse_batch(batch)
+
+    def parse_batch(self, input_addresses: Sequence[str]) -> List[List[AddressComponent]]:
+        """
+        Parses a batch of input address strings at once. The result is the same as calling parse_address for each of
+        them, but the tokens of all addresses are evaluated together.
+
+        With a cache only the addresses that are not cached are parsed, and each of them only once per batch.
+
+        :param input_addresses: A sequence of strings representing the input addresses to be parsed.
+        :return: A list with a list of AddressComponent objects for each input address.
+        """
+
+        with instruments.stage('parse_batch'):
+            return self.parse_batch_cached(input_addresses)
+
+    def parse_records(self, input_addresses: Sequence[str]) -> ComponentBatch:
+        """
+        Parses a batch of input address strings into a ComponentBatch, which only creates AddressComponent objects
+        for the addresses that are accessed. Neither the cache nor the spelling corrector is used.
+
+        :param input_addresses: A sequence of strings representing the input addresses to be parsed.
+        :return: The components of all addresses as one record array.
+        """
+
+        with instruments.stage('parse_batch'):
+            return self.batch_parser.parse_records(input_addresses)
+
+    def parse_batch_cached(self, input_addresses: Sequence[str]) -> List[List[AddressComponent]]:
+        if self.cache is None:
+            return self.batch_parser.parse_batch(input_addresses)
+
+        results = self.cache.get_many(input_addresses, self.country_config, self.options)
+        misses = {}
+        for index, result in enumerate(results):
+            if result is None:
+                misses.setdefault(self.cache.canonical(input_addresses[index]), []).append(index)
+        if not misses:
+            return results
+
+        addresses = [input_addresses[indexes[0]] for indexes in misses.values()]
+        parsed = self.batch_parser.parse_batch(addresses)
+        self.cache.put_many(addresses, self.country_config, parsed, self.options)
+
+        for indexes, components in zip(misses.values(), parsed):
+            results[indexes[0]] = components
+            for index in indexes[1:]:
+                results[index] = [
+                    AddressComponent(c.component_type, c.component_value, c.confidence, c.position, c.words)
+                    for c in components
+                ]
+        return results
+
+    def correct_spelling(self, components: List[AddressComponent]) -> List[AddressComponent]:
+        """
+        Replaces street names and cities that are not in the vocabulary of the spelling corrector with the closest
+        known spelling, with a lower confidence. Without a spelling corrector the components are returned as they are.
+
+        :param components: The components of one address.
+        :return: The components with corrected spellings.
+        """
+
+        if self.spelling is None:
+            return components
+        return self.spelling.correct_components(components)
+
+    def resolve_conflicts(self, components: List[AddressComponent]) -> List[AddressComponent]:
+        """
+        Chooses the best consistent components of an address: no two of them overlap, every type is used at most once
+        and the types follow the positions of the country configuration, see ComponentDecoder. Only the chosen street
+        name and city are spelling corrected, see correct_spelling.
+
+        :param components: The candidate components of one address, as returned by parse_address.
+        :return: The chosen components in word order.
+        """
+
+        return self.correct_spelling(list(self.decoder.decode(components)[0].components))
+
+    def generate_possible_addresses(self, components: List[AddressComponent], k: int = 5) -> List[Labeling]:
+        """
+        Generates the k best consistent readings of an address with a beam over the decoder. With a spelling
+        corrector the components of each reading are corrected, and its score is the sum of the corrected confidences.
+
+        :param components: The candidate components of one address, as returned by parse_address.
+        :param k: The number of readings.
+        :return: Up to k labelings, the best first before spelling correction.
+        """
+
+        labelings = self.decoder.decode(components, k)
+        if self.spelling is None:
+            return labelings
+
+        corrected = []
+        for labeling in labelings:
+            chosen = self.spelling.correct_components(list(labeling.components))
+            corrected.append(Labeling(round(sum(c.confidence for c in chosen), 2), tuple(chosen)))
+        return corrected
+
+    def rank_possible_addresses(self, labelings: Sequence[Labeling]) -> List[Labeling]:
+        """
+        Ranks readings of an address from the most to the least likely.
+        """
+
+        return self.decoder.rank(labelings)
 
     def normalize_address(self, input_address: str) -> str:
         """
@@ -52,97 +224,88 @@ class AddressParser:
         :return: A string representing the normalized address.
         """
 
-        abbreviation_map = {option: CONFIG.get('Abbreviations', option) for option in CONFIG.options('Abbreviations')}
-        normalized_address = input_address
-        for full_form, abbreviation in abbreviation_map.items():
-            normalized_address = re.sub(fr'\b{abbreviation}\b', full_form, normalized_address, flags=re.IGNORECASE)
-        self.log.debug(f'Normalized address is "{normalized_address}"')
+        with instruments.stage('normalize_address'):
+            normalized_address = self.normalizer.normalize(input_address)
+        self.log.debug('Normalized address is "%s"', normalized_address)
         return normalized_address
 
-    def create_tokens(self, input_address: str) -> dict:
+    def create_tokens(self, input_address: str) -> TokenTable:
         """
         Creates tokens from an input address string for splitting the address into individual components.
 
         :param input_address: A string representing the input address to be tokenized.
-        :return: A dictionary representing the tokens generated from the input address.
+        :return: A TokenTable with the words and word n-grams of the input address.
         """
 
-        words = {}
-        splits = input_address.split()
-        for w in splits:
-            words[w] = int(splits.index(w))
-        original_list_size = len(words)
-        for i in range(original_list_size):
-            if (i + 1) < original_list_size:
-                comb = list(words.keys())[i:i + 2]
-                new_string = " ".join(comb)
-                words[new_string] = i
-        return words
+        with instruments.stage('create_tokens'):
+            return self.tokenizer.tokenize(input_address)
 
-    def create_address_components(self, tokens: dict, input_address: str) -> List[AddressComponent]:
+    def create_address_components(self, tokens: TokenTable, input_address: str) -> List[AddressComponent]:
         """
         Creates a list of AddressComponent objects by evaluating each token generated from the input address.
 
-        :param tokens: A dictionary representing the tokens generated from the input address.
+        :param tokens: A TokenTable representing the tokens generated from the input address.
         :param input_address: A string representing the input address to be parsed.
         :return: A list of AddressComponent objects.
         """
 
-        # Any component with a lower confidence than this is discarded.
-        threshhold = float(CONFIG.get('AddressHeuristics.evaluation', 'threshold'))
-
-        evaluated_components = self.evaluate_address_components(tokens, input_address)
+        results, confidences = self.score_address_components(tokens)
+        accepted = results & (confidences > self.threshold)
         address_components = []
-        for component_type, components in evaluated_components.items():
-            for component_value, valuation in components.items():
-                if valuation[0] and valuation[1] > threshhold:
-                    component = self.create_address_component(component_type, component_value, tokens, valuation)
-                    address_components.append(component)
+        for column, row in zip(*accepted.T.nonzero()):
+            component_type = self.evaluator.component_types[column]
+            valuation = (True, confidences[row, column])
+            address_components.append(self.create_address_component(component_type, tokens[row], valuation))
         return address_components
 
-    def create_address_component(self, component_type: AddressComponentType, component_value: str, tokens: dict,
+    def score_address_components(self, tokens: TokenTable) -> Tuple:
+        """
+        Evaluates all tokens against all component types at once with the vectorized evaluator.
+
+        :param tokens: A TokenTable representing the tokens generated from the input address.
+        :return: A tuple of a boolean result matrix and a confidence matrix, with one row per token and one column
+        per component type in the order of self.evaluator.component_types.
+        """
+
+        with instruments.stage('evaluate_address_components'):
+            features = TokenFeatures.from_tokens(tokens.texts(), tokens.indexes)
+            return self.evaluator.evaluate(features)
+
+    def create_address_component(self, component_type: AddressComponentType, token: Token,
                                  valuation: Tuple) -> AddressComponent:
         """
-        Creates an AddressComponent object based on the provided component type, value, and valuation.
+        Creates an AddressComponent object based on the provided component type, token, and valuation.
 
         :param component_type: An AddressComponentType object representing the type of the address component.
-        :param component_value: A string representing the value of the address component.
-        :param tokens: A dictionary representing the tokens generated from the input address.
+        :param token: The Token the address component was found in.
         :param valuation: A tuple representing the valuation of the address component.
         :return: An AddressComponent object.
         """
 
-        position = tokens[component_value]
         confidence = round(float(valuation[1]), 2)
         return AddressComponent(
             component_type=component_type,
-            component_value=component_value,
-            position=position,
+            component_value=token.text,
+            position=token.index,
             confidence=confidence
         )
 
-    def evaluate_address_components(self, components: dict, input_address: str) -> dict:
+    def evaluate_address_components(self, components: TokenTable, input_address: str) -> dict:
         """
         Evaluates each token generated from the input address to determine its type and confidence level.
 
-        :param components: A dictionary representing the tokens generated from the input address.
+        :param components: A TokenTable representing the tokens generated from the input address.
         :param input_address: A string representing the input address to be parsed.
-        :return: A dictionary representing the evaluated components with their corresponding types and confidence levels.
+        :return: A dictionary mapping each component type to the valuations of the tokens, keyed by token row.
         """
 
-        evaluated_components = {}
-        for component in components.keys():
-            for component_type in AddressComponentType:
-                if component_type not in evaluated_components.keys():
-                    evaluated_components[component_type] = {}
-                evaluated_components[component_type][component] = self.evaluate_address_component(
-                    component=component,
-                    input_address=input_address,
-                    component_type=component_type,
-                    position=components.get(component)
-                )
-
-        return evaluated_components
+        results, confidences = self.score_address_components(components)
+        return {
+            component_type: {
+                row: (bool(results[row, column]), float(confidences[row, column])) for row in range(len(components))
+            }
+            for column, component_type in enumerate(self.evaluator.component_types)
+        }
 
     def evaluate_address_component(
             self,
@@ -162,21 +325,18 @@ class AddressParser:
         :return: A tuple with the result and a confidence score.
         """
 
-        # Get the evaluation function dynamically based on the component type
-        func_name = f'is_{component_type.name.lower()}'
-        evaluation_func = getattr(src.address.helpers, func_name, None)
+        plan = self.plans.get(component_type)
 
-        if evaluation_func is None:
-            raise MissingAddressComponentEvaluation(f'There is no function called "{func_name}"')
+        if plan is None:
+            raise MissingAddressComponentEvaluation(f'There is no heuristic plan for "{component_type}"')
 
         # Evaluate the component
         try:
-            self.log.debug(f'Adding tests to check if "{component}" is a "{component_type.name.lower()}"')
-            return evaluation_func(
-                token=component,
-                position=position,
-                full_address=input_address
-            )
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(f'Evaluating if "{component}" is a "{component_type.name.lower()}"')
+            return plan.function(token_features(component, position))
         except InconclusiveEvaluationException:
-            self.log.debug(f"Can't say if {component} is a {component_type}")
+            self.log.debug("Can't say if %s is a %s", component, component_type)
+            if instruments.enabled:
+                instruments.increment('inconclusive_evaluations_total', 1, (('component_type', component_type.name),))
             return False, 0
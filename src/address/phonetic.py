@@ -0,0 +1,477 @@
+import logging
+import re
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import AddressComponentType
+from .database import AddressDatabase
+from .sections import PostingLists, SectionFile, StringTable, pack_postings, pack_strings, stable_hash, write_sections
+from .spelling import VOCABULARIES
+
+__all__ = [
+    'PhoneticEncoder',
+    'PhoneticIndex',
+    'double_metaphone',
+    'swedish_phonetic'
+]
+
+MAGIC = b'BUACHEPH'
+# 2: SCH and an S before M, N, L or W at the start of English words have an alternate key.
+VERSION = 2
+
+WORDS = re.compile(r'[^\W_]+')
+
+# (primary key, alternate key)
+Keys = Tuple[str, str]
+
+
+class KeyBuilder:
+    """
+    Builds a primary and an alternate key side by side, the alternate only differs where a spelling has two readings.
+    """
+
+    def __init__(self):
+        self.primary: List[str] = []
+        self.alternate: List[str] = []
+
+    def add(self, main: str, alternate: str = None) -> None:
+        self.primary.append(main)
+        self.alternate.append(main if alternate is None else alternate)
+
+    def keys(self, max_length: int = 0) -> Keys:
+        primary, alternate = ''.join(self.primary), ''.join(self.alternate)
+        if max_length:
+            primary, alternate = primary[:max_length], alternate[:max_length]
+        return primary, alternate
+
+
+# Letters that are written differently but sound the same in Swedish.
+SWEDISH_LETTERS = str.maketrans({
+    'æ': 'ä', 'ø': 'ö', 'ü': 'y', 'é': 'e', 'è': 'e', 'ê': 'e', 'á': 'a', 'à': 'a', 'â': 'a', 'ô': 'o', 'í': 'i',
+    'ó': 'o', 'ú': 'u', 'w': 'v', 'z': 's', 'q': 'k',
+})
+SWEDISH_VOWELS = {'a': 'A', 'e': 'E', 'ä': 'E', 'i': 'I', 'o': 'O', 'å': 'O', 'u': 'U', 'y': 'Y', 'ö': 'Ö'}
+SWEDISH_FRONT_VOWELS = set('eiyäö')
+
+
+def swedish_phonetic(word: str, max_length: int = 0) -> Keys:
+    """
+    Encode one Swedish word.
+
+    Vowels are kept, because Swedish names mostly vary in them, but merged where the spelling varies: e and ä as in
+    "Vesterås" and "Västerås", o and å. The sje-sound of sj, skj, stj, sch, ch and sk before a front vowel becomes X,
+    the tje-sound of tj, kj and k before a front vowel becomes C, and g, gj, hj, dj and lj before a front vowel at the
+    start of the word become J. Soft k, g and sk have the hard sound as alternate, for names like "Kiruna". Silent h
+    and doubled letters are dropped.
+    """
+
+    word = word.casefold().translate(SWEDISH_LETTERS)
+    keys = KeyBuilder()
+    index, length = 0, len(word)
+
+    def at(*prefixes: str) -> bool:
+        return word.startswith(prefixes, index)
+
+    def front(offset: int) -> bool:
+        return index + offset < length and word[index + offset] in SWEDISH_FRONT_VOWELS
+
+    while index < length:
+        letter = word[index]
+        if at('skj', 'stj', 'sch'):
+            keys.add('X')
+            index += 3
+        elif at('sj', 'ch'):
+            keys.add('X')
+            index += 2
+        elif at('sk') and front(2):
+            keys.add('X', 'SK')
+            index += 2
+        elif at('tj', 'kj'):
+            keys.add('C')
+            index += 2
+        elif letter == 'k' and front(1):
+            keys.add('C', 'K')
+            index += 1
+        elif index == 0 and at('gj', 'hj', 'dj', 'lj'):
+            keys.add('J')
+            index += 2
+        elif index == 0 and letter == 'g' and front(1):
+            keys.add('J', 'G')
+            index += 1
+        elif at('ck'):
+            keys.add('K')
+            index += 2
+        elif at('ph'):
+            keys.add('F')
+            index += 2
+        elif at('dt', 'th'):
+            keys.add('T')
+            index += 2
+        elif letter == 'c':
+            keys.add('S' if front(1) else 'K')
+            index += 1
+        elif letter == 'x':
+            keys.add('KS')
+            index += 1
+        elif letter == 'h':
+            if index == 0:
+                keys.add('H')
+            index += 1
+        else:
+            keys.add(SWEDISH_VOWELS.get(letter, letter.upper()))
+            index += 1
+
+    return tuple(collapse(key) for key in keys.keys(max_length))
+
+
+def collapse(key: str) -> str:
+    """
+    Drop repeated symbols, which come from doubled letters like in "Uppsala".
+    """
+
+    return ''.join(symbol for index, symbol in enumerate(key) if index == 0 or symbol != key[index - 1])
+
+
+VOWELS = set('AEIOUY')
+
+
+def double_metaphone(word: str, max_length: int = 0) -> Keys:
+    """
+    Encode one English word like Double Metaphone: consonant sounds only, the first vowel as A, and an alternate key
+    where the spelling has a second common reading, like "Thomas" with T for TH. This covers the common rules of
+    Double Metaphone, not its special cases for names of other languages.
+    """
+
+    word = ''.join(c for c in unicodedata.normalize('NFKD', word.upper()) if 'A' <= c <= 'Z')
+    keys = KeyBuilder()
+    index, length = 0, len(word)
+
+    def at(*prefixes: str) -> bool:
+        return word.startswith(prefixes, index)
+
+    def letter_at(offset: int) -> str:
+        return word[index + offset] if 0 <= index + offset < length else ''
+
+    def skip(letter: str) -> int:
+        # A doubled letter sounds once.
+        return 2 if letter_at(1) == letter else 1
+
+    if word.startswith(('GN', 'KN', 'PN', 'WR', 'PS')):
+        index = 1
+    elif word.startswith('X'):
+        keys.add('S')
+        index = 1
+    elif word.startswith('WH'):
+        keys.add('A')
+        index = 2
+
+    while index < length:
+        letter = word[index]
+        if letter in VOWELS:
+            if index == 0:
+                keys.add('A')
+            index += 1
+        elif letter == 'B':
+            keys.add('P')
+            index += skip('B')
+        elif letter == 'C':
+            if at('CH'):
+                keys.add('X', 'K')
+                index += 2
+            elif at('CIA'):
+                keys.add('X', 'S')
+                index += 3
+            elif letter_at(1) in ('I', 'E', 'Y'):
+                keys.add('S')
+                index += 1
+            elif at('CK', 'CQ', 'CC'):
+                keys.add('K')
+                index += 2
+            else:
+                keys.add('K')
+                index += 1
+        elif letter == 'D':
+            if at('DG') and letter_at(2) in ('I', 'E', 'Y'):
+                keys.add('J')
+                index += 3
+            elif at('DT', 'DD'):
+                keys.add('T')
+                index += 2
+            else:
+                keys.add('T')
+                index += 1
+        elif letter == 'G':
+            if at('GH'):
+                # Silent after a vowel, as in "night".
+                if index == 0 or letter_at(-1) not in VOWELS:
+                    keys.add('K')
+                index += 2
+            elif at('GN'):
+                keys.add('N', 'KN')
+                index += 2
+            elif letter_at(1) in ('I', 'E', 'Y'):
+                keys.add('J', 'K')
+                index += 1
+            else:
+                keys.add('K')
+                index += skip('G')
+        elif letter == 'H':
+            if (index == 0 or letter_at(-1) in VOWELS) and letter_at(1) in VOWELS:
+                keys.add('H')
+            index += 1
+        elif letter == 'J':
+            keys.add('J', 'H')
+            index += skip('J')
+        elif letter == 'P':
+            if at('PH'):
+                keys.add('F')
+                index += 2
+            else:
+                keys.add('P')
+                index += 2 if letter_at(1) in ('P', 'B') else 1
+        elif letter == 'Q':
+            keys.add('K')
+            index += skip('Q')
+        elif letter == 'S':
+            if at('SH'):
+                keys.add('X')
+                index += 2
+            elif at('SIO', 'SIA'):
+                keys.add('S', 'X')
+                index += 3
+            elif at('SCH'):
+                following = word[index + 3:index + 5]
+                if following in ('ER', 'EN'):
+                    keys.add('X', 'SK')
+                elif following in ('OO', 'UY', 'ED', 'EM'):
+                    # Dutch, as in "school".
+                    keys.add('SK')
+                elif index == 0 and letter_at(3) not in VOWELS and letter_at(3) != 'W':
+                    # German, as in "Schmidt".
+                    keys.add('X', 'S')
+                else:
+                    keys.add('X')
+                index += 3
+            elif at('SC') and letter_at(2) in ('I', 'E', 'Y'):
+                keys.add('S')
+                index += 3
+            elif index == 0 and letter_at(1) in ('M', 'N', 'L', 'W'):
+                # "Smith" also reads like "Schmidt".
+                keys.add('S', 'X')
+                index += 1
+            else:
+                keys.add('S')
+                index += 2 if letter_at(1) in ('S', 'Z') else 1
+        elif letter == 'T':
+            if at('TION', 'TIA', 'TCH'):
+                keys.add('X')
+                index += 3
+            elif at('TH'):
+                keys.add('0', 'T')
+                index += 2
+            else:
+                keys.add('T')
+                index += 2 if letter_at(1) in ('T', 'D') else 1
+        elif letter == 'V':
+            keys.add('F')
+            index += skip('V')
+        elif letter == 'W':
+            if letter_at(1) in VOWELS:
+                keys.add('W', 'F')
+            index += 1
+        elif letter == 'X':
+            keys.add('KS')
+            index += skip('X')
+        elif letter == 'Z':
+            keys.add('S', 'TS')
+            index += skip('Z')
+        else:
+            # F, K, L, M, N and R sound as they are written.
+            keys.add(letter)
+            index += skip(letter)
+
+    return keys.keys(max_length)
+
+
+# The word encoder of each language, languages that are not listed use ENCODERS['en'].
+ENCODERS: Dict[str, Callable[[str, int], Keys]] = {
+    'sv': swedish_phonetic,
+    'en': double_metaphone,
+}
+
+
+class PhoneticEncoder:
+    """
+    Encodes address component values into phonetic keys, so that names that sound the same but are spelled
+    differently get the same key.
+
+    Every word is encoded on its own and the keys of the words are joined with spaces. Words are encoded with the
+    algorithm of the language, which is the country code of the country configuration: a Swedish adaptation for
+    "sv" and a Double Metaphone style encoding otherwise. Both give a primary and an alternate key.
+
+    Attributes:
+
+        language: the language of the values.
+        max_length: the longest key of a word, 0 for no limit.
+    """
+
+    def __init__(self, language: str = 'sv', max_length: int = 0):
+        self.log = logging.getLogger(__name__)
+        self.language = language
+        self.max_length = max_length
+        self.encode_word = ENCODERS.get(language, ENCODERS['en'])
+
+    def encode_keys(self, component_value: str) -> Tuple[str, ...]:
+        """
+        Return the distinct keys of a value, the primary key first.
+        """
+
+        primary, alternate = [], []
+        for word in WORDS.findall(component_value):
+            keys = self.encode_word(word, self.max_length)
+            if keys[0]:
+                primary.append(keys[0])
+                alternate.append(keys[1])
+        primary, alternate = ' '.join(primary), ' '.join(alternate)
+        return (primary,) if primary == alternate else (primary, alternate)
+
+    def encode_phonetic(self, component_value: str) -> str:
+        """
+        Return the primary phonetic key of a value, e.g. "VESTEROS" for both "Västerås" and "Vesterås".
+        """
+
+        return self.encode_keys(component_value)[0]
+
+    def encode_many(self, component_values: Iterable[str]) -> List[Tuple[str, ...]]:
+        """
+        Return the keys of a column of values. Every distinct value is encoded once, which makes encoding the columns
+        of a register, where most values repeat, much faster than encoding value by value.
+        """
+
+        encoded: Dict[str, Tuple[str, ...]] = {}
+        keys = []
+        for value in component_values:
+            found = encoded.get(value)
+            if found is None:
+                found = encoded[value] = self.encode_keys(value)
+            keys.append(found)
+        return keys
+
+
+class PhoneticIndex:
+    """
+    Finds reference street names and cities by their phonetic keys.
+
+    Every name is indexed under the 64 bit hashes of its primary and alternate key, so a lookup encodes the value and
+    finds the names that share a key with a binary search on the sorted hashes, without comparing it to any name. The
+    index is compiled offline into one memory mapped file, like the AddressDatabase it is usually compiled from.
+
+    Attributes:
+
+        path: the index file.
+        encoder: the PhoneticEncoder the names were encoded with.
+        names: the spelling of the names of each component type.
+        counts: how often each name occurs in the reference data.
+        keys: the ids of the names of each component type by the hashes of their keys.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        :param path: A file written by compile.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.path = str(path)
+        self.sections = SectionFile(self.path, MAGIC, VERSION)
+        language = bytes(self.sections.array('language')).decode('utf-8')
+        self.encoder = PhoneticEncoder(language, int(self.sections.array('settings')[0]))
+        self.names = {t: StringTable(self.sections, f'{name}.names') for t, name in VOCABULARIES.items()}
+        self.counts = {t: self.sections.array(f'{name}.counts') for t, name in VOCABULARIES.items()}
+        self.keys = {t: PostingLists(self.sections, name) for t, name in VOCABULARIES.items()}
+
+    def __getstate__(self) -> dict:
+        return {'path': self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['path'])
+
+    @classmethod
+    def compile(cls, vocabularies: Mapping[AddressComponentType, Iterable[Tuple[str, int]]], path: Union[str, Path],
+                language: str = 'sv', max_length: int = 0) -> 'PhoneticIndex':
+        """
+        Compile reference vocabularies into an index file.
+
+        :param vocabularies: (spelling, count) pairs for STREET_NAME and CITY.
+        :param path: The file to write.
+        :param language: The language of the names, see PhoneticEncoder.
+        :param max_length: The longest key of a word, 0 for no limit.
+        :return: The compiled index.
+        """
+
+        encoder = PhoneticEncoder(language, max_length)
+        sections = {
+            'settings': np.array([max_length], dtype='<u4'),
+            'language': language.encode('utf-8'),
+        }
+        for component_type, name in VOCABULARIES.items():
+            entries = list(vocabularies.get(component_type, ()))
+            sections[f'{name}.names.offsets'], sections[f'{name}.names.data'] = pack_strings(s for s, _ in entries)
+            sections[f'{name}.counts'] = np.array([count for _, count in entries], dtype='<u4')
+
+            hashes, ids = [], []
+            for index, keys in enumerate(encoder.encode_many(spelling for spelling, _ in entries)):
+                for key in keys:
+                    if key:
+                        hashes.append(stable_hash(key))
+                        ids.append(index)
+            sections[f'{name}.hashes'], sections[f'{name}.posting_offsets'], sections[f'{name}.postings'] = \
+                pack_postings(hashes, ids)
+
+        write_sections(path, MAGIC, sections, VERSION)
+        logging.getLogger(__name__).info(f'Compiled the phonetic index {path} for "{language}".')
+        return cls(path)
+
+    @classmethod
+    def from_database(cls, database: AddressDatabase, path: Union[str, Path], language: str = 'sv',
+                      **kwargs) -> 'PhoneticIndex':
+        """
+        Compile an index from the street names and cities of an AddressDatabase.
+        """
+
+        return cls.compile(database.vocabularies(VOCABULARIES), path, language, **kwargs)
+
+    def candidates(self, component_type: AddressComponentType, component_value: str,
+                   limit: int = 10) -> List[str]:
+        """
+        Return the names that sound like a value, the most common first.
+
+        :param component_type: STREET_NAME or CITY, other types have no candidates.
+        :param component_value: The value to match.
+        :param limit: The largest number of names returned.
+        """
+
+        postings = self.keys.get(component_type)
+        if postings is None:
+            return []
+
+        with instruments.stage('match_phonetic'):
+            hashes = np.array([stable_hash(k) for k in self.encoder.encode_keys(component_value) if k], dtype='<u8')
+            ids = postings.lookup(hashes)
+            counts = self.counts[component_type]
+            ids = sorted(ids.tolist(), key=lambda i: -int(counts[i]))[:limit]
+            return [self.names[component_type][i] for i in ids]
+
+    def match_phonetic(self, component_type: AddressComponentType, component_value: str) -> Optional[str]:
+        """
+        Return the most common name that sounds like a value, or None.
+        """
+
+        candidates = self.candidates(component_type, component_value, 1)
+        return candidates[0] if candidates else None
+
+    def close(self) -> None:
+        self.sections.close()
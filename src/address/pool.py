@@ -0,0 +1,272 @@
+import logging
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.instrumentation import Aggregates, StatsSink, instruments
+from .cache import ResultCache
+from .component import AddressComponent, compact, expand
+from .country import load_country_config
+from .pack import CountryPack
+from .parser import AddressParser
+from .spelling import SpellingCorrector
+
+__all__ = [
+    'ParserPool',
+    'parse_chunk',
+    'parse_chunk_compact'
+]
+
+# The parsers of the current process, by country code, the result cache they share and their spelling correctors.
+_parsers: Dict[str, AddressParser] = {}
+_cache: Optional[ResultCache] = None
+_spelling: Dict[str, SpellingCorrector] = {}
+# The sink collecting the measurements of a worker process until they are sent back with the results of a chunk.
+_stats: Optional[StatsSink] = None
+
+
+def get_parser(country_code: str) -> AddressParser:
+    """
+    Return the parser of the current process for a country, creating it again if the configuration has changed.
+    """
+
+    country_config = load_country_config(country_code)
+    parser = _parsers.get(country_code)
+    if parser is None or parser.country_config is not country_config:
+        parser = AddressParser(country_config, cache=_cache, spelling=_spelling.get(country_code))
+        _parsers[country_code] = parser
+    return parser
+
+
+def parse_chunk(
+        strings: Sequence[str],
+        country_code: str = None,
+        parser_for: Callable[[str], AddressParser] = get_parser,
+        decode: bool = False
+) -> List[Tuple[str, List[AddressComponent]]]:
+    """
+    Parse a chunk of addresses, batching the addresses of each country together.
+
+    :param strings: The addresses to parse.
+    :param country_code: Country code to use for all addresses. If omitted it is detected for each address.
+    :param parser_for: Returns the parser to use for a country code.
+    :param decode: Return only the best consistent components of each address, see AddressParser.resolve_conflicts.
+    :return: The country code and the components of each address, in input order.
+    """
+
+    results = [None] * len(strings)
+    for code, indexes in group_by_country(strings, country_code).items():
+        parser = parser_for(code)
+        parsed = parser.parse_batch([strings[i] for i in indexes])
+        if decode:
+            parsed = [parser.resolve_conflicts(components) for components in parsed]
+        for index, components in zip(indexes, parsed):
+            results[index] = (code, components)
+    return results
+
+
+def parse_chunk_compact(strings: Sequence[str], country_code: str = None,
+                        decode: bool = False) -> List[Tuple[str, Tuple]]:
+    """
+    Parse a chunk of addresses in a worker process. Components are returned as plain tuples to keep the results
+    that are sent back to the main process small. Without a cache and without decoding they are taken from the
+    record array of the batch, so no AddressComponent objects are created in the worker. With decode the best
+    consistent components are chosen and spelling corrected in the worker, see AddressParser.resolve_conflicts.
+    """
+
+    results = [None] * len(strings)
+    for code, indexes in group_by_country(strings, country_code).items():
+        parser = get_parser(code)
+        group = [strings[i] for i in indexes]
+        if parser.cache is None and not decode:
+            batch = parser.parse_records(group)
+            parsed = (batch.compact(i) for i in range(len(group)))
+        elif decode:
+            parsed = (compact(parser.resolve_conflicts(components)) for components in parser.parse_batch(group))
+        else:
+            parsed = (compact(components) for components in parser.parse_batch(group))
+        for index, compact_components in zip(indexes, parsed):
+            results[index] = (code, compact_components)
+    return results
+
+
+def parse_chunk_measured(
+        strings: Sequence[str],
+        country_code: str = None,
+        decode: bool = False
+) -> Tuple[List[Tuple[str, Tuple]], Aggregates]:
+    """
+    Parse a chunk of addresses in a worker process that collects measurements, see parse_chunk_compact. The
+    measurements taken while the chunk was parsed are returned with its results.
+    """
+
+    results = parse_chunk_compact(strings, country_code, decode)
+    return results, _stats.drain()
+
+
+def group_by_country(strings: Sequence[str], country_code: str = None) -> Dict[str, List[int]]:
+    """
+    Return the indexes of the addresses of each country, detecting the country of each address without a code.
+    """
+
+    from . import detect_language
+
+    by_country: Dict[str, List[int]] = {}
+    for index, string in enumerate(strings):
+        by_country.setdefault(detect_language(string, country_code), []).append(index)
+    return by_country
+
+
+def initialize_worker(country_codes: Sequence[str], cache: ResultCache = None,
+                      spelling: Dict[str, SpellingCorrector] = None, packs: Sequence[CountryPack] = ()) -> None:
+    """
+    Load the configuration and create the parsers for the expected countries once, when a worker starts.
+    """
+
+    global _cache
+    for pack in packs:
+        pack.install()
+    if cache is not None or spelling:
+        _cache = cache
+        _spelling.clear()
+        _spelling.update(spelling or {})
+        _parsers.clear()
+    for country_code in country_codes:
+        get_parser(country_code)
+
+
+def start_worker(metrics: bool, *arguments) -> None:
+    """
+    Set up a worker process, see initialize_worker. Sinks inherited from the main process are detached, they belong
+    to it. With metrics the worker collects its measurements in a StatsSink instead.
+    """
+
+    global _stats
+    for sink in instruments.sinks:
+        instruments.detach(sink)
+    _stats = instruments.attach(StatsSink()) if metrics else None
+    initialize_worker(*arguments)
+
+
+class ParserPool:
+    """
+    Parses addresses in a pool of worker processes.
+
+    Every worker creates its parsers once, when it starts, and then parses chunks of addresses. Only a limited number
+    of chunks is sent to the workers ahead of the results that have been consumed, so the input is read lazily and
+    memory use does not depend on the size of the input. Results are yielded in input order.
+
+    With metrics the workers aggregate their measurements, and send them back with the results of each chunk. They
+    are merged into the sinks attached in the main process when the chunk is done, so stage timings and counters
+    cover the work of all processes.
+
+    Attributes:
+
+        workers: the number of worker processes.
+        max_pending: the number of chunks that can be parsed ahead of the consumer.
+        metrics: whether the workers send their measurements back.
+    """
+
+    def __init__(
+            self,
+            workers: int,
+            country_codes: Sequence[str] = (),
+            max_pending: int = None,
+            cache: ResultCache = None,
+            spelling: Dict[str, SpellingCorrector] = None,
+            packs: Sequence[CountryPack] = (),
+            metrics: bool = None
+    ):
+        """
+        :param workers: The number of worker processes.
+        :param country_codes: Countries to create parsers for when a worker starts.
+        :param max_pending: The number of chunks that can be in flight at once. Defaults to twice the workers.
+        :param cache: A ResultCache for the workers. Each worker has its own memory tier, the persistent tier is
+        shared.
+        :param spelling: The SpellingCorrector of each country code. Workers open the index files again, and share
+        their pages.
+        :param packs: CountryPacks the workers use instead of the configuration files of their countries.
+        :param metrics: Whether the workers send their measurements back. Defaults to whether a sink is attached
+        when the pool starts.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.metrics = instruments.enabled if metrics is None else metrics
+
+        # Warm up before the workers are started, forked workers then share the compiled configuration.
+        initialize_worker(country_codes, packs=packs)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=start_worker,
+            initargs=(self.metrics, tuple(country_codes), cache, spelling, tuple(packs))
+        )
+        self.log.info(f'Started a parser pool with {workers} workers.')
+
+    def parse_many(
+            self,
+            strings: Iterable[str],
+            country_code: str = None,
+            chunk_size: int = 1000,
+            decode: bool = False
+    ) -> Iterator[Tuple[str, str, List[AddressComponent]]]:
+        """
+        Parse addresses in the worker processes.
+
+        :param strings: The addresses to parse. They are consumed lazily.
+        :param country_code: Country code to use for all addresses. If omitted it is detected for each address.
+        :param chunk_size: The number of addresses sent to a worker at once.
+        :param decode: Return only the best consistent components of each address, chosen in the workers.
+        :return: An iterator over the address, its country code and its components, in input order.
+        """
+
+        iterator = iter(strings)
+        pending = deque()
+        while True:
+            while len(pending) < self.max_pending:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                pending.append((chunk, self.submit(chunk, country_code, decode)))
+
+            if not pending:
+                return
+
+            chunk, future = pending.popleft()
+            for string, (code, compact_components) in zip(chunk, future.result()):
+                yield string, code, expand(compact_components)
+
+    def submit(self, strings: Sequence[str], country_code: str = None, decode: bool = False) -> Future:
+        """
+        Send one chunk of addresses to a worker.
+
+        :return: A future of the country code and the compact components of each address, see parse_chunk_compact.
+        """
+
+        if not self.metrics:
+            return self.executor.submit(parse_chunk_compact, strings, country_code, decode)
+
+        future = Future()
+
+        def merge(measured: Future) -> None:
+            try:
+                results, aggregates = measured.result()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            instruments.merge(aggregates)
+            future.set_result(results)
+
+        self.executor.submit(parse_chunk_measured, strings, country_code, decode).add_done_callback(merge)
+        return future
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'ParserPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,438 @@
+import hashlib
+import json
+import logging
+import marshal
+import math
+import operator
+import os
+import sys
+from configparser import ConfigParser
+from pathlib import Path
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import config
+from src.exceptions import (
+    CriteriaTypeError, FailedToSaveRuleException, InconclusiveEvaluationException, InvalidOperatorError,
+    MissingConstantError, MissingCriteriaError, MissingRuleDeclarationForComponent, RuleException,
+    ToManyRulesDeclaredForComponent
+)
+from .component import AddressComponentType
+from .features import FEATURE_NAMES
+from .heuristics import BOOL, COUNT, DISTANCE, HeuristicDefinition
+
+if TYPE_CHECKING:
+    from .country import CountryConfig
+
+__all__ = [
+    'OPERATORS',
+    'RuleSet',
+    'compile_rules',
+    'parse_rule',
+    'read_rules'
+]
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'BUACHERU'
+# Increase when the generated source changes, so older artifacts are compiled again.
+VERSION = 1
+
+RULES_SECTION = 'AddressRules'
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+SYMBOLS = {function: symbol for symbol, function in OPERATORS.items()}
+
+KINDS = (BOOL, COUNT, DISTANCE)
+FIELDS = ('kind', 'option', 'feature', 'operator', 'criteria', 'multiplier', 'guard')
+
+Records = Mapping[AddressComponentType, Sequence[Tuple]]
+
+
+def unique_keys(pairs: List[Tuple[str, Any]]) -> dict:
+    """
+    object_pairs_hook for json.loads that refuses keys that are declared more than once, instead of keeping the last.
+    """
+
+    result = {}
+    for key, value in pairs:
+        if key in result:
+            raise ToManyRulesDeclaredForComponent(f'"{key}" is declared more than once.')
+        result[key] = value
+    return result
+
+
+def read_rules(content: str, source: str = '<rules>') -> Dict[str, Any]:
+    """
+    Read a rule file. It is an object with up to three members, which all map names to declarations:
+
+        constants: numbers that criteria and multipliers can refer to by name.
+        groups: lists of rules that components can include by name.
+        components: the rules of each component type, by lower case name. An item is a rule or the name of a group.
+
+    A rule is an object with the fields of a HeuristicDefinition: kind, option, feature, operator (==, !=, <, <=, >,
+    >=), criteria (the value), multiplier and guard.
+    """
+
+    declarations = json.loads(content, object_pairs_hook=unique_keys)
+    if not isinstance(declarations, dict):
+        raise RuleException(f'{source}: the rules must be an object.')
+    for member, value in declarations.items():
+        if member not in ('constants', 'groups', 'components'):
+            raise RuleException(f'{source}: unknown member "{member}".')
+        if not isinstance(value, dict):
+            raise RuleException(f'{source}: "{member}" must be an object.')
+    return declarations
+
+
+def number(value: Any, constants: Mapping[str, Any], source: str) -> Union[int, float]:
+    if isinstance(value, str):
+        if value not in constants:
+            raise MissingConstantError(f'{source}: the constant "{value}" is not declared.')
+        value = constants[value]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise CriteriaTypeError(f'{source}: {value!r} is not a number.')
+    return value
+
+
+def parse_rule(rule: Mapping[str, Any], constants: Mapping[str, Any], source: str = '<rule>') -> HeuristicDefinition:
+    """
+    Validate a declared rule and return its HeuristicDefinition.
+
+    :param rule: The fields of the rule.
+    :param constants: The constants criteria and multipliers can refer to.
+    :param source: Where the rule is declared, used in error messages.
+    :raises RuleException: If the rule is not valid, as the most specific subclass.
+    """
+
+    if not isinstance(rule, Mapping):
+        raise RuleException(f'{source}: a rule must be an object, not {rule!r}.')
+    for field in rule:
+        if field not in FIELDS:
+            raise RuleException(f'{source}: unknown field "{field}".')
+
+    kind = rule.get('kind')
+    if kind not in KINDS:
+        raise RuleException(f'{source}: the kind must be one of {", ".join(KINDS)}, not {kind!r}.')
+    for field in ('feature', 'guard'):
+        if rule.get(field) is not None and rule[field] not in FEATURE_NAMES:
+            raise RuleException(f'{source}: unknown {field} {rule[field]!r}.')
+    if rule.get('feature') is None:
+        raise RuleException(f'{source}: the rule has no feature.')
+
+    symbol = rule.get('operator')
+    if kind == BOOL and symbol not in OPERATORS:
+        raise InvalidOperatorError(f'{source}: the operator must be one of {" ".join(OPERATORS)}, not {symbol!r}.')
+    if kind != BOOL and symbol is not None:
+        raise InvalidOperatorError(f'{source}: only {BOOL} rules have an operator.')
+
+    criteria = rule.get('criteria')
+    if criteria is not None:
+        criteria = number(criteria, constants, source)
+    elif kind == BOOL:
+        raise MissingCriteriaError(f'{source}: the rule has no criteria to compare with.')
+
+    option, multiplier = rule.get('option'), rule.get('multiplier')
+    if multiplier is not None:
+        multiplier = number(multiplier, constants, source)
+    if option is not None and not isinstance(option, str):
+        raise RuleException(f'{source}: the option must be a string, not {option!r}.')
+    if option is None and multiplier is None:
+        raise MissingConstantError(f'{source}: the rule has neither an option nor a multiplier.')
+
+    return HeuristicDefinition(
+        kind, option, rule['feature'], OPERATORS.get(symbol), criteria, multiplier, rule.get('guard')
+    )
+
+
+def literal(token: str) -> Union[int, float, str]:
+    """
+    Return a token of the compact form as a number, or unchanged if it is the name of a constant.
+    """
+
+    for kind in (int, float):
+        try:
+            return kind(token)
+        except ValueError:
+            pass
+    return token
+
+
+def parse_line(line: str) -> Dict[str, Any]:
+    """
+    Split the compact form of a rule, "kind feature [operator] [criteria] [* multiplier] [if guard]", into its fields.
+    """
+
+    tokens = line.split()
+    fields = {}
+    if len(tokens) > 2 and tokens[-2] == 'if':
+        fields['guard'] = tokens.pop()
+        tokens.pop()
+    if len(tokens) > 2 and tokens[-2] == '*':
+        fields['multiplier'] = literal(tokens.pop())
+        tokens.pop()
+    if len(tokens) < 2:
+        raise RuleException(f'"{line}" is not a rule, expected "kind feature [operator] [criteria]".')
+
+    fields['kind'], fields['feature'], *rest = tokens
+    if rest and set(rest[0]) <= set('<>=!'):
+        fields['operator'] = rest.pop(0)
+    if rest:
+        fields['criteria'] = literal(rest.pop(0))
+    if rest:
+        raise RuleException(f'"{line}" has more than one criteria.')
+    return fields
+
+
+def compile_rules(
+        declarations: Sequence[Tuple[str, Mapping[str, Any]]],
+        parser: Optional[ConfigParser] = None
+) -> Dict[AddressComponentType, Tuple[HeuristicDefinition, ...]]:
+    """
+    Validate the rules of a country and return the definitions of each component type.
+
+    Declarations are merged in order, a later one replaces the constants, groups and components of earlier ones with
+    the same name. The AddressRules.<component> sections of the configuration then add rules in compact form to a
+    component, keyed by their option, or only by a name if the rule has a fixed multiplier:
+
+        [AddressRules.street_number]
+        operator_gt_token_0 = bool number > 0 if is_digit
+
+    :param declarations: (source, rules) pairs, where rules were read with read_rules.
+    :param parser: The configuration of the country.
+    :raises RuleException: If a rule is not valid, or a component type has no declared rules.
+    """
+
+    constants, groups, components = {}, {}, {}
+    for source, declaration in declarations:
+        constants.update(declaration.get('constants', {}))
+        groups.update((name, (source, rules)) for name, rules in declaration.get('groups', {}).items())
+        components.update((name, (source, rules)) for name, rules in declaration.get('components', {}).items())
+
+    rules: Dict[AddressComponentType, List[HeuristicDefinition]] = {}
+    for name, (source, items) in components.items():
+        if name.upper() not in AddressComponentType.__members__:
+            raise RuleException(f'{source}: rules are declared for the unknown component "{name}".')
+        if not isinstance(items, list):
+            raise RuleException(f'{source}: the rules of "{name}" must be a list.')
+
+        definitions = rules[AddressComponentType[name.upper()]] = []
+        for index, item in enumerate(items):
+            if not isinstance(item, str):
+                definitions.append(parse_rule(item, constants, f'{source}: {name}[{index}]'))
+                continue
+            if item not in groups:
+                raise MissingRuleDeclarationForComponent(f'{source}: {name} includes the undeclared group "{item}".')
+            group_source, group = groups[item]
+            if not isinstance(group, list):
+                raise RuleException(f'{group_source}: the group "{item}" must be a list.')
+            for position, rule in enumerate(group):
+                definitions.append(parse_rule(rule, constants, f'{group_source}: {item}[{position}]'))
+
+    for section in parser.sections() if parser is not None else ():
+        parts = section.split('.')
+        if parts[0] != RULES_SECTION:
+            continue
+        if len(parts) != 2 or parts[1].upper() not in AddressComponentType.__members__:
+            raise RuleException(f'[{section}] does not name a component type.')
+        definitions = rules.setdefault(AddressComponentType[parts[1].upper()], [])
+        for option, line in parser.items(section):
+            fields = parse_line(line)
+            if 'multiplier' not in fields:
+                fields['option'] = option
+            definitions.append(parse_rule(fields, constants, f'[{section}] {option}'))
+
+    missing = [ct.name.lower() for ct in AddressComponentType if ct not in rules]
+    if missing:
+        raise MissingRuleDeclarationForComponent(f'No rules are declared for {", ".join(missing)}.')
+    return {ct: tuple(rules[ct]) for ct in AddressComponentType}
+
+
+def function_name(component_type: AddressComponentType) -> str:
+    return f'evaluate_{component_type.name.lower()}'
+
+
+def number_source(value: float) -> str:
+    return repr(value) if math.isfinite(value) else f"float('{value}')"
+
+
+def record_source(kind: str, feature: int, operation: Optional[Callable], value: Optional[float],
+                  multiplier: float) -> List[str]:
+    """
+    Return the statements that evaluate one record of a HeuristicPlan, like HeuristicPlan records are interpreted.
+    """
+
+    x, m = f'features[{feature}]', number_source(multiplier)
+    if kind == BOOL:
+        if operation not in SYMBOLS:
+            raise InvalidOperatorError(f'{operation!r} can not be compiled, the operator must be one of OPERATORS.')
+        return [
+            f'if {x} {SYMBOLS[operation]} {number_source(value)}:',
+            f'    confidence *= {m}',
+            '    passed = True',
+            'else:',
+            f'    no_confidence *= {m}',
+            '    failed = True',
+        ]
+    if kind == COUNT:
+        score = f'1 + x * {m}' if value is None else f'1 + abs(x - {number_source(value)}) * {m}'
+        return [
+            f'x = {x}',
+            'if x > 0:',
+            '    passed = True',
+            f'    confidence *= {score}',
+            'else:',
+            '    failed = True',
+            f'    no_confidence *= {score}',
+        ]
+    return [
+        'passed = True',
+        f'confidence *= 1 / (abs({x} - {number_source(value)}) * {m} + 1)',
+    ]
+
+
+def generate_source(records: Records) -> str:
+    """
+    Return the Python source of a module with one function per component type, see RuleSet.
+    """
+
+    lines = []
+    for component_type, plan in records.items():
+        lines += [
+            f'def {function_name(component_type)}(features):',
+            '    confidence = 1.0',
+            '    no_confidence = 1.0',
+            '    passed = False',
+            '    failed = False',
+        ]
+        for kind, feature, operation, value, multiplier, guard in plan:
+            statements = record_source(kind, feature, operation, value, multiplier)
+            if guard >= 0:
+                statements = [f'if features[{guard}]:'] + ['    ' + s for s in statements]
+            lines.append(f'    # {kind} {FEATURE_NAMES[feature]}')
+            lines += ['    ' + s for s in statements]
+        lines += [
+            '    if no_confidence > confidence and failed:',
+            '        return False, no_confidence - confidence',
+            '    if confidence > no_confidence and passed:',
+            '        return True, confidence - no_confidence',
+            '    raise InconclusiveEvaluationException(',
+            f"        'Unable to determine if the token is a {component_type.name}')",
+            '',
+            '',
+        ]
+    return '\n'.join(lines)
+
+
+class RuleSet:
+    """
+    The heuristic plans of a country compiled into one Python function per component type.
+
+    The records of the plans are generated as Python source, with features as indexes into the feature tuple,
+    operators as comparisons and criteria, multipliers and positions as literals, and compiled once. Evaluating a
+    token is then a single call that runs straight through its rules, without loops, dictionary lookups or calls of
+    operator functions. The functions return and raise exactly what interpreting the records would.
+
+    The compiled module can be saved with marshal, like a .pyc file, so a process that starts with an unchanged
+    configuration neither generates nor compiles it.
+
+    Attributes:
+
+        key: identifies what the module was compiled from, see artifact_key.
+        code: the compiled module.
+        functions: the evaluate function of each component type in the module.
+    """
+
+    def __init__(self, code: CodeType, key: str = ''):
+        self.key = key
+        self.code = code
+        namespace = {'InconclusiveEvaluationException': InconclusiveEvaluationException}
+        exec(code, namespace)
+        self.functions: Dict[AddressComponentType, Callable] = {
+            ct: namespace[function_name(ct)] for ct in AddressComponentType if function_name(ct) in namespace
+        }
+
+    @staticmethod
+    def artifact_key(country_config: 'CountryConfig') -> str:
+        """
+        Return a key that changes with the configuration of a country, the generated source and the Python version.
+        """
+
+        digest = hashlib.sha1(country_config.fingerprint.encode('utf-8'))
+        digest.update(f'{VERSION}:{sys.implementation.cache_tag}:{",".join(FEATURE_NAMES)}'.encode('utf-8'))
+        return digest.hexdigest()
+
+    @classmethod
+    def compile(cls, records: Records, key: str = '') -> 'RuleSet':
+        """
+        Generate and compile the functions of the records of HeuristicPlans, by component type.
+        """
+
+        source = generate_source(records)
+        return cls(compile(source, f'<rules {key}>' if key else '<rules>', 'exec'), key)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Save the compiled module. The file is written to a temporary name and renamed.
+
+        :raises FailedToSaveRuleException: If the file could not be written.
+        """
+
+        path = Path(path)
+        temporary = path.with_name(path.name + '.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_bytes(marshal.dumps((MAGIC, self.key, self.code)))
+            os.replace(temporary, path)
+        except (OSError, ValueError) as e:
+            raise FailedToSaveRuleException(f'Could not save the compiled rules to {path}.') from e
+
+    @classmethod
+    def load(cls, path: Union[str, Path], key: str) -> Optional['RuleSet']:
+        """
+        Load a module saved with save, or return None if there is none or it was compiled from something else.
+        """
+
+        try:
+            magic, found, code = marshal.loads(Path(path).read_bytes())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if magic != MAGIC or found != key or not isinstance(code, CodeType):
+            return None
+        return cls(code, key)
+
+    @classmethod
+    def for_country(cls, country_config: 'CountryConfig', records: Records,
+                    folder: Union[str, Path] = None) -> 'RuleSet':
+        """
+        Return the compiled rules of a country. They are loaded from folder if they were saved for the same key,
+        otherwise they are compiled and saved there. Without a folder they are compiled and nothing is written.
+
+        :param records: The records of the plans of the country, by component type.
+        :param folder: Where compiled rules are saved. Defaults to config.rules_cache_folder.
+        """
+
+        key = cls.artifact_key(country_config)
+        folder = config.rules_cache_folder if folder is None else folder
+        if folder is None:
+            return cls.compile(records, key)
+
+        path = Path(folder) / f'{country_config.country_code}.rules'
+        rule_set = cls.load(path, key)
+        if rule_set is not None:
+            log.debug(f'Loaded the compiled rules for "{country_config.country_code}" from {path}.')
+            return rule_set
+
+        rule_set = cls.compile(records, key)
+        try:
+            rule_set.save(path)
+        except FailedToSaveRuleException as e:
+            log.warning(f'{e} They are compiled again by the next process.')
+        return rule_set
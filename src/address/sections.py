@@ -0,0 +1,282 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Mapping, Tuple, Union
+
+import numpy as np
+
+from src.exceptions import ConfigurationError
+
+__all__ = [
+    'PostingLists',
+    'SectionFile',
+    'StringTable',
+    'pack_postings',
+    'pack_strings',
+    'stable_hash',
+    'write_sections'
+]
+
+# magic, format version, number of sections, digest of the section data
+HEADER = struct.Struct('<8sII16s')
+# name, dtype, offset, size in bytes
+ENTRY = struct.Struct('<32s8sQQ')
+ALIGNMENT = 8
+
+Section = Union[np.ndarray, bytes]
+
+
+def aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_sections(path: Union[str, Path], magic: bytes, sections: Mapping[str, Section], version: int = 1) -> str:
+    """
+    Write named arrays to a file that SectionFile maps into memory.
+
+    Every section starts at a multiple of eight bytes, so the arrays can be used in place. The file is written to a
+    temporary name and renamed, readers never see a partial file.
+
+    :param magic: Eight bytes identifying the kind of file.
+    :param sections: Arrays or byte strings by name.
+    :return: The hex digest of the section data.
+    """
+
+    table_size = HEADER.size + ENTRY.size * len(sections)
+    entries, blobs, offset = [], [], aligned(table_size)
+    digest = hashlib.blake2b(digest_size=16)
+    for name, section in sections.items():
+        if isinstance(section, np.ndarray):
+            dtype, data = section.dtype.str, np.ascontiguousarray(section).tobytes()
+        else:
+            dtype, data = '|u1', bytes(section)
+        entries.append(ENTRY.pack(name.encode('utf-8'), dtype.encode('ascii'), offset, len(data)))
+        blobs.append((offset, data))
+        digest.update(name.encode('utf-8'))
+        digest.update(data)
+        offset = aligned(offset + len(data))
+
+    path = Path(path)
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(magic, version, len(entries), digest.digest()))
+        output.writelines(entries)
+        for start, data in blobs:
+            output.seek(start)
+            output.write(data)
+        output.truncate(offset)
+    os.replace(temporary, path)
+    return digest.hexdigest()
+
+
+class SectionFile:
+    """
+    A file written by write_sections, mapped read only into memory.
+
+    Opening only reads the section table. Arrays are views of the mapping, so their pages are loaded when they are
+    used and are shared by every process that maps the same file. Files of another kind, of another format version
+    or that are cut short raise a ConfigurationError, as do sections the file does not have.
+
+    Attributes:
+
+        path: the mapped file.
+        version: the format version the file was written with.
+        digest: the hex digest of the section data.
+    """
+
+    def __init__(self, path: Union[str, Path], magic: bytes, version: int = 1):
+        """
+        :param path: A file written by write_sections.
+        :param magic: The eight bytes the file was written with.
+        :param version: The format version the file must have been written with.
+        :raises ConfigurationError: If the file is not a complete file of the kind and version.
+        """
+
+        self.path = str(path)
+        kind = magic.decode('ascii', 'replace')
+        with open(self.path, 'rb') as source:
+            if os.fstat(source.fileno()).st_size < HEADER.size:
+                raise ConfigurationError(f'{self.path} is not a {kind} file.')
+            self.mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+        found, self.version, count, digest = HEADER.unpack_from(self.mmap, 0)
+        if found != magic:
+            raise ConfigurationError(f'{self.path} is not a {kind} file.')
+        if self.version != version:
+            raise ConfigurationError(
+                f'{self.path} has format version {self.version}, not {version}. Compile it again.')
+        self.digest = digest.hex()
+
+        if HEADER.size + count * ENTRY.size > len(self.mmap):
+            raise ConfigurationError(f'{self.path} is truncated.')
+        self.entries: Dict[str, Tuple[str, int, int]] = {}
+        for index in range(count):
+            name, dtype, offset, size = ENTRY.unpack_from(self.mmap, HEADER.size + index * ENTRY.size)
+            if offset + size > len(self.mmap):
+                raise ConfigurationError(f'{self.path} is truncated.')
+            self.entries[name.rstrip(b'\0').decode('utf-8')] = (dtype.rstrip(b'\0').decode('ascii'), offset, size)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def entry(self, name: str) -> Tuple[str, int, int]:
+        try:
+            return self.entries[name]
+        except KeyError:
+            raise ConfigurationError(f'{self.path} has no section "{name}".')
+
+    def array(self, name: str) -> np.ndarray:
+        dtype, offset, size = self.entry(name)
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.mmap, dtype=dtype, count=size // dtype.itemsize, offset=offset)
+
+    def view(self, name: str) -> memoryview:
+        """
+        Return a section as a memoryview of its items, which is faster than an array for single items.
+        """
+
+        dtype, offset, size = self.entry(name)
+        return memoryview(self.mmap)[offset:offset + size].cast(np.dtype(dtype).char)
+
+    def close(self) -> None:
+        try:
+            self.mmap.close()
+        except BufferError:
+            # Arrays of the file are still in use, the mapping is closed when they are released.
+            pass
+
+
+def pack_strings(strings) -> Tuple[np.ndarray, bytes]:
+    """
+    Encode strings as UTF-8 into one blob, with the offset of each string followed by the size of the blob.
+    """
+
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+class StringTable:
+    """
+    A sorted table of strings in a SectionFile, searched with binary search without decoding the table.
+
+    Keys are compared as UTF-8 bytes, which orders them like their code points.
+
+    Attributes:
+
+        offsets: the start of each key in buffer, followed by the size of buffer.
+        buffer: the keys, as one UTF-8 blob.
+    """
+
+    def __init__(self, sections: SectionFile, name: str):
+        self.offsets = sections.view(f'{name}.offsets')
+        self.buffer = sections.view(f'{name}.data')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def key(self, index: int) -> bytes:
+        return bytes(self.buffer[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index: int) -> str:
+        return self.key(index).decode('utf-8')
+
+    def bisect(self, key: bytes) -> int:
+        """
+        Return the index of the first key that is not smaller than key.
+        """
+
+        offsets, buffer = self.offsets, self.buffer
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(buffer[offsets[middle]:offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key: str) -> int:
+        """
+        Return the index of a key, or -1 if the table does not have it.
+        """
+
+        encoded = key.encode('utf-8')
+        index = self.bisect(encoded)
+        if index < len(self) and self.key(index) == encoded:
+            return index
+        return -1
+
+    def prefixed(self, prefix: str, limit: int = 10) -> Iterator[int]:
+        """
+        Return the indexes of up to limit keys that start with a prefix, in key order.
+        """
+
+        encoded = prefix.encode('utf-8')
+        index = self.bisect(encoded)
+        for index in range(index, min(len(self), index + limit)):
+            if not self.key(index).startswith(encoded):
+                return
+            yield index
+
+
+def stable_hash(key: str) -> int:
+    """
+    A 64 bit hash that is the same in every process, unlike hash(). Collisions only add candidates that are then
+    rejected by the caller.
+    """
+
+    encoded = key.encode('utf-8')
+    return zlib.crc32(encoded) << 32 | zlib.adler32(encoded)
+
+
+def pack_postings(hashes: Iterable[int], ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group ids by hash for PostingLists: return the sorted distinct hashes, the start of the ids of each hash followed
+    by the number of ids, and the ids.
+    """
+
+    hashes = np.fromiter(hashes, dtype='<u8')
+    ids = np.fromiter(ids, dtype='<u4')
+    order = np.lexsort((ids, hashes))
+    hashes, ids = hashes[order], ids[order]
+    distinct, starts = np.unique(hashes, return_index=True)
+    return distinct, np.append(starts, len(ids)).astype('<u8'), ids
+
+
+class PostingLists:
+    """
+    An inverted index from 64 bit hashes to ids in a SectionFile, written with pack_postings.
+
+    Attributes:
+
+        hashes: the sorted distinct hashes.
+        offsets: the ids of hashes[i] are postings[offsets[i]:offsets[i + 1]].
+        postings: the ids.
+    """
+
+    def __init__(self, sections: SectionFile, name: str):
+        self.hashes = sections.array(f'{name}.hashes')
+        self.offsets = sections.array(f'{name}.posting_offsets')
+        self.postings = sections.array(f'{name}.postings')
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Return the distinct ids of any of the hashes, in ascending order.
+        """
+
+        indexes = np.searchsorted(self.hashes, hashes)
+        found = indexes < len(self.hashes)
+        indexes, hashes = indexes[found], hashes[found]
+        indexes = indexes[self.hashes[indexes] == hashes]
+        if not len(indexes):
+            return np.empty(0, dtype=self.postings.dtype)
+        starts, ends = self.offsets[indexes], self.offsets[indexes + 1]
+        return np.unique(np.concatenate([self.postings[s:e] for s, e in zip(starts.tolist(), ends.tolist())]))
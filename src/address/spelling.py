@@ -0,0 +1,327 @@
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from src.instrumentation import instruments
+from .component import AddressComponent, AddressComponentType
+from .database import AddressDatabase
+from .sections import (
+    PostingLists, SectionFile, StringTable, pack_postings, pack_strings, stable_hash, write_sections
+)
+
+__all__ = [
+    'SpellingCorrector',
+    'edit_distance'
+]
+
+MAGIC = b'BUACHESP'
+VERSION = 1
+
+# The component types that are corrected, and the name of their sections.
+VOCABULARIES = {
+    AddressComponentType.STREET_NAME: 'streets',
+    AddressComponentType.CITY: 'cities',
+}
+
+
+def letters(key: str) -> int:
+    """
+    Return a 64 bit mask of the characters in a key. One edit adds at most one character to the mask and removes at
+    most one, so two keys within distance edits differ in at most distance bits each way.
+    """
+
+    mask = 0
+    for character in key:
+        mask |= 1 << (ord(character) & 63)
+    return mask
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    return np.unpackbits(masks.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def deletes(key: str, distance: int) -> Set[str]:
+    """
+    Return the key and every string that is made from it by deleting up to distance characters.
+    """
+
+    found = {key}
+    edge = [key]
+    for _ in range(distance):
+        following = []
+        for word in edge:
+            if len(word) <= 1:
+                continue
+            for index in range(len(word)):
+                candidate = word[:index] + word[index + 1:]
+                if candidate not in found:
+                    found.add(candidate)
+                    following.append(candidate)
+        edge = following
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Return the optimal string alignment distance between two strings, where a transposition of two neighbouring
+    characters is one edit, or limit + 1 as soon as it is certain to be larger than limit.
+    """
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        smallest = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            smallest = min(smallest, value)
+        if smallest > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class Vocabulary:
+    """
+    The terms of one component type in a spelling index, and the deletes of their prefixes.
+
+    Attributes:
+
+        terms: the sorted, case folded terms.
+        names: the spelling of each term.
+        counts: how often each term occurs in the reference data.
+        lengths: the number of characters of each term.
+        letters: the character mask of each term, see letters().
+        deletes: the ids of the terms by the hashes of their deletes.
+    """
+
+    def __init__(self, sections: SectionFile, name: str):
+        self.terms = StringTable(sections, name)
+        self.names = StringTable(sections, f'{name}.names')
+        self.counts = sections.array(f'{name}.counts')
+        self.lengths = sections.array(f'{name}.lengths')
+        self.letters = sections.array(f'{name}.letters')
+        self.deletes = PostingLists(sections, name)
+
+    def candidates(self, delete_hashes: np.ndarray, key: str, distance: int) -> np.ndarray:
+        """
+        Return the ids of the terms that share a delete with a query, given the hashes of the deletes of the query,
+        without the terms whose length or characters already differ from the query by more than distance edits.
+        """
+
+        ids = self.deletes.lookup(delete_hashes)
+        ids = ids[np.abs(self.lengths[ids].astype(np.int64) - len(key)) <= distance]
+        query, masks = np.uint64(letters(key)), self.letters[ids]
+        close = (popcount(masks & ~query) <= distance) & (popcount(query & ~masks) <= distance)
+        return ids[close]
+
+
+class SpellingCorrector:
+    """
+    Corrects misspelled street and city names with a symmetric delete index, like SymSpell.
+
+    Every reference term is indexed under all strings that are made from its first prefix_length characters by
+    deleting up to max_distance characters. A query generates the same deletes of its own prefix, and the terms that
+    share one of them are the only ones that can be within max_distance edits. Only those few candidates are
+    compared with the query, after the ones whose length or characters are too different are filtered out, the
+    vocabulary is never scanned. The closest candidate wins, ties go to the term that is
+    most common in the reference data.
+
+    The index is compiled offline, from an AddressDatabase or from word lists, into one file that is memory mapped
+    when it is opened. Deletes are stored as sorted 64 bit hashes with the ids of their terms.
+
+    Attributes:
+
+        path: the index file.
+        country_code: the country the vocabulary belongs to.
+        max_distance: the largest number of edits that is corrected.
+        prefix_length: the number of leading characters that are indexed.
+        penalty: the share of confidence a corrected component loses per edit.
+        vocabularies: the Vocabulary of each component type.
+    """
+
+    def __init__(self, path: Union[str, Path], penalty: float = 0.1, cache_size: int = 10000):
+        """
+        :param path: A file written by compile.
+        :param penalty: The share of confidence a corrected component loses per edit.
+        :param cache_size: The number of corrections kept in memory.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.path = str(path)
+        self.penalty = penalty
+        self.cache_size = cache_size
+
+        self.sections = SectionFile(self.path, MAGIC, VERSION)
+        settings = self.sections.array('settings')
+        self.max_distance, self.prefix_length = int(settings[0]), int(settings[1])
+        self.country_code = bytes(self.sections.array('country_code')).decode('utf-8')
+        self.vocabularies = {
+            component_type: Vocabulary(self.sections, name) for component_type, name in VOCABULARIES.items()
+        }
+        self._cache: 'OrderedDict[Tuple[AddressComponentType, str], Tuple[Optional[str], int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {'path': self.path, 'penalty': self.penalty, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    @classmethod
+    def compile(cls, vocabularies: Mapping[AddressComponentType, Iterable[Tuple[str, int]]], path: Union[str, Path],
+                country_code: str = 'default', max_distance: int = 2, prefix_length: int = 7) -> 'SpellingCorrector':
+        """
+        Compile reference vocabularies into an index file.
+
+        :param vocabularies: (spelling, count) pairs for STREET_NAME and CITY. Spellings that fold to the same term
+        are merged.
+        :param path: The file to write.
+        :param country_code: The country of the vocabularies.
+        :param max_distance: The largest number of edits that is corrected.
+        :param prefix_length: The number of leading characters that are indexed.
+        :return: The compiled corrector.
+        """
+
+        sections = {
+            'settings': np.array([max_distance, prefix_length], dtype='<u4'),
+            'country_code': country_code.encode('utf-8'),
+        }
+        for component_type, name in VOCABULARIES.items():
+            merged: Dict[str, List] = {}
+            for spelling, count in vocabularies.get(component_type, ()):
+                term = ' '.join(spelling.split()).casefold()
+                if not term:
+                    continue
+                entry = merged.setdefault(term, [spelling, 0])
+                entry[1] += count
+
+            terms = sorted(merged, key=lambda t: t.encode('utf-8'))
+            sections[f'{name}.offsets'], sections[f'{name}.data'] = pack_strings(terms)
+            sections[f'{name}.names.offsets'], sections[f'{name}.names.data'] = \
+                pack_strings(merged[t][0] for t in terms)
+            sections[f'{name}.counts'] = np.array([merged[t][1] for t in terms], dtype='<u4')
+            sections[f'{name}.lengths'] = np.array([min(len(t), 0xffff) for t in terms], dtype='<u2')
+            sections[f'{name}.letters'] = np.array([letters(t) for t in terms], dtype='<u8')
+
+            hashes, ids = [], []
+            for index, term in enumerate(terms):
+                for delete in deletes(term[:prefix_length], max_distance):
+                    hashes.append(stable_hash(delete))
+                    ids.append(index)
+            sections[f'{name}.hashes'], sections[f'{name}.posting_offsets'], sections[f'{name}.postings'] = \
+                pack_postings(hashes, ids)
+
+        write_sections(path, MAGIC, sections, VERSION)
+        logging.getLogger(__name__).info(f'Compiled the spelling index {path} for "{country_code}".')
+        return cls(path)
+
+    @classmethod
+    def from_database(cls, database: AddressDatabase, path: Union[str, Path], country_code: str = 'default',
+                      **kwargs) -> 'SpellingCorrector':
+        """
+        Compile an index from the street names and cities of an AddressDatabase.
+        """
+
+        return cls.compile(database.vocabularies(VOCABULARIES), path, country_code, **kwargs)
+
+    def known(self, component_type: AddressComponentType, component_value: str) -> bool:
+        """
+        Return whether a value is a term of the vocabulary of its component type.
+        """
+
+        vocabulary = self.vocabularies.get(component_type)
+        return vocabulary is not None and vocabulary.terms.find(' '.join(component_value.split()).casefold()) >= 0
+
+    def lookup(self, component_type: AddressComponentType, component_value: str) -> Tuple[Optional[str], int]:
+        """
+        Find the closest term to a value.
+
+        :return: The spelling of the term and its edit distance from the value, or (None, max_distance + 1) if no term
+        is within max_distance edits.
+        """
+
+        vocabulary = self.vocabularies.get(component_type)
+        if vocabulary is None:
+            return None, self.max_distance + 1
+        key = ' '.join(component_value.split()).casefold()
+        with self._lock:
+            cached = self._cache.get((component_type, key))
+            if cached is not None:
+                self._cache.move_to_end((component_type, key))
+                return cached
+
+        # The search runs without the lock, threads that look up the same key at once both search it.
+        with instruments.stage('correct_spelling'):
+            result = self.search(vocabulary, key)
+
+        with self._lock:
+            self._cache[(component_type, key)] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def search(self, vocabulary: Vocabulary, key: str) -> Tuple[Optional[str], int]:
+        index = vocabulary.terms.find(key)
+        if index >= 0:
+            return vocabulary.names[index], 0
+
+        query_hashes = np.fromiter(
+            (stable_hash(d) for d in deletes(key[:self.prefix_length], self.max_distance)), dtype=np.uint64)
+        best, best_distance, best_count = None, self.max_distance + 1, -1
+        for index in vocabulary.candidates(query_hashes, key, self.max_distance).tolist():
+            distance = edit_distance(key, vocabulary.terms[index], min(best_distance, self.max_distance))
+            if distance > self.max_distance:
+                continue
+            count = int(vocabulary.counts[index])
+            if distance < best_distance or (distance == best_distance and count > best_count):
+                best, best_distance, best_count = index, distance, count
+
+        if best is None:
+            return None, self.max_distance + 1
+        return vocabulary.names[best], best_distance
+
+    def correct_spelling(self, component_value: str,
+                         component_type: AddressComponentType = AddressComponentType.STREET_NAME) -> str:
+        """
+        Return the corrected spelling of a value, or the value itself if there is no term close enough.
+        """
+
+        corrected, _ = self.lookup(component_type, component_value)
+        return component_value if corrected is None else corrected
+
+    def correct_components(self, components: List[AddressComponent]) -> List[AddressComponent]:
+        """
+        Correct the street names and cities of an address that are not in the vocabulary. A corrected component is
+        a new AddressComponent with the spelling of the term, and loses penalty of its confidence per edit. It keeps
+        the words of the original value, see AddressComponent.
+        """
+
+        corrected = []
+        for component in components:
+            if component.component_type in self.vocabularies:
+                term, distance = self.lookup(component.component_type, component.component_value)
+                if term is not None and distance > 0:
+                    confidence = round(component.confidence * max(0.0, 1 - self.penalty * distance), 2)
+                    component = AddressComponent(component.component_type, term, confidence, component.position,
+                                                 component.span)
+            corrected.append(component)
+        return corrected
+
+    def close(self) -> None:
+        self.sections.close()
+
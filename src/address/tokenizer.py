@@ -0,0 +1,126 @@
+import re
+from array import array
+from typing import Iterator, List, NamedTuple, Sequence
+
+from src.exceptions import AddressTokenizationException
+
+__all__ = [
+    'Token',
+    'TokenTable',
+    'Tokenizer'
+]
+
+
+class Token(NamedTuple):
+    """
+    A single token of an address.
+
+    Attributes:
+
+        text: the text of the token, as it appears in the address.
+        start: offset of the first character of the token in the address.
+        end: offset after the last character of the token in the address.
+        index: index of the first word of the token among the words of the address.
+        size: the number of words in the token.
+    """
+    text: str
+    start: int
+    end: int
+    index: int
+    size: int
+
+
+class TokenTable:
+    """
+    Compact table of the tokens of one address.
+
+    The tokens are stored column wise in arrays of integers, the text of a token is only sliced from the address when
+    it is requested. Rows are ordered by n-gram size and then by word index, so all single words come first.
+
+    Attributes:
+
+        source: the address the tokens were created from.
+        starts: start offsets of the tokens.
+        ends: end offsets of the tokens.
+        indexes: word indexes of the tokens.
+        sizes: number of words in the tokens.
+    """
+
+    __slots__ = ('source', 'starts', 'ends', 'indexes', 'sizes')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.starts = array('l')
+        self.ends = array('l')
+        self.indexes = array('l')
+        self.sizes = array('l')
+
+    def append(self, start: int, end: int, index: int, size: int) -> None:
+        self.starts.append(start)
+        self.ends.append(end)
+        self.indexes.append(index)
+        self.sizes.append(size)
+
+    def text(self, row: int) -> str:
+        return self.source[self.starts[row]:self.ends[row]]
+
+    def texts(self) -> List[str]:
+        source = self.source
+        return [source[start:end] for start, end in zip(self.starts, self.ends)]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, row: int) -> Token:
+        return Token(self.text(row), self.starts[row], self.ends[row], self.indexes[row], self.sizes[row])
+
+    def __iter__(self) -> Iterator[Token]:
+        for row in range(len(self)):
+            yield self[row]
+
+
+class Tokenizer:
+    """
+    Splits an address into words and combines neighbouring words into n-grams.
+
+    This is a word based version of the sliding window in application_design.md 3.7.1.1. A window of each configured
+    size is moved over the words of the address and every position of the window becomes a token. The words are
+    found in a single pass and each token is created in constant time, so tokenizing is linear in the length of the
+    address.
+
+    The text of a token spanning several words is the slice of the address from its first to its last word, so the
+    address should have single spaces between words, as AbbreviationNormalizer.normalize returns it.
+    """
+
+    WORD = re.compile(r'\S+')
+
+    def __init__(self, sizes: Sequence[int] = (1, 2)):
+        """
+        :param sizes: The window sizes, in words, to create tokens for.
+        """
+
+        if not sizes or any(size < 1 for size in sizes):
+            raise AddressTokenizationException(f'Invalid n-gram sizes {sizes}')
+        self.sizes = tuple(sorted(set(sizes)))
+
+    def tokenize(self, input_address: str) -> TokenTable:
+        """
+        Create the tokens for an address.
+
+        :param input_address: The address to tokenize.
+        :return: A TokenTable with a row for each window position of each size.
+        """
+
+        starts = array('l')
+        ends = array('l')
+        for match in self.WORD.finditer(input_address):
+            starts.append(match.start())
+            ends.append(match.end())
+
+        tokens = TokenTable(input_address)
+        word_count = len(starts)
+        for size in self.sizes:
+            for index in range(word_count - size + 1):
+                tokens.append(starts[index], ends[index + size - 1], index, size)
+
+        return tokens
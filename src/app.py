@@ -1,7 +1,12 @@
 import logging
-import config
+from itertools import islice
+from typing import Dict, Iterable, Iterator
 
-from src.address import Address
+from src.address import (
+    Address, AddressParser, CountryPack, MLAddressParser, ParserPool, ResultCache, SpellingCorrector,
+    detect_language, load_country_config
+)
+from src.address.pool import parse_chunk
 
 
 class Application:
@@ -13,8 +18,21 @@ class Application:
 
     def __init__(
             self,
-            mode: MODES = 'DEVELOPMENT'
+            mode: MODES = 'DEVELOPMENT',
+            workers: int = None,
+            cache: ResultCache = None,
+            spelling: Dict[str, SpellingCorrector] = None,
+            packs: Dict[str, CountryPack] = None
     ):
+        """
+        :param mode: One of MODES, sets the log level.
+        :param workers: Parse batches of addresses in this many worker processes. Without workers all parsing is done
+        in the current process.
+        :param cache: A ResultCache used by all heuristic parsers of the application.
+        :param spelling: The SpellingCorrector of each country code, used by the heuristic parsers of that country.
+        :param packs: The CountryPack of each country code. They are installed, so the configuration files of these
+        countries are not read.
+        """
         self.full = None
         self.log = logging.getLogger(__name__)
         if mode == 'PRODUCTION':
@@ -24,7 +42,157 @@ class Application:
         else:
             logging.getLogger().setLevel('TRACE')
 
+        # Parsers are expensive to set up, so they are kept per country and reused between addresses.
+        self.parsers = {}
+        self.workers = workers
+        self.pool = None
+        self.cache = cache
+        self.spelling = spelling or {}
+        self.packs = packs or {}
+        for pack in self.packs.values():
+            pack.install()
+
         self.log.info(f'Running app with logg level: {self.log.getEffectiveLevel()}')
 
     def check_address(self, string):
         return Address(self, string)
+
+    def check_addresses(
+            self,
+            strings: Iterable[str],
+            country_code: str = None,
+            use_ml: bool = False,
+            batch_size: int = 1000
+    ) -> Iterator[Address]:
+        """
+        Parse many address strings, yielding one Address per input string in input order.
+
+        The country configuration and the parser are only set up once per country, after that the addresses only go
+        through the tokenize and evaluate steps of the parser, in batches of batch_size addresses. If the application
+        has workers the batches are parsed in worker processes.
+
+        :param strings: An iterable of address strings. It is consumed lazily.
+        :param country_code: Country code to use for all addresses. If omitted it is detected for each address.
+        :param use_ml: Parse the addresses with the machine learning parser instead of the heuristics.
+        :param batch_size: The number of addresses that are parsed together.
+        :return: An iterator over the parsed addresses.
+        """
+
+        for string, address_country_code, components in self.parse_many(strings, country_code, batch_size, use_ml):
+            yield Address(
+                self,
+                string,
+                use_ml=use_ml,
+                country_code=address_country_code,
+                parser=self.get_parser(address_country_code, use_ml),
+                components=components
+            )
+
+    def parse_many(
+            self,
+            strings: Iterable[str],
+            country_code: str = None,
+            batch_size: int = 1000,
+            use_ml: bool = False,
+            decode: bool = False,
+            n_process: int = 1
+    ) -> Iterator:
+        """
+        Parse addresses in batches, in the worker pool if the application has workers. The machine learning parser
+        always runs in this process, with the model loaded once, see parse_many_ml.
+
+        :param batch_size: The number of addresses that are parsed together.
+        :param decode: Return only the best consistent components of each address instead of every candidate, see
+        AddressParser.resolve_conflicts. Only the chosen components are spelling corrected. Decoding runs where the
+        addresses are parsed, in the workers if there are any.
+        :param n_process: The number of processes spaCy uses with use_ml.
+        :return: An iterator over the address, its country code and its components, in input order.
+        """
+
+        if use_ml:
+            for string, address_country_code, components in self.parse_many_ml(strings, country_code, batch_size,
+                                                                                n_process):
+                if decode:
+                    components = self.get_parser(address_country_code, True).resolve_conflicts(components)
+                yield string, address_country_code, components
+            return
+
+        if self.workers:
+            yield from self.get_pool([country_code] if country_code else []).parse_many(strings, country_code,
+                                                                                        batch_size, decode)
+            return
+
+        def parser_for(code: str):
+            return self.get_parser(code, use_ml)
+
+        iterator = iter(strings)
+        while True:
+            chunk = list(islice(iterator, batch_size))
+            if not chunk:
+                return
+            for string, (address_country_code, components) in zip(chunk, parse_chunk(chunk, country_code,
+                                                                                     parser_for, decode)):
+                yield string, address_country_code, components
+
+    def parse_many_ml(
+            self,
+            strings: Iterable[str],
+            country_code: str = None,
+            batch_size: int = 256,
+            n_process: int = 1
+    ) -> Iterator:
+        """
+        Parse addresses with the machine learning parsers in a single nlp.pipe stream, so spaCy starts its processes
+        only once. Each address is normalized by the parser of its country, which also creates its components.
+
+        :return: An iterator over the address, its country code and its components, in input order.
+        """
+
+        def normalized() -> Iterator:
+            for string in strings:
+                code = detect_language(string, country_code)
+                yield self.get_parser(code, True).normalizer.normalize(string), (string, code)
+
+        nlp = self.get_parser(country_code or 'default', True).nlp
+        for doc, (string, code) in nlp.pipe(normalized(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+            yield string, code, self.get_parser(code, True).create_address_components(doc)
+
+    def get_pool(self, country_codes: Iterable[str] = ()) -> ParserPool:
+        """
+        Return the worker pool of the application, starting it the first time it is asked for.
+
+        :param country_codes: Countries the workers create parsers for when they start.
+        """
+
+        if self.pool is None:
+            self.pool = ParserPool(self.workers, list(country_codes), cache=self.cache,
+                                   spelling=self.spelling, packs=list(self.packs.values()))
+        return self.pool
+
+    def close(self) -> None:
+        """
+        Stop the worker processes, if there are any.
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def get_parser(self, country_code: str, use_ml: bool = False):
+        """
+        Return the shared parser for the country. A new parser is created when the configuration of the country has
+        changed since the parser was created.
+        """
+
+        country_config = load_country_config(country_code)
+        key = (country_code, use_ml)
+        parser = self.parsers.get(key)
+        if parser is None or parser.country_config is not country_config:
+            self.log.debug(f'Creating parser for "{country_code}".')
+            if use_ml:
+                parser = MLAddressParser(country_config)
+            else:
+                parser = AddressParser(country_config, cache=self.cache, spelling=self.spelling.get(country_code))
+            self.parsers[key] = parser
+
+        return parser
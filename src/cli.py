@@ -0,0 +1,406 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.address.component import AddressComponent, AddressComponentType, as_dict
+from src import run
+from src.address import CountryPack, Deduplicator, PhoneticIndex, ResultCache, SpellingCorrector
+from src.address.database import COLUMNS, AddressDatabase, AddressMatcher
+from src.app import Application
+from src.instrumentation import JsonLinesSink, PrometheusSink, instruments
+
+__all__ = [
+    'main',
+    'read_addresses',
+    'read_records',
+    'write_results'
+]
+
+FORMATS = ('csv', 'jsonl', 'txt')
+
+# (address, country code, components)
+Result = Tuple[str, str, List[AddressComponent]]
+
+
+def guess_format(path: str, default: str = 'jsonl') -> str:
+    """
+    Return the file format from the extension of a path, or the default for stdin, stdout and unknown extensions.
+    """
+
+    extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    return extension if extension in FORMATS else default
+
+
+@contextmanager
+def open_stream(path: str, mode: str) -> Iterator[IO]:
+    """
+    Open a file for streaming, '-' is stdin or stdout.
+    """
+
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+
+    with open(path, mode, encoding='utf-8', newline='') as stream:
+        yield stream
+
+
+def read_addresses(stream: IO, file_format: str, column: str = 'address') -> Iterator[str]:
+    """
+    Read addresses from a stream one at a time.
+
+    :param stream: The input stream.
+    :param file_format: One of FORMATS. Txt streams have one address per line.
+    :param column: The CSV column or JSON key holding the address.
+    :return: An iterator over the addresses. Empty addresses are skipped.
+    """
+
+    if file_format == 'csv':
+        values = (row.get(column) for row in csv.DictReader(stream))
+    elif file_format == 'jsonl':
+        values = (json.loads(line).get(column) for line in stream if line.strip())
+    else:
+        values = (line.rstrip('\r\n') for line in stream)
+
+    for value in values:
+        if value and value.strip():
+            yield value
+
+
+def read_records(stream: IO, file_format: str, column: str = 'address',
+                 id_column: str = 'id') -> Iterator[Tuple[str, str]]:
+    """
+    Read records with an id and an address from a stream one at a time.
+
+    :param id_column: The CSV column or JSON key holding the id. Records without it, and all txt lines, get their line
+    number as id.
+    :return: An iterator over (id, address) pairs. Records with an empty address are skipped.
+    """
+
+    if file_format == 'csv':
+        rows = ((row.get(id_column), row.get(column)) for row in csv.DictReader(stream))
+    elif file_format == 'jsonl':
+        rows = ((r.get(id_column), r.get(column)) for r in (json.loads(line) for line in stream if line.strip()))
+    else:
+        rows = ((None, line.rstrip('\r\n')) for line in stream)
+
+    for number, (record_id, value) in enumerate(rows, 1):
+        if value and value.strip():
+            yield str(number) if record_id is None else str(record_id), value
+
+
+def write_results(stream: IO, file_format: str, results: Iterable[Result]) -> int:
+    """
+    Write results to a stream as they arrive.
+
+    Jsonl rows hold every component of an address. Csv rows have one column per component type with the most
+    confident value of that type.
+
+    :return: The number of results written.
+    """
+
+    count = 0
+    if file_format == 'csv':
+        types = [t.name for t in AddressComponentType]
+        writer = csv.writer(stream)
+        writer.writerow(['address', 'country_code'] + [t.lower() for t in types])
+        for string, country_code, components in results:
+            best = {}
+            for c in sorted(components, key=lambda c: c.confidence):
+                best[c.component_type.name] = c.component_value
+            writer.writerow([string, country_code] + [best.get(t, '') for t in types])
+            count += 1
+    else:
+        for result in results:
+            stream.write(json.dumps(as_dict(result), ensure_ascii=False))
+            stream.write('\n')
+            count += 1
+
+    return count
+
+
+def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m src', description='Buache address tools.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parse = commands.add_parser('parse', help='Parse a file of addresses into components.')
+    parse.add_argument('--input', '-i', default='-', help='Input file, "-" for stdin. Default: stdin.')
+    parse.add_argument('--output', '-o', default='-', help='Output file, "-" for stdout. Default: stdout.')
+    parse.add_argument('--input-format', choices=FORMATS, help='Default: from the input extension, else jsonl.')
+    parse.add_argument('--output-format', choices=('csv', 'jsonl'),
+                       help='Default: from the output extension, else jsonl.')
+    parse.add_argument('--column', default='address', help='CSV column or JSON key with the address.')
+    parse.add_argument('--batch-size', type=int, default=1000, help='Addresses parsed together. Default: 1000.')
+    parse.add_argument('--workers', type=int, default=0, help='Worker processes, 0 parses in this process.')
+    parse.add_argument('--country', help='Country code of all addresses. Default: detected per address.')
+    parse.add_argument('--mode', choices=Application.MODES, default='PRODUCTION')
+    parse.add_argument('--cache-size', type=int, default=0, help='Parse results kept in memory, 0 disables caching.')
+    parse.add_argument('--cache-ttl', type=float, help='Seconds a cached result is valid. Default: no limit.')
+    parse.add_argument('--cache-db', help='SQLite file for a persistent cache shared between runs.')
+    parse.add_argument('--decode', action='store_true',
+                       help='Write only the best consistent components of each address instead of every candidate.')
+    parse.add_argument('--ml', action='store_true',
+                       help='Parse with the named entity recognizer of a spaCy model instead of the heuristics.')
+    parse.add_argument('--ml-processes', type=int, default=1,
+                       help='Processes spaCy uses with --ml, the batch size is --batch-size. Default: 1.')
+    parse.add_argument('--database', help='Validate and correct the components against an address database, see '
+                                          'compile-database.')
+    parse.add_argument('--phonetic', help='Match street names and cities that are not in the database by how they '
+                                          'sound, with a phonetic index, see compile-phonetic.')
+    parse.add_argument('--spelling', action='append', default=[],
+                       help='Correct misspelled street names and cities with a spelling index, see compile-spelling. '
+                            'Only the components chosen with --decode are corrected. Can be given once for each '
+                            'country.')
+    parse.add_argument('--pack', action='append', default=[],
+                       help='Use a country pack instead of the configuration files of its country, see compile-pack. '
+                            'Can be given once for each country.')
+    parse.add_argument('--no-pack-check', action='store_true',
+                       help='Use the packs without comparing them with the configuration files, for deployments that '
+                            'ship packs without them.')
+    parse.add_argument('--metrics-prometheus', help='Write stage timings and counters to this file at the end, in '
+                                                    'the Prometheus text format.')
+    parse.add_argument('--metrics-jsonl', help='Append every measurement to this file as JSON lines.')
+
+    database = commands.add_parser('compile-database', help='Compile a CSV address register into a database.')
+    database.add_argument('--input', '-i', required=True, help='CSV file with a header row.')
+    database.add_argument('--output', '-o', required=True, help='The database file to write.')
+    database.add_argument('--delimiter', default=',')
+    database.add_argument('--encoding', default='utf-8')
+    for table, column in COLUMNS.items():
+        database.add_argument(f'--{column.replace("_", "-")}-column', dest=f'{column}_column', default=column,
+                              help=f'Column with the {column.replace("_", " ")}. Default: {column}.')
+
+    spelling = commands.add_parser('compile-spelling', help='Compile a spelling index from an address database.')
+    spelling.add_argument('--database', required=True, help='An address database, see compile-database.')
+    spelling.add_argument('--output', '-o', required=True, help='The index file to write.')
+    spelling.add_argument('--country', required=True, help='Country code the index is used for.')
+    spelling.add_argument('--max-distance', type=int, default=2, help='Largest number of edits corrected. Default: 2.')
+    spelling.add_argument('--prefix-length', type=int, default=7,
+                          help='Leading characters of each name that are indexed. Default: 7.')
+
+    phonetic = commands.add_parser('compile-phonetic', help='Compile a phonetic index from an address database.')
+    phonetic.add_argument('--database', required=True, help='An address database, see compile-database.')
+    phonetic.add_argument('--output', '-o', required=True, help='The index file to write.')
+    phonetic.add_argument('--language', default='sv', help='Language of the names, "sv" or "en". Default: sv.')
+    phonetic.add_argument('--max-length', type=int, default=0,
+                          help='Longest key of a word, 0 for no limit. Default: 0.')
+
+    pack = commands.add_parser('compile-pack', help='Compile the configuration of a country into a country pack.')
+    pack.add_argument('--country', required=True, help='Country code of the configuration to compile.')
+    pack.add_argument('--output', '-o', required=True, help='The pack file to write.')
+
+    dedup = commands.add_parser('dedup', help='Find records with the same address typed differently.')
+    dedup.add_argument('--input', '-i', default='-', help='Input file, "-" for stdin. Default: stdin.')
+    dedup.add_argument('--output', '-o', default='-', help='Output file with one JSON list of record ids per cluster, '
+                                                           '"-" for stdout. Default: stdout.')
+    dedup.add_argument('--input-format', choices=FORMATS, help='Default: from the input extension, else jsonl.')
+    dedup.add_argument('--column', default='address', help='CSV column or JSON key with the address.')
+    dedup.add_argument('--id-column', default='id', help='CSV column or JSON key with the record id. Default: the '
+                                                         'line number.')
+    dedup.add_argument('--country', help='Country code of all addresses. Default: detected per address.')
+    dedup.add_argument('--mode', choices=Application.MODES, default='PRODUCTION')
+    dedup.add_argument('--batch-size', type=int, default=1000, help='Addresses parsed together. Default: 1000.')
+    dedup.add_argument('--workers', type=int, default=0, help='Worker processes that parse, 0 parses in this '
+                                                              'process. Blocks are always matched in parallel.')
+    dedup.add_argument('--threshold', type=float, default=0.6,
+                       help='Lowest Jaccard similarity of the character n-grams of duplicates. Default: 0.6.')
+    dedup.add_argument('--partitions', type=int, default=64, help='Partition files of the blocks. Default: 64.')
+    dedup.add_argument('--temporary-directory', help='Where the partitions are written. Default: the system one.')
+
+    serve = commands.add_parser('serve', help='Serve the parser over HTTP.')
+    serve.add_argument('--host', default='127.0.0.1', help='Default: 127.0.0.1.')
+    serve.add_argument('--port', type=int, default=8080, help='Default: 8080.')
+    serve.add_argument('--workers', type=int, default=0, help='Worker processes, 0 parses in a thread of this '
+                                                              'process.')
+    serve.add_argument('--mode', choices=Application.MODES, default='PRODUCTION')
+    serve.add_argument('--batch-size', type=int, default=256, help='Addresses parsed together. Default: 256.')
+    serve.add_argument('--batch-delay-ms', type=float, default=5,
+                       help='Milliseconds a single address waits for others to be batched with. Default: 5.')
+    serve.add_argument('--max-pending', type=int, default=10000,
+                       help='Accepted addresses that have not been answered before requests get 429. Default: 10000.')
+    serve.add_argument('--max-request-size', type=int, default=10000,
+                       help='Addresses in one batch request. Default: 10000.')
+    serve.add_argument('--max-body-size', type=int, default=16 * 1024 * 1024,
+                       help='Bytes in one request body, larger requests get 413. Default: 16 MiB.')
+    serve.add_argument('--cache-size', type=int, default=0, help='Parse results kept in memory, 0 disables caching.')
+    serve.add_argument('--cache-ttl', type=float, help='Seconds a cached result is valid. Default: no limit.')
+    serve.add_argument('--cache-db', help='SQLite file for a persistent cache shared between runs.')
+    serve.add_argument('--decode', action='store_true',
+                       help='Answer with only the best consistent components of each address instead of every '
+                            'candidate.')
+    serve.add_argument('--spelling', action='append', default=[],
+                       help='Correct misspelled street names and cities with a spelling index, see compile-spelling. '
+                            'Only the components chosen with --decode are corrected. Can be given once for each '
+                            'country.')
+    serve.add_argument('--pack', action='append', default=[],
+                       help='Use a country pack instead of the configuration files of its country, see compile-pack. '
+                            'Can be given once for each country.')
+    serve.add_argument('--no-pack-check', action='store_true',
+                       help='Use the packs without comparing them with the configuration files, for deployments that '
+                            'ship packs without them.')
+
+    return parser.parse_args(argv)
+
+
+def create_cache(arguments: argparse.Namespace) -> Optional[ResultCache]:
+    if arguments.cache_size or arguments.cache_db:
+        return ResultCache(maxsize=arguments.cache_size or 100000, ttl=arguments.cache_ttl, path=arguments.cache_db)
+    return None
+
+
+def create_spelling(arguments: argparse.Namespace) -> Dict[str, SpellingCorrector]:
+    spelling = {}
+    for path in arguments.spelling:
+        corrector = SpellingCorrector(path)
+        spelling[corrector.country_code] = corrector
+    return spelling
+
+
+def create_packs(arguments: argparse.Namespace) -> Dict[str, CountryPack]:
+    packs = {}
+    for path in arguments.pack:
+        pack = CountryPack(path, check_source=not arguments.no_pack_check)
+        packs[pack.country_code] = pack
+    return packs
+
+
+def parse_command(arguments: argparse.Namespace) -> int:
+    log = logging.getLogger(__name__)
+    input_format = arguments.input_format or guess_format(arguments.input)
+    output_format = arguments.output_format or guess_format(arguments.output)
+    if output_format == 'txt':
+        output_format = 'jsonl'
+
+    cache = create_cache(arguments)
+
+    sinks = []
+    if arguments.metrics_prometheus:
+        sinks.append(instruments.attach(PrometheusSink()))
+    if arguments.metrics_jsonl:
+        sinks.append(instruments.attach(JsonLinesSink(arguments.metrics_jsonl)))
+
+    app = run(mode=arguments.mode, workers=arguments.workers or None, cache=cache,
+              spelling=create_spelling(arguments), packs=create_packs(arguments))
+    started = time.perf_counter()
+    try:
+        with open_stream(arguments.input, 'r') as source, open_stream(arguments.output, 'w') as target:
+            addresses = read_addresses(source, input_format, arguments.column)
+            results = app.parse_many(addresses, arguments.country, arguments.batch_size, use_ml=arguments.ml,
+                                     decode=arguments.decode, n_process=arguments.ml_processes)
+            if arguments.database:
+                phonetic = PhoneticIndex(arguments.phonetic) if arguments.phonetic else None
+                matcher = AddressMatcher(AddressDatabase(arguments.database), phonetic=phonetic)
+                results = ((s, code, matcher.match_address(components)) for s, code, components in results)
+            count = write_results(target, output_format, results)
+    finally:
+        app.close()
+        for sink in sinks:
+            instruments.detach(sink)
+            if isinstance(sink, PrometheusSink):
+                sink.write(arguments.metrics_prometheus)
+            sink.close()
+
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    log.info(f'Parsed {count} addresses in {elapsed:.2f}s.')
+    print(f'Parsed {count} addresses in {elapsed:.2f}s ({rate:.0f} addresses/s).', file=sys.stderr)
+    if cache is not None and not arguments.workers:
+        print(f'Cache: {cache.stats()}', file=sys.stderr)
+    return 0
+
+
+def compile_database_command(arguments: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    columns = {table: getattr(arguments, f'{column}_column') for table, column in COLUMNS.items()}
+    database = AddressDatabase.compile_csv(arguments.input, arguments.output, columns, arguments.delimiter,
+                                           arguments.encoding)
+    print(f'Compiled {len(database)} addresses in {time.perf_counter() - started:.2f}s.', file=sys.stderr)
+    return 0
+
+
+def compile_spelling_command(arguments: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    SpellingCorrector.from_database(AddressDatabase(arguments.database), arguments.output, arguments.country,
+                                    max_distance=arguments.max_distance, prefix_length=arguments.prefix_length)
+    print(f'Compiled the spelling index in {time.perf_counter() - started:.2f}s.', file=sys.stderr)
+    return 0
+
+
+def compile_phonetic_command(arguments: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    PhoneticIndex.from_database(AddressDatabase(arguments.database), arguments.output, arguments.language,
+                                max_length=arguments.max_length)
+    print(f'Compiled the phonetic index in {time.perf_counter() - started:.2f}s.', file=sys.stderr)
+    return 0
+
+
+def compile_pack_command(arguments: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    pack = CountryPack.build(arguments.country, arguments.output)
+    print(f'Compiled the country pack in {time.perf_counter() - started:.2f}s, digest {pack.digest}.', file=sys.stderr)
+    return 0
+
+
+def dedup_command(arguments: argparse.Namespace) -> int:
+    input_format = arguments.input_format or guess_format(arguments.input)
+    app = run(mode=arguments.mode, workers=arguments.workers or None)
+    started = time.perf_counter()
+    count = 0
+    try:
+        deduplicator = Deduplicator(app, threshold=arguments.threshold, partitions=arguments.partitions)
+        with open_stream(arguments.input, 'r') as source, open_stream(arguments.output, 'w') as target:
+            records = read_records(source, input_format, arguments.column, arguments.id_column)
+            for cluster in deduplicator.deduplicate(records, arguments.country, arguments.batch_size,
+                                                    arguments.temporary_directory):
+                target.write(json.dumps(cluster, ensure_ascii=False))
+                target.write('\n')
+                count += 1
+    finally:
+        app.close()
+
+    print(f'Found {count} clusters in {time.perf_counter() - started:.2f}s.', file=sys.stderr)
+    return 0
+
+
+def serve_command(arguments: argparse.Namespace) -> int:
+    # The server imports asyncio, so it is only imported when it is used.
+    from src.server import serve
+
+    app = run(mode=arguments.mode, workers=arguments.workers or None, cache=create_cache(arguments),
+              spelling=create_spelling(arguments), packs=create_packs(arguments))
+    serve(
+        app,
+        arguments.host,
+        arguments.port,
+        max_batch_size=arguments.batch_size,
+        max_delay=arguments.batch_delay_ms / 1000,
+        max_pending=arguments.max_pending,
+        max_request_size=arguments.max_request_size,
+        max_body_size=arguments.max_body_size,
+        decode=arguments.decode
+    )
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+    if arguments.command == 'parse':
+        return parse_command(arguments)
+    if arguments.command == 'compile-database':
+        return compile_database_command(arguments)
+    if arguments.command == 'compile-spelling':
+        return compile_spelling_command(arguments)
+    if arguments.command == 'compile-phonetic':
+        return compile_phonetic_command(arguments)
+    if arguments.command == 'compile-pack':
+        return compile_pack_command(arguments)
+    if arguments.command == 'dedup':
+        return dedup_command(arguments)
+    if arguments.command == 'serve':
+        return serve_command(arguments)
+    return 2
@@ -10,6 +10,10 @@ class AddressException(BuacheException):
     pass
 
 
+class ServiceOverloaded(BuacheException):
+    pass
+
+
 class NormalizationError(AddressException):
     pass
 
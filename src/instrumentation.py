@@ -0,0 +1,414 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import IO, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+__all__ = [
+    'Aggregates',
+    'Instrumentation',
+    'JsonLinesSink',
+    'PrometheusSink',
+    'Sink',
+    'StatsSink',
+    'instruments'
+]
+
+# Labels are kept as sorted tuples of (name, value) pairs so they can be used as keys.
+Labels = Tuple[Tuple[str, str], ...]
+
+PREFIX = 'buache_'
+
+SECONDS_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25,
+    0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+# Bucket boundaries of the histograms, by metric name. Other histograms use SECONDS_BUCKETS.
+BUCKETS = {
+    'tokens_per_address': COUNT_BUCKETS,
+    'batch_size': COUNT_BUCKETS,
+}
+
+HELP = {
+    'stage_seconds': 'Time spent in each stage of the pipeline, wall clock and CPU time of the thread.',
+    'tokens_per_address': 'The number of tokens created for an address.',
+    'heuristics_evaluated_total': 'The number of heuristics evaluated, by component type.',
+    'inconclusive_evaluations_total': 'Tokens that could not be decided for a component type.',
+    'cache_lookups_total': 'Cache lookups by cache and result.',
+    'country_detections_total': 'Country detections by the signal that decided them.',
+    'batch_size': 'The number of addresses the service parsed together.',
+    'http_request_seconds': 'Time to answer an HTTP request, by path.',
+    'http_requests_total': 'HTTP requests by path and status.',
+}
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels_of(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class Aggregates(NamedTuple):
+    """
+    Measurements aggregated by a StatsSink in another process, like a worker of a ParserPool, to be merged into the
+    sinks of this process.
+
+    Attributes:
+
+        histograms: the bucket counts, sum and count of each histogram, by metric name and labels. The buckets are
+            those of BUCKETS.
+        counters: the value of each counter, by metric name and labels.
+    """
+    histograms: Dict[Tuple[str, Labels], Tuple[List[int], float, int]]
+    counters: Dict[Tuple[str, Labels], float]
+
+
+class Sink:
+    """
+    Receives the measurements of the pipeline. Sinks are attached to the Instrumentation, and only get
+    measurements while they are attached.
+    """
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        raise NotImplementedError
+
+    def observe_many(self, name: str, values: np.ndarray, labels: Labels = ()) -> None:
+        for value in values.tolist():
+            self.observe(name, value, labels)
+
+    def increment(self, name: str, amount: float = 1, labels: Labels = ()) -> None:
+        raise NotImplementedError
+
+    def merge(self, aggregates: Aggregates) -> None:
+        """
+        Add measurements that were aggregated in another process. Counters are added with increment. Histograms are
+        skipped, sinks that can hold them override this.
+        """
+
+        for (name, labels), value in aggregates.counters.items():
+            self.increment(name, value, labels)
+
+    def close(self) -> None:
+        pass
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        # The last count is for values above the largest bound.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values: np.ndarray) -> None:
+        indexes = np.searchsorted(self.bounds, values, side='left')
+        for index, count in enumerate(np.bincount(indexes, minlength=len(self.counts)).tolist()):
+            self.counts[index] += count
+        self.sum += float(np.sum(values))
+        self.count += len(values)
+
+    def merge(self, counts: Sequence[int], total: float, count: int) -> None:
+        for index, value in enumerate(counts):
+            self.counts[index] += value
+        self.sum += total
+        self.count += count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, rows = 0, []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            rows.append(('+Inf' if bound == float('inf') else repr(float(bound)), total))
+        return rows
+
+
+class StatsSink(Sink):
+    """
+    Aggregates the measurements in process, into a histogram or a counter for each metric name and labels.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, labels: Labels) -> Histogram:
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(BUCKETS.get(name, SECONDS_BUCKETS))
+        return histogram
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            self.histogram(name, labels).observe(value)
+
+    def observe_many(self, name: str, values: np.ndarray, labels: Labels = ()) -> None:
+        with self._lock:
+            self.histogram(name, labels).observe_many(values)
+
+    def increment(self, name: str, amount: float = 1, labels: Labels = ()) -> None:
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def merge(self, aggregates: Aggregates) -> None:
+        with self._lock:
+            for (name, labels), (counts, total, count) in aggregates.histograms.items():
+                self.histogram(name, labels).merge(counts, total, count)
+            for key, value in aggregates.counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def drain(self) -> Aggregates:
+        """
+        Return the measurements since the last call and reset the sink, see Aggregates.
+        """
+
+        with self._lock:
+            aggregates = Aggregates(
+                {key: (h.counts, h.sum, h.count) for key, h in self.histograms.items()},
+                dict(self.counters)
+            )
+            self.histograms = {}
+            self.counters = {}
+        return aggregates
+
+    def snapshot(self) -> dict:
+        """
+        Return the current values as plain dictionaries, e.g. for logging or JSON.
+        """
+
+        with self._lock:
+            return {
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'count': h.count, 'sum': h.sum,
+                     'mean': h.sum / h.count if h.count else 0.0}
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ]
+            }
+
+    def cache_hit_rate(self, cache: str = 'result') -> float:
+        lookups = {
+            dict(labels).get('result'): value for (name, labels), value in self.counters.items()
+            if name == 'cache_lookups_total' and dict(labels).get('cache') == cache
+        }
+        total = sum(lookups.values())
+        return (total - lookups.get('miss', 0)) / total if total else 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+class PrometheusSink(StatsSink):
+    """
+    A StatsSink that renders its metrics in the Prometheus text exposition format.
+    """
+
+    @staticmethod
+    def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+        pairs = [f'{k}="{escape(v)}"' for k, v in labels]
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms: Dict[str, list] = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, []).append((labels, histogram))
+            for name, series in histograms.items():
+                lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {PREFIX}{name} histogram')
+                for labels, histogram in series:
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{PREFIX}{name}_bucket{self.format_labels(labels + (("le", bound),))} {total}')
+                    lines.append(f'{PREFIX}{name}_sum{self.format_labels(labels)} {histogram.sum!r}')
+                    lines.append(f'{PREFIX}{name}_count{self.format_labels(labels)} {histogram.count}')
+
+            counters: Dict[str, list] = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append((labels, value))
+            for name, series in counters.items():
+                lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {PREFIX}{name} counter')
+                for labels, value in series:
+                    lines.append(f'{PREFIX}{name}{self.format_labels(labels)} {value!r}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(self.render())
+
+
+class JsonLinesSink(Sink):
+    """
+    Writes every measurement as one JSON object per line. Observations of many values at once are written as one
+    line with all of the values.
+    """
+
+    def __init__(self, target: Union[str, IO]):
+        self.owned = isinstance(target, str)
+        self.stream = open(target, 'a', encoding='utf-8') if self.owned else target
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self.stream.write(line)
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        self.write({'time': time.time(), 'type': 'observe', 'name': name, 'labels': dict(labels), 'value': value})
+
+    def observe_many(self, name: str, values: np.ndarray, labels: Labels = ()) -> None:
+        self.write({'time': time.time(), 'type': 'observe', 'name': name, 'labels': dict(labels),
+                    'values': values.tolist()})
+
+    def increment(self, name: str, amount: float = 1, labels: Labels = ()) -> None:
+        self.write({'time': time.time(), 'type': 'increment', 'name': name, 'labels': dict(labels), 'value': amount})
+
+    def merge(self, aggregates: Aggregates) -> None:
+        """
+        Write each histogram of another process as one line with its bucket counts, and its counters as increments.
+        """
+
+        now = time.time()
+        for (name, labels), (counts, total, count) in aggregates.histograms.items():
+            self.write({'time': now, 'type': 'histogram', 'name': name, 'labels': dict(labels),
+                        'bounds': list(BUCKETS.get(name, SECONDS_BUCKETS)), 'counts': counts, 'sum': total,
+                        'count': count})
+        super().merge(aggregates)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.owned:
+                self.stream.close()
+            else:
+                self.stream.flush()
+
+
+class Stage:
+    """
+    Context manager measuring the wall clock and CPU time of one stage.
+    """
+
+    __slots__ = ('instrumentation', 'name', 'wall', 'cpu')
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self) -> 'Stage':
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        self.instrumentation.observe('stage_seconds', wall, (('clock', 'wall'), ('stage', self.name)))
+        self.instrumentation.observe('stage_seconds', cpu, (('clock', 'cpu'), ('stage', self.name)))
+
+
+class NullStage:
+    """
+    The stage used when no sink is attached. It does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> 'NullStage':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Instrumentation:
+    """
+    Measures the address pipeline and passes the measurements on to the attached sinks.
+
+    Without sinks every method returns at once. Code on the hot path checks enabled before it computes anything it
+    would only measure, and stage() returns a shared context manager that does nothing, so an uninstrumented run
+    pays for a few attribute lookups per address.
+
+    Measurements:
+
+        stage_seconds: histogram of the wall clock and CPU time of each stage, labeled by stage and clock.
+        tokens_per_address: histogram of the tokens created for each address.
+        heuristics_evaluated_total: counter of heuristics evaluated, by component type.
+        inconclusive_evaluations_total: counter of tokens that were inconclusive, by component type.
+        cache_lookups_total: counter of cache lookups, by cache and result.
+        country_detections_total: counter of country detections, by the method that decided them.
+
+    Attributes:
+
+        enabled: whether any sink is attached.
+        sinks: the attached sinks.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self.sinks: Tuple[Sink, ...] = ()
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    def attach(self, sink: Sink) -> Sink:
+        with self._lock:
+            self.sinks = self.sinks + (sink,)
+            self.enabled = True
+        self.log.info(f'Attached instrumentation sink {type(sink).__name__}.')
+        return sink
+
+    def detach(self, sink: Sink) -> None:
+        with self._lock:
+            self.sinks = tuple(s for s in self.sinks if s is not sink)
+            self.enabled = bool(self.sinks)
+
+    def stage(self, name: str) -> Union[Stage, NullStage]:
+        return Stage(self, name) if self.enabled else NULL_STAGE
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        for sink in self.sinks:
+            sink.observe(name, value, labels)
+
+    def observe_many(self, name: str, values: np.ndarray, labels: Labels = ()) -> None:
+        for sink in self.sinks:
+            sink.observe_many(name, values, labels)
+
+    def increment(self, name: str, amount: float = 1, labels: Union[Labels, Dict[str, str]] = ()) -> None:
+        if isinstance(labels, dict):
+            labels = labels_of(labels)
+        for sink in self.sinks:
+            sink.increment(name, amount, labels)
+
+    def merge(self, aggregates: Aggregates) -> None:
+        """
+        Pass measurements that were aggregated in another process on to the attached sinks.
+        """
+
+        for sink in self.sinks:
+            sink.merge(aggregates)
+
+
+# The instrumentation of the process.
+instruments = Instrumentation()
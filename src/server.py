@@ -0,0 +1,481 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.address.component import AddressComponent, as_dict, expand
+from src.address.pool import parse_chunk
+from src.app import Application
+from src.exceptions import ServiceOverloaded
+from src.instrumentation import PrometheusSink, instruments
+
+__all__ = [
+    'AddressService',
+    'MicroBatcher',
+    'serve'
+]
+
+# The largest request line and header block that is accepted.
+MAX_HEADER_SIZE = 64 * 1024
+
+# The default for the largest request body that is accepted.
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+# (country code, components) of one address
+Parsed = Tuple[str, List[AddressComponent]]
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def json(self) -> dict:
+        try:
+            document = json.loads(self.body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise HttpError(400, f'The body is not valid JSON: {e}')
+        if not isinstance(document, dict):
+            raise HttpError(400, 'The body must be a JSON object.')
+        return document
+
+
+class MicroBatcher:
+    """
+    Collects single addresses from concurrent requests into batches.
+
+    A batch is sent as soon as it has max_batch_size addresses, or max_delay seconds after its first address
+    arrived. At most max_in_flight batches are parsed at once. While they are busy new addresses wait in the queue,
+    so batches grow with the load.
+
+    Backpressure is per address: reserve() fails with ServiceOverloaded when the number of accepted addresses that
+    have not been answered would exceed max_pending. Batch requests reserve their addresses too, so both endpoints
+    share the limit.
+
+    Attributes:
+
+        pending: the number of accepted addresses that have not been answered.
+    """
+
+    def __init__(
+            self,
+            service: 'AddressService',
+            max_batch_size: int = 256,
+            max_delay: float = 0.005,
+            max_pending: int = 10000,
+            max_in_flight: int = 2
+    ):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.pending = 0
+
+        self._queue: Deque[Tuple[str, Optional[str], asyncio.Future]] = deque()
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._collector: Optional[asyncio.Task] = None
+
+    def reserve(self, count: int) -> None:
+        if self.pending + count > self.max_pending:
+            raise ServiceOverloaded(f'{self.pending} addresses are pending, the limit is {self.max_pending}.')
+        self.pending += count
+
+    def release(self, count: int) -> None:
+        self.pending -= count
+
+    def start(self) -> None:
+        self._collector = asyncio.ensure_future(self.collect())
+
+    async def stop(self) -> None:
+        """
+        Parse the addresses that are still queued, then stop collecting.
+        """
+
+        while self._queue or self._tasks:
+            await asyncio.sleep(self.max_delay)
+        if self._collector is not None:
+            self._collector.cancel()
+
+    async def parse(self, address: str, country_code: str = None) -> Parsed:
+        self.reserve(1)
+        try:
+            future = asyncio.get_running_loop().create_future()
+            self._queue.append((address, country_code, future))
+            self._ready.set()
+            return await future
+        finally:
+            self.release(1)
+
+    async def collect(self) -> None:
+        while True:
+            await self._ready.wait()
+            await self._slots.acquire()
+            if len(self._queue) < self.max_batch_size:
+                await asyncio.sleep(self.max_delay)
+
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch_size, len(self._queue)))]
+            if not self._queue:
+                self._ready.clear()
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.ensure_future(self.dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def dispatch(self, batch: List[Tuple[str, Optional[str], asyncio.Future]]) -> None:
+        try:
+            if instruments.enabled:
+                instruments.observe('batch_size', len(batch))
+
+            # Requests can name different countries, they are parsed in one chunk per country.
+            by_country: Dict[Optional[str], list] = {}
+            for item in batch:
+                by_country.setdefault(item[1], []).append(item)
+
+            for country_code, items in by_country.items():
+                try:
+                    results = await self.service.parse_chunk([address for address, _, _ in items], country_code)
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+class AddressService:
+    """
+    HTTP service parsing addresses with an Application, on the asyncio event loop of the standard library.
+
+    Endpoints:
+
+        POST /parse: {"address": "...", "country_code": "sv"} is parsed together with other concurrent requests,
+            see MicroBatcher. The country code is optional.
+        POST /parse/batch: {"addresses": ["...", ...], "country_code": "sv"} is parsed in chunks of the batch size.
+        GET /metrics: the measurements of the process in the Prometheus text format.
+        GET /health: 200 while the service accepts requests.
+
+    Parsing never runs on the event loop. With workers it runs in the worker pool of the application, without them
+    in one background thread. Requests that would exceed the pending limit are answered with 429 at once, batch
+    requests with more addresses than the limit with 413. With decode only the best consistent components of each
+    address are returned, chosen and spelling corrected where the address is parsed.
+
+    Attributes:
+
+        app: the application whose parsers are used.
+        batcher: the MicroBatcher of the single address endpoint.
+        sink: the PrometheusSink served at /metrics.
+        max_request_size: the largest number of addresses in one batch request.
+        max_body_size: the largest request body in bytes.
+        decode: whether only the best consistent components are returned.
+    """
+
+    def __init__(
+            self,
+            app: Application,
+            max_batch_size: int = 256,
+            max_delay: float = 0.005,
+            max_pending: int = 10000,
+            max_request_size: int = 10000,
+            max_body_size: int = MAX_BODY_SIZE,
+            sink: PrometheusSink = None,
+            decode: bool = False
+    ):
+        """
+        :param app: The application to parse with. Its workers decide where parsing runs.
+        :param max_batch_size: The largest number of addresses parsed together.
+        :param max_delay: Seconds a single address waits for others to be batched with.
+        :param max_pending: The number of accepted addresses that have not been answered, before requests are
+        rejected with 429.
+        :param max_request_size: The largest number of addresses in one batch request, larger requests are rejected
+        with 413.
+        :param max_body_size: The largest request body in bytes. Requests with a larger Content-Length are rejected
+        with 413 before their body is read.
+        :param sink: The sink for /metrics. A new PrometheusSink is attached when the service starts if omitted.
+        :param decode: Return only the best consistent components of each address instead of every candidate, see
+        AddressParser.resolve_conflicts.
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.app = app
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_request_size = max_request_size
+        self.max_body_size = max_body_size
+        self.sink = sink
+        self.decode = decode
+        self.batcher: Optional[MicroBatcher] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.accepting = False
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._attached = False
+
+    async def parse_chunk(self, strings: Sequence[str], country_code: str = None) -> List[Parsed]:
+        """
+        Parse a chunk of addresses off the event loop.
+        """
+
+        if self.app.workers:
+            pool = self.app.get_pool([country_code] if country_code else [])
+            results = await asyncio.wrap_future(pool.submit(strings, country_code, self.decode))
+            return [(code, expand(compact_components)) for code, compact_components in results]
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, parse_chunk, strings, country_code, self.app.get_parser,
+                                          self.decode)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        if self.sink is None:
+            self.sink = PrometheusSink()
+        if self.sink not in instruments.sinks:
+            instruments.attach(self.sink)
+            self._attached = True
+
+        if not self.app.workers:
+            # The parsers of the application are not shared between threads, one thread parses everything.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='parser')
+        in_flight = 2 * (self.app.workers or 1)
+        self.batcher = MicroBatcher(self, self.max_batch_size, self.max_delay, self.max_pending, in_flight)
+        self.batcher.start()
+
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_SIZE)
+        self.accepting = True
+        addresses = ', '.join(f'{s.getsockname()[0]}:{s.getsockname()[1]}' for s in self.server.sockets)
+        self.log.info(f'Serving on {addresses} with {self.app.workers or 0} workers.')
+
+    async def stop(self) -> None:
+        """
+        Stop accepting connections, answer the requests that were accepted, and release the workers.
+        """
+
+        self.accepting = False
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.batcher is not None:
+            await self.batcher.stop()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.app.close()
+        if self._attached:
+            instruments.detach(self.sink)
+            self._attached = False
+        self.log.info('Stopped serving.')
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    await self.respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+
+                started = time.perf_counter()
+                status, body, headers = await self.route(request)
+                keep_alive = request.keep_alive and self.accepting
+                await self.respond(writer, status, body, headers, keep_alive)
+
+                if instruments.enabled:
+                    instruments.observe('http_request_seconds', time.perf_counter() - started,
+                                        (('path', request.path),))
+                    instruments.increment('http_requests_total', 1,
+                                          (('path', request.path), ('status', str(status))))
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise HttpError(400, 'The request ended before its headers.')
+        except asyncio.LimitOverrunError:
+            raise HttpError(413, 'The request headers are too large.')
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HttpError(400, f'Malformed request line: {lines[0]!r}')
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length.')
+        if length < 0:
+            raise HttpError(400, 'Invalid Content-Length.')
+        if length > self.max_body_size:
+            raise HttpError(413, f'The body has {length} bytes, the limit is {self.max_body_size}.')
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target.split('?', 1)[0], version, headers, body)
+
+    async def route(self, request: Request) -> Tuple[int, object, Dict[str, str]]:
+        routes = {
+            '/parse': ('POST', self.parse),
+            '/parse/batch': ('POST', self.parse_batch),
+            '/metrics': ('GET', self.metrics),
+            '/health': ('GET', self.health),
+        }
+        if request.path not in routes:
+            return 404, {'error': f'Unknown path {request.path}.'}, {}
+        method, handler = routes[request.path]
+        if request.method != method:
+            return 405, {'error': f'Use {method} for {request.path}.'}, {'Allow': method}
+
+        try:
+            return 200, await handler(request), {}
+        except HttpError as e:
+            return e.status, {'error': str(e)}, {}
+        except ServiceOverloaded as e:
+            return 429, {'error': str(e)}, {'Retry-After': '1'}
+        except Exception as e:
+            self.log.exception(f'Failed to answer {request.method} {request.path}.')
+            return 500, {'error': f'{type(e).__name__}: {e}'}, {}
+
+    async def parse(self, request: Request) -> dict:
+        document = request.json()
+        address = document.get('address')
+        if not isinstance(address, str) or not address.strip():
+            raise HttpError(400, 'The body needs an "address" string.')
+
+        country_code, components = await self.batcher.parse(address, document.get('country_code'))
+        return as_dict((address, country_code, components))
+
+    async def parse_batch(self, request: Request) -> dict:
+        document = request.json()
+        addresses = document.get('addresses')
+        if not isinstance(addresses, list) or not all(isinstance(a, str) for a in addresses):
+            raise HttpError(400, 'The body needs an "addresses" list of strings.')
+        if len(addresses) > self.max_request_size:
+            raise HttpError(413, f'{len(addresses)} addresses in one request, the limit is {self.max_request_size}.')
+        if len(addresses) > self.max_pending:
+            # Such a request would be rejected however long it waits, so it does not get a Retry-After.
+            raise HttpError(413, f'{len(addresses)} addresses in one request, the pending limit is {self.max_pending}.')
+
+        country_code = document.get('country_code')
+        self.batcher.reserve(len(addresses))
+        try:
+            chunks = [addresses[i:i + self.max_batch_size] for i in range(0, len(addresses), self.max_batch_size)]
+            parsed = await asyncio.gather(*(self.parse_chunk(chunk, country_code) for chunk in chunks))
+        finally:
+            self.batcher.release(len(addresses))
+
+        results = (r for chunk in parsed for r in chunk)
+        return {'results': [as_dict((a, code, components)) for a, (code, components) in zip(addresses, results)]}
+
+    async def metrics(self, request: Request) -> str:
+        pending = self.batcher.pending if self.batcher else 0
+        return self.sink.render() + (
+            '# HELP buache_pending_addresses Accepted addresses that have not been answered.\n'
+            '# TYPE buache_pending_addresses gauge\n'
+            f'buache_pending_addresses {pending}\n'
+        )
+
+    async def health(self, request: Request) -> dict:
+        if not self.accepting:
+            raise HttpError(503, 'The service is stopping.')
+        return {'status': 'ok', 'pending': self.batcher.pending}
+
+    @staticmethod
+    async def respond(
+            writer: asyncio.StreamWriter,
+            status: int,
+            body: object,
+            headers: Dict[str, str] = None,
+            keep_alive: bool = True
+    ) -> None:
+        if isinstance(body, str):
+            payload, content_type = body.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            payload, content_type = json.dumps(body, ensure_ascii=False).encode('utf-8'), 'application/json'
+
+        lines = [
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {len(payload)}',
+            f'Connection: {"keep-alive" if keep_alive else "close"}',
+        ]
+        lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+
+def serve(app: Application, host: str = '127.0.0.1', port: int = 8080, **kwargs) -> None:
+    """
+    Run an AddressService until SIGINT or SIGTERM, then stop it gracefully.
+
+    :param kwargs: Passed on to AddressService.
+    """
+
+    async def main() -> None:
+        service = AddressService(app, **kwargs)
+        await service.start(host, port)
+
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stopped.set)
+            except NotImplementedError:
+                # Windows has no signal handlers on the event loop, KeyboardInterrupt stops the service there.
+                pass
+        try:
+            await stopped.wait()
+        finally:
+            await service.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import unittest
+
+from src.address.component import compact
+from src.app import Application
+
+ADDRESSES = [
+    'Danagränd 7, 17566 Järfälla',
+    'Oxenstiernas allé 23 17464 Sundbyberg',
+    'Oxbacksgatan 3 lgh 1213 72461 Västerås',
+    'Storgatan 12 B, 11455 Stockholm',
+]
+
+
+class ApplicationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Application(mode='PRODUCTION')
+
+    def test_check_addresses_matches_single_addresses(self):
+        addresses = list(self.app.check_addresses(ADDRESSES, country_code='sv', batch_size=3))
+        self.assertEqual(len(addresses), len(ADDRESSES))
+        for string, address in zip(ADDRESSES, addresses):
+            single = self.app.get_parser('sv').parse_address(string)
+            self.assertEqual(address.country_code, 'sv')
+            self.assertEqual(compact(address.components), compact(single))
+
+    def test_parsers_are_shared_per_country(self):
+        parser = self.app.get_parser('sv')
+        self.assertIs(self.app.get_parser('sv'), parser)
+        self.assertIsNot(self.app.get_parser('default'), parser)
+        for address in self.app.check_addresses(ADDRESSES, country_code='sv'):
+            self.assertIs(address.parser, parser)
+
+    def test_parse_many_is_lazy_and_ordered(self):
+        consumed = []
+
+        def strings():
+            for string in ADDRESSES:
+                consumed.append(string)
+                yield string
+
+        results = self.app.parse_many(strings(), 'sv', batch_size=2)
+        self.assertEqual(consumed, [])
+        string, country_code, _ = next(results)
+        self.assertEqual((string, country_code), (ADDRESSES[0], 'sv'))
+        self.assertEqual(consumed, ADDRESSES[:2])
+        self.assertEqual([r[0] for r in results], ADDRESSES[1:])
+
+    def test_empty_input(self):
+        self.assertEqual(list(self.app.check_addresses([], country_code='sv')), [])
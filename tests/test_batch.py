@@ -0,0 +1,56 @@
+import unittest
+
+from benchmarks.corpus import generate_corpus
+from src.address import load_country_config
+from src.address.batch import BatchParser
+from src.address.component import compact
+from src.address.features import TokenFeatures
+from src.address.parser import AddressParser
+
+
+class BatchParserTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = generate_corpus(300, seed=3)
+        cls.parsers = {code: AddressParser(load_country_config(code)) for code in ('default', 'sv')}
+
+    def test_batch_matches_single_addresses(self):
+        for country_code, parser in self.parsers.items():
+            expected = [compact(parser.parse_address(address)) for address in self.corpus]
+            actual = [compact(components) for components in parser.parse_batch(self.corpus)]
+            self.assertEqual(actual, expected, country_code)
+
+    def test_records_match_single_addresses(self):
+        parser = self.parsers['sv']
+        records = parser.parse_records(self.corpus)
+        self.assertEqual(len(records), len(self.corpus))
+        for index, address in enumerate(self.corpus):
+            self.assertEqual(records.compact(index), compact(parser.parse_address(address)), address)
+
+    def test_tokens_match_single_addresses(self):
+        parser = self.parsers['sv']
+        tokens = BatchParser(parser).tokenize(self.corpus)
+        for index, address in enumerate(self.corpus):
+            single = parser.create_tokens(parser.normalize_address(address))
+            rows = range(tokens.address_offsets[index], tokens.address_offsets[index + 1])
+            self.assertEqual([tokens.text(row) for row in rows], single.texts(), address)
+            self.assertEqual([tokens.indexes[row] for row in rows], list(single.indexes), address)
+            features = TokenFeatures.from_tokens(single.texts(), single.indexes)
+            self.assertEqual(tokens.features.matrix[rows.start:rows.stop].tolist(), features.matrix.tolist(), address)
+
+    def test_parse_many_is_ordered_across_batches(self):
+        parser = self.parsers['sv']
+        expected = [compact(components) for components in parser.parse_batch(self.corpus)]
+        actual = [compact(components) for components in BatchParser(parser).parse_many(iter(self.corpus), 7)]
+        self.assertEqual(actual, expected)
+
+    def test_empty_and_blank_addresses(self):
+        parser = self.parsers['sv']
+        self.assertEqual(parser.parse_batch([]), [])
+        self.assertEqual(parser.parse_batch(['', '  ', '\t']), [[], [], []])
+        self.assertEqual(len(BatchParser(parser).tokenize(['', ' '])), 0)
+
+    def test_addresses_do_not_share_tokens(self):
+        parser = self.parsers['sv']
+        tokens = BatchParser(parser).tokenize(['Storgatan', '3'])
+        self.assertEqual([tokens.text(row) for row in range(len(tokens))], ['Storgatan', '3'])
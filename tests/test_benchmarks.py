@@ -0,0 +1,103 @@
+import io
+import json
+import logging
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.corpus import generate_corpus, iter_corpus
+from benchmarks.run import STAGES, compare, main, measure, run_benchmarks
+
+# The endings of 8 of the 13 international templates.
+INTERNATIONAL_ENDINGS = (
+    'United States', 'United Kingdom', 'France', 'Germany', 'Australia', 'Spain', 'Japan', 'Brazil'
+)
+
+
+def timings(**per_second: float) -> dict:
+    return {stage: {'per_second': value} for stage, value in per_second.items()}
+
+
+class CorpusTest(unittest.TestCase):
+    def test_reproducible(self):
+        self.assertEqual(generate_corpus(200, seed=4), generate_corpus(200, seed=4))
+        self.assertNotEqual(generate_corpus(200, seed=4), generate_corpus(200, seed=5))
+        self.assertEqual(list(iter_corpus(50, seed=4, duplicate_share=0.3)),
+                         generate_corpus(50, seed=4, duplicate_share=0.3))
+
+    def test_shares(self):
+        swedish = generate_corpus(100, seed=1, swedish_share=1.0)
+        self.assertEqual(len(swedish), 100)
+        self.assertFalse(any(a.endswith(INTERNATIONAL_ENDINGS) for a in swedish))
+        mixed = generate_corpus(1000, seed=1, swedish_share=0.5)
+        share = sum(a.endswith(INTERNATIONAL_ENDINGS) for a in mixed) / len(mixed)
+        self.assertAlmostEqual(share, 0.5 * 8 / 13, delta=0.05)
+
+    def test_duplicates_vary_whitespace_and_case(self):
+        corpus = generate_corpus(500, seed=2, duplicate_share=0.5)
+        canonical = {' '.join(a.split()).casefold() for a in corpus}
+        self.assertLess(len(canonical), 350)
+        self.assertGreater(len(set(corpus)), len(canonical))
+
+
+class CompareTest(unittest.TestCase):
+    def test_regressions(self):
+        baseline = {'sizes': {'1000': timings(parse_address=1000, parse_many=1000)}, 'import_ms': 100}
+        current = {'sizes': {'1000': timings(parse_address=950, parse_many=800)}, 'import_ms': 105}
+        regressions = compare(current, baseline, 0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('parse_many at 1000 addresses'))
+
+    def test_import_time(self):
+        regressions = compare({'sizes': {}, 'import_ms': 120}, {'sizes': {}, 'import_ms': 100}, 0.1)
+        self.assertEqual(regressions, ['import of src: 120 ms, was 100 ms'])
+
+    def test_new_stages_and_sizes_are_skipped(self):
+        baseline = {'sizes': {'1000': timings(parse_address=0)}}
+        current = {'sizes': {'1000': timings(parse_address=1, parse_many=1), '10': timings(parse_address=1)}}
+        self.assertEqual(compare(current, baseline, 0.1), [])
+
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        level = logging.getLogger().level
+        self.addCleanup(logging.getLogger().setLevel, level)
+        patcher = mock.patch('config.setup_logging')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_measure(self):
+        result = measure(lambda: 10, 2)
+        self.assertEqual(result['items'], 10)
+        self.assertGreater(result['per_second'], 0)
+
+    def test_every_stage(self):
+        corpus = generate_corpus(20, seed=1)
+        with redirect_stderr(io.StringIO()):
+            results = run_benchmarks(corpus, repeat=1, batch_size=7)
+        self.assertEqual(list(results), STAGES)
+        for stage, timing in results.items():
+            self.assertGreater(timing['items'], 0, stage)
+
+    def test_unknown_stage(self):
+        with redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(main(['run', '--stages', 'parse_address,unknown']), 2)
+        self.assertIn('unknown', stderr.getvalue())
+
+    def test_corpus_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'corpus.txt'
+            self.assertEqual(main(['corpus', '--size', '30', '--seed', '3', '-o', str(path)]), 0)
+            lines = path.read_text(encoding='utf-8').splitlines()
+        self.assertEqual(lines, [a.replace('\n', ' ') for a in generate_corpus(30, seed=3)])
+
+    def test_baseline_comparison_fails_the_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            baseline.write_text(json.dumps({'sizes': {'20': timings(parse_address=1e12)}}), encoding='utf-8')
+            with redirect_stderr(io.StringIO()), mock.patch('benchmarks.run.import_time', return_value=1.0):
+                status = main(['run', '--sizes', '20', '--repeat', '1', '--stages', 'parse_address',
+                               '--baseline', str(baseline)])
+        self.assertEqual(status, 1)
@@ -0,0 +1,137 @@
+import pickle
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.address import AddressParser, ResultCache, load_country_config
+from src.address.component import compact
+
+ADDRESSES = ['Oxbacksgatan 3 lgh 1213, 72461 Västerås', 'Danagränd 7, 17566 Järfälla', 'Storgatan 3, 11122 Stockholm']
+
+
+class ResultCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.country_config = load_country_config('sv')
+        cls.expected = [compact(c) for c in AddressParser(cls.country_config).parse_batch(ADDRESSES)]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'cache.db'
+
+    def parse(self, cache: ResultCache, addresses=ADDRESSES, country_config=None, **kwargs):
+        parser = AddressParser(country_config or self.country_config, cache=cache, **kwargs)
+        return [compact(components) for components in parser.parse_batch(addresses)]
+
+    def test_results_match_parsing(self):
+        cache = ResultCache()
+        self.assertEqual(self.parse(cache), self.expected)
+        self.assertEqual(self.parse(cache), self.expected)
+        parser = AddressParser(self.country_config, cache=cache)
+        self.assertEqual([compact(parser.parse_address(a)) for a in ADDRESSES], self.expected)
+        self.assertEqual(cache.stats()['misses'], len(ADDRESSES))
+        self.assertEqual(cache.stats()['hits'], 2 * len(ADDRESSES))
+
+    def test_duplicates_are_parsed_once(self):
+        cache = ResultCache()
+        results = self.parse(cache, ADDRESSES[:1] * 3)
+        self.assertEqual(results, self.expected[:1] * 3)
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_canonical(self):
+        self.assertEqual(ResultCache().canonical('  Danagränd \t7,  17566 JÄRFÄLLA '), 'danagränd 7, 17566 järfälla')
+        self.assertEqual(ResultCache(fold_case=False).canonical(' Danagränd  7 '), 'Danagränd 7')
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        self.parse(cache, ADDRESSES[:2])
+        self.parse(cache, ADDRESSES[:1])
+        self.parse(cache, ADDRESSES[2:])
+        self.assertEqual(cache.stats()['size'], 2)
+        options = AddressParser(self.country_config).options
+        self.assertIsNotNone(cache.get(ADDRESSES[0], self.country_config, options))
+        self.assertIsNone(cache.get(ADDRESSES[1], self.country_config, options))
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=60)
+        self.parse(cache)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(self.parse(cache), self.expected)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (0, 2 * len(ADDRESSES)))
+
+    def test_cached_components_are_new_objects(self):
+        cache = ResultCache()
+        parser = AddressParser(self.country_config, cache=cache)
+        first = parser.parse_address(ADDRESSES[0])
+        first[0].component_value = 'changed'
+        self.assertEqual(compact(parser.parse_address(ADDRESSES[0])), self.expected[0])
+
+    def test_options_are_part_of_the_key(self):
+        cache = ResultCache()
+        self.parse(cache)
+        unigrams = self.parse(cache, ngram_sizes=(1,))
+        expected = [compact(c) for c in AddressParser(self.country_config, (1,)).parse_batch(ADDRESSES)]
+        self.assertEqual(unigrams, expected)
+        self.assertNotEqual(unigrams, self.expected)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_configuration_is_part_of_the_key(self):
+        cache = ResultCache()
+        self.parse(cache)
+        self.parse(cache, country_config=self.country_config._replace(fingerprint='other'))
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_persistent_hits(self):
+        self.assertEqual(self.parse(ResultCache(maxsize=1, path=self.path)), self.expected)
+        cache = ResultCache(maxsize=1, path=self.path)
+        self.assertEqual(self.parse(cache), self.expected)
+        self.assertEqual((cache.stats()['persistent_hits'], cache.stats()['misses']), (len(ADDRESSES), 0))
+
+    def test_persistent_ttl(self):
+        self.parse(ResultCache(path=self.path))
+        with mock.patch('time.time', return_value=time.time() + 61):
+            cache = ResultCache(ttl=60, path=self.path)
+            self.parse(cache)
+        self.assertEqual(cache.stats()['persistent_hits'], 0)
+
+    def test_expired_results_are_removed(self):
+        self.parse(ResultCache(path=self.path), ADDRESSES[:1])
+        with mock.patch('time.time', return_value=time.time() + 61):
+            cache = ResultCache(ttl=60, path=self.path)
+            self.parse(cache, ADDRESSES[1:])
+        self.assertEqual(self.rows(), len(ADDRESSES) - 1)
+
+    def test_other_configurations_are_kept_until_purged(self):
+        other = self.country_config._replace(fingerprint='other')
+        self.parse(ResultCache(path=self.path))
+        self.parse(ResultCache(path=self.path), country_config=other)
+        self.assertEqual(self.rows(), 2 * len(ADDRESSES))
+
+        cache = ResultCache(path=self.path)
+        self.assertEqual(self.parse(cache), self.expected)
+        self.assertEqual(cache.stats()['persistent_hits'], len(ADDRESSES))
+
+        self.assertEqual(cache.purge(other), len(ADDRESSES))
+        self.assertEqual(self.rows(), len(ADDRESSES))
+        self.assertEqual(ResultCache().purge(other), 0)
+
+    def test_clear(self):
+        cache = ResultCache(path=self.path)
+        self.parse(cache)
+        cache.clear()
+        self.assertEqual((cache.stats()['size'], self.rows()), (0, 0))
+
+    def test_pickled_cache_starts_empty(self):
+        cache = ResultCache(maxsize=5, ttl=3, path=self.path, fold_case=False)
+        self.parse(cache)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual((copy.maxsize, copy.ttl, copy.path, copy.fold_case), (5, 3, str(self.path), False))
+        self.assertEqual(copy.stats()['size'], 0)
+
+    def rows(self) -> int:
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+from unittest import mock
+
+from src.address.component import AddressComponent, AddressComponentType, as_dict
+from src.app import Application
+from src.cli import guess_format, main, read_addresses, read_records, write_results
+
+ADDRESSES = ['Storgatan 3, 11122 Stockholm', 'Oxbacksgatan 3 lgh 1213, 72461 Västerås', 'Danagränd 7, 17566 Järfälla']
+
+
+class ReadTest(unittest.TestCase):
+    def test_guess_format(self):
+        self.assertEqual(guess_format('addresses.CSV'), 'csv')
+        self.assertEqual(guess_format('addresses.txt'), 'txt')
+        self.assertEqual(guess_format('addresses.parquet'), 'jsonl')
+        self.assertEqual(guess_format('-', default='csv'), 'csv')
+
+    def test_read_addresses(self):
+        streams = {
+            'txt': 'Storgatan 3\n\n  \nDanagränd 7\r\n',
+            'jsonl': '{"address": "Storgatan 3"}\n\n{"address": ""}\n{"street": "x"}\n{"address": "Danagränd 7"}\n',
+            'csv': 'id,address\n1,Storgatan 3\n2,\n3,Danagränd 7\n',
+        }
+        for file_format, text in streams.items():
+            self.assertEqual(list(read_addresses(io.StringIO(text), file_format)), ['Storgatan 3', 'Danagränd 7'],
+                             file_format)
+
+    def test_read_addresses_from_column(self):
+        stream = io.StringIO('{"adress": "Storgatan 3"}\n')
+        self.assertEqual(list(read_addresses(stream, 'jsonl', 'adress')), ['Storgatan 3'])
+
+    def test_read_addresses_is_lazy(self):
+        addresses = read_addresses(io.StringIO('{"address": "Storgatan 3"}\n{not json\n'), 'jsonl')
+        self.assertEqual(next(addresses), 'Storgatan 3')
+        with self.assertRaises(json.JSONDecodeError):
+            next(addresses)
+
+    def test_read_records(self):
+        stream = io.StringIO('{"id": 7, "address": "Storgatan 3"}\n{"address": "Danagränd 7"}\n{"id": 9}\n')
+        self.assertEqual(list(read_records(stream, 'jsonl')), [('7', 'Storgatan 3'), ('2', 'Danagränd 7')])
+        stream = io.StringIO('Storgatan 3\n\nDanagränd 7\n')
+        self.assertEqual(list(read_records(stream, 'txt')), [('1', 'Storgatan 3'), ('3', 'Danagränd 7')])
+
+
+class WriteTest(unittest.TestCase):
+    def setUp(self):
+        components = [
+            AddressComponent(AddressComponentType.STREET_NAME, 'Storgatan', 0.4, 0),
+            AddressComponent(AddressComponentType.STREET_NUMBER, '3', 0.9, 1),
+            AddressComponent(AddressComponentType.STREET_NAME, 'Storgatan 3', 0.8, 0),
+        ]
+        self.results = [('Storgatan 3', 'sv', components), ('', 'default', [])]
+
+    def test_jsonl(self):
+        stream = io.StringIO()
+        self.assertEqual(write_results(stream, 'jsonl', iter(self.results)), 2)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [as_dict(result) for result in self.results])
+
+    def test_csv_keeps_the_most_confident_value_of_each_type(self):
+        stream = io.StringIO()
+        self.assertEqual(write_results(stream, 'csv', self.results), 2)
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        self.assertEqual(rows[0]['street_name'], 'Storgatan 3')
+        self.assertEqual(rows[0]['street_number'], '3')
+        self.assertEqual(rows[0]['city'], '')
+        self.assertEqual((rows[1]['address'], rows[1]['country_code']), ('', 'default'))
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.folder = Path(directory.name)
+        (self.folder / 'addresses.txt').write_text('\n'.join(ADDRESSES) + '\n', encoding='utf-8')
+
+        # main sets up logging from log.json, which would write log files and log to stderr for all later tests.
+        patcher = mock.patch('config.setup_logging')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_main(self, *argv: str) -> str:
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(main(list(argv)), 0)
+        return stderr.getvalue()
+
+    def test_parse(self):
+        output = self.folder / 'components.jsonl'
+        report = self.run_main('parse', '-i', str(self.folder / 'addresses.txt'), '-o', str(output),
+                               '--country', 'sv', '--batch-size', '2')
+        self.assertIn(f'Parsed {len(ADDRESSES)} addresses', report)
+
+        expected = [as_dict(result) for result in Application(mode='PRODUCTION').parse_many(ADDRESSES, 'sv')]
+        with open(output, encoding='utf-8') as stream:
+            self.assertEqual([json.loads(line) for line in stream], expected)
+
+    def test_parse_to_csv(self):
+        output = self.folder / 'components.csv'
+        self.run_main('parse', '-i', str(self.folder / 'addresses.txt'), '-o', str(output), '--country', 'sv')
+        with open(output, encoding='utf-8', newline='') as stream:
+            rows = list(csv.DictReader(stream))
+        self.assertEqual([row['address'] for row in rows], ADDRESSES)
+        self.assertEqual({row['country_code'] for row in rows}, {'sv'})
+
+    def test_unknown_command(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(['unknown'])
@@ -0,0 +1,109 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from src.address import load_country_config
+from src.address.component import (
+    COMPONENT_DTYPE, AddressComponent, AddressComponentType, ComponentBatch, as_dict, compact, expand
+)
+from src.address.parser import AddressParser
+
+
+def records(rows):
+    return np.array(rows, dtype=COMPONENT_DTYPE)
+
+
+class AddressComponentTest(unittest.TestCase):
+    def test_span_counts_the_words_of_the_value(self):
+        self.assertEqual(AddressComponent(AddressComponentType.CITY, 'Upplands Väsby', 0.5, 3).span, 2)
+        self.assertEqual(AddressComponent(AddressComponentType.CITY, '', 0.5, 3).span, 1)
+
+    def test_span_of_a_replaced_value(self):
+        component = AddressComponent(AddressComponentType.STREET_NAME, 'Kungsgatan', 0.5, 0, words=2)
+        self.assertEqual(component.span, 2)
+
+    def test_components_are_ordered_by_confidence(self):
+        low = AddressComponent(AddressComponentType.CITY, 'Järfälla', 0.2, 3)
+        high = AddressComponent(AddressComponentType.STREET_NAME, 'Danagränd', 0.9, 0)
+        self.assertEqual(sorted([high, low]), [low, high])
+        self.assertEqual(max([low, high]), high)
+
+    def test_component_type_values_are_ints(self):
+        self.assertEqual([t.value for t in AddressComponentType], list(range(1, len(AddressComponentType) + 1)))
+
+
+class CompactTest(unittest.TestCase):
+    def test_expand_restores_compacted_components(self):
+        components = [
+            AddressComponent(AddressComponentType.STREET_NAME, 'Danagränd', 0.91, 0),
+            AddressComponent(AddressComponentType.STREET_NUMBER, '7', 0.5, 1),
+            AddressComponent(AddressComponentType.CITY, 'Järfälla', 0.33, 4, words=2),
+        ]
+        expanded = expand(compact(components))
+        self.assertEqual(compact(expanded), compact(components))
+        self.assertEqual([c.component_type for c in expanded], [c.component_type for c in components])
+        self.assertEqual(expanded[2].words, 2)
+
+    def test_compact_components_pickle(self):
+        compacted = compact([AddressComponent(AddressComponentType.POSTAL_CODE, '17566', 0.8, 2)])
+        self.assertEqual(pickle.loads(pickle.dumps(compacted)), compacted)
+
+    def test_empty(self):
+        self.assertEqual(compact([]), ())
+        self.assertEqual(expand(()), [])
+
+    def test_as_dict(self):
+        component = AddressComponent(AddressComponentType.STREET_NAME, 'Danagränd', 0.91, 0)
+        self.assertEqual(as_dict(('Danagränd', 'sv', [component])), {
+            'address': 'Danagränd',
+            'country_code': 'sv',
+            'components': [{'type': 'STREET_NAME', 'value': 'Danagränd', 'position': 0, 'confidence': 0.91}]
+        })
+
+
+class ComponentBatchTest(unittest.TestCase):
+    def setUp(self):
+        street_name, city = AddressComponentType.STREET_NAME.value, AddressComponentType.CITY.value
+        self.sources = ['Danagränd 7', '', 'Storgatan 3 Järfälla']
+        self.batch = ComponentBatch(self.sources, records([
+            (0, street_name, 0, 9, 0, 0.456),
+            (2, street_name, 0, 9, 0, 0.7),
+            (2, city, 12, 20, 2, 0.333),
+        ]))
+
+    def test_offsets_group_the_rows_by_address(self):
+        self.assertEqual(self.batch.offsets.tolist(), [0, 1, 1, 3])
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(len(self.batch.records_of(1)), 0)
+        self.assertEqual(self.batch.records_of(2)['position'].tolist(), [0, 2])
+
+    def test_values_are_spans_of_the_sources(self):
+        self.assertEqual([self.batch.value(row) for row in range(3)], ['Danagränd', 'Storgatan', 'Järfälla'])
+
+    def test_compact_rounds_the_confidence(self):
+        self.assertEqual(self.batch.compact(0), ((AddressComponentType.STREET_NAME.value, 'Danagränd', 0, 0.46, None),))
+        self.assertEqual(self.batch.compact(1), ())
+
+    def test_items_are_components(self):
+        components = self.batch[2]
+        self.assertEqual([c.component_type for c in components],
+                         [AddressComponentType.STREET_NAME, AddressComponentType.CITY])
+        self.assertEqual([c.component_value for c in components], ['Storgatan', 'Järfälla'])
+        self.assertEqual([compact(c) for c in self.batch.to_lists()], [self.batch.compact(i) for i in range(3)])
+
+    def test_nbytes(self):
+        self.assertEqual(COMPONENT_DTYPE.itemsize, 25)
+        self.assertEqual(self.batch.nbytes, 3 * 25 + self.batch.offsets.nbytes)
+
+    def test_empty_batch(self):
+        batch = ComponentBatch([], records([]))
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.to_lists(), [])
+
+    def test_parsed_records_match_parse_address(self):
+        parser = AddressParser(load_country_config('sv'))
+        addresses = ['Danagränd 7B, 174 64 Järfälla', 'Storgatan 3']
+        batch = parser.parse_records(addresses)
+        for index, address in enumerate(addresses):
+            self.assertEqual(compact(batch[index]), compact(parser.parse_address(address)), address)
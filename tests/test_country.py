@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import config
+from src.address import country
+from src.address.component import AddressComponentType
+from src.address.country import load_country_config
+from src.exceptions import ConfigurationError
+
+
+class CountryConfigTest(unittest.TestCase):
+    def test_snapshot_is_shared(self):
+        self.assertIs(load_country_config('sv'), load_country_config('sv'))
+
+    def test_snapshot_is_immutable(self):
+        country_config = load_country_config('sv')
+        with self.assertRaises(TypeError):
+            country_config.positions[AddressComponentType.CITY] = 0
+        with self.assertRaises(TypeError):
+            country_config.multipliers['city']['position'] = 1.0
+        with self.assertRaises(AttributeError):
+            country_config.threshold = 0
+
+    def test_lookups(self):
+        country_config = load_country_config('sv')
+        self.assertEqual(country_config.position('street_number'), 1)
+        self.assertEqual(country_config.position(AddressComponentType.CITY), 7)
+        self.assertIn('g.', country_config.abbreviations['gatan'])
+        self.assertIsNone(country_config.multiplier('street_number', 'not_configured'))
+
+
+class CountryConfigReloadTest(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.countries = Path(folder)
+        shutil.copy(Path(config.country_folder, 'default.ini'), self.countries)
+        (self.countries / 'zz').mkdir()
+        self.general = self.countries / 'zz' / 'general.ini'
+        self.general.write_text('[Address]\nFORMAT = {street_name}\n', encoding='utf8')
+
+        for patch in (mock.patch.object(config, 'country_folder', self.countries),
+                      mock.patch.object(country, 'CHECK_INTERVAL', 0)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(country._snapshots.pop, 'zz', None)
+
+    def test_unchanged_files_keep_the_snapshot(self):
+        self.assertIs(load_country_config('zz'), load_country_config('zz'))
+
+    def test_changed_file_is_compiled_again(self):
+        before = load_country_config('zz')
+        self.general.write_text('[Address]\nFORMAT = {city}\n', encoding='utf8')
+        stat = self.general.stat()
+        os.utime(self.general, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        after = load_country_config('zz')
+        self.assertIsNot(after, before)
+        self.assertEqual((before.format, after.format), ('{street_name}', '{city}'))
+        self.assertNotEqual(after.fingerprint, before.fingerprint)
+
+    def test_invalid_file_raises_configuration_error(self):
+        self.general.write_text('[AddressComponentType]\nCITY = first\n', encoding='utf8')
+        with self.assertLogs('src.address.country', 'ERROR'), self.assertRaises(ConfigurationError):
+            load_country_config('zz')
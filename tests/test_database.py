@@ -0,0 +1,139 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from src.address.component import AddressComponent, AddressComponentType
+from src.address.database import AddressDatabase, AddressMatcher
+from src.address.sections import write_sections
+from src.exceptions import ConfigurationError
+
+T = AddressComponentType
+
+ROWS = [
+    {'street': 'Danagränd', 'number': '7', 'postal_code': '175 66', 'city': 'Järfälla'},
+    {'street': 'Danagränd', 'number': '9', 'postal_code': '175 66', 'city': 'Järfälla'},
+    {'street': 'Oxenstiernas  allé', 'number': '23', 'postal_code': '174 64', 'city': 'Sundbyberg'},
+    {'street': 'Sundbyvägen', 'number': '1', 'postal_code': '174 64', 'city': 'Sundbyberg'},
+    {'street': 'Sundbyvägen', 'number': '1', 'postal_code': '174 64', 'city': 'Sundbyberg'},
+    {'street': 'Sundbybacken', 'number': '', 'postal_code': '174 65', 'city': 'Sundbyberg'},
+    {'street': 'Oxbacksgatan', 'number': '3', 'postal_code': '724 61', 'city': 'Västerås'},
+]
+
+
+class AddressDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.database = AddressDatabase.compile(ROWS, os.path.join(self.directory, 'register.db'))
+        self.addCleanup(self.database.close)
+
+    def test_distinct_addresses_are_kept(self):
+        self.assertEqual(len(self.database), 6)
+
+    def test_lookup_is_canonical(self):
+        for component_type, value in ((T.STREET_NAME, 'DANAGRÄND'), (T.STREET_NAME, 'oxenstiernas allé'),
+                                      (T.POSTAL_CODE, '17566'), (T.CITY, ' järfälla ')):
+            index = self.database.lookup(component_type, value)
+            self.assertGreaterEqual(index, 0, value)
+        self.assertEqual(self.database.lookup(T.STREET_NAME, 'Storgatan'), -1)
+        self.assertEqual(self.database.lookup(T.APARTMENT, '7'), -1)
+
+    def test_names_keep_the_first_spelling(self):
+        index = self.database.lookup(T.STREET_NAME, 'oxenstiernas allé')
+        self.assertEqual(self.database.name(T.STREET_NAME, index), 'Oxenstiernas allé')
+        self.assertEqual(self.database.count(T.CITY, self.database.lookup(T.CITY, 'Sundbyberg')), 4)
+
+    def test_match_components(self):
+        match = self.database.match_components
+        self.assertEqual(match(T.CITY, 'västerås'), ('Västerås', 1.0))
+        self.assertEqual(match(T.POSTAL_CODE, '724 61'), ('724 61', 1.0))
+        # The most common value starting with the input wins, with the share of it that the input covers.
+        self.assertEqual(match(T.STREET_NAME, 'sundby'), ('Sundbyvägen', 6 / 11))
+        self.assertEqual(match(T.CITY, 'sundby'), ('Sundbyberg', 0.6))
+        self.assertEqual(match(T.POSTAL_CODE, '7246'), (None, 0.0))
+        self.assertEqual(match(T.STREET_NUMBER, '2'), (None, 0.0))
+        self.assertEqual(match(T.CITY, 'Uppsala'), (None, 0.0))
+        self.assertEqual(match(T.CITY, ' '), (None, 0.0))
+        self.assertEqual(match(T.APARTMENT, '7'), (None, 0.0))
+
+    def test_contains_address(self):
+        self.assertTrue(self.database.contains_address('17566', 'Danagränd'))
+        self.assertTrue(self.database.contains_address('17566', 'Danagränd', '9'))
+        self.assertFalse(self.database.contains_address('17566', 'Danagränd', '23'))
+        self.assertFalse(self.database.contains_address('17464', 'Danagränd'))
+        self.assertFalse(self.database.contains_address('99999', 'Danagränd'))
+        self.assertTrue(self.database.contains_address('17465', 'Sundbybacken'))
+        self.assertEqual(len(self.database.rows('17464')), 2)
+        self.assertEqual(len(self.database.rows('99999')), 0)
+
+    def test_compile_csv_and_columns(self):
+        csv_path = os.path.join(self.directory, 'register.csv')
+        with open(csv_path, 'w', encoding='utf-8') as output:
+            output.write('gatuadress;nr;postnummer;ort\nDanagränd;7;175 66;Järfälla\n')
+        path = os.path.join(self.directory, 'csv.db')
+        columns = {'streets': 'gatuadress', 'numbers': 'nr', 'postal_codes': 'postnummer', 'cities': 'ort'}
+        database = AddressDatabase.compile_csv(csv_path, path, columns, delimiter=';')
+        self.addCleanup(database.close)
+        self.assertTrue(database.contains_address('17566', 'Danagränd', '7'))
+
+    def test_pickle_reopens_the_file(self):
+        database = pickle.loads(pickle.dumps(self.database))
+        self.addCleanup(database.close)
+        self.assertEqual(database.path, self.database.path)
+        self.assertEqual(len(database), len(self.database))
+
+    def test_empty_register(self):
+        database = AddressDatabase.compile([], os.path.join(self.directory, 'empty.db'))
+        self.addCleanup(database.close)
+        self.assertEqual(len(database), 0)
+        self.assertEqual(database.match_components(T.CITY, 'Järfälla'), (None, 0.0))
+        self.assertFalse(database.contains_address('17566', 'Danagränd'))
+
+    def test_bad_files(self):
+        other = os.path.join(self.directory, 'other.db')
+        write_sections(other, b'BUACHESP', {'settings': b''})
+        with self.assertRaisesRegex(ConfigurationError, 'is not a BUACHEDB file'):
+            AddressDatabase(other)
+
+        missing = os.path.join(self.directory, 'missing.db')
+        write_sections(missing, b'BUACHEDB', {'addresses': b''})
+        with self.assertRaisesRegex(ConfigurationError, 'has no section'):
+            AddressDatabase(missing)
+
+        newer = os.path.join(self.directory, 'newer.db')
+        write_sections(newer, b'BUACHEDB', {'addresses': b''}, version=2)
+        with self.assertRaisesRegex(ConfigurationError, 'format version'):
+            AddressDatabase(newer)
+
+
+class AddressMatcherTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = AddressDatabase.compile(ROWS, os.path.join(directory.name, 'register.db'))
+        self.addCleanup(self.database.close)
+
+    def test_components_are_corrected(self):
+        components = [
+            AddressComponent(T.STREET_NAME, 'danagränd', 0.8, 0),
+            AddressComponent(T.STREET_NUMBER, '7', 0.5, 1),
+            AddressComponent(T.POSTAL_CODE, '175 66', 0.9, 2, words=2),
+            AddressComponent(T.APARTMENT, '1213', 0.4, 4),
+        ]
+        matched = AddressMatcher(self.database).match_address(components)
+        self.assertEqual([(c.component_value, c.confidence, c.position, c.span) for c in matched], [
+            ('Danagränd', 0.8, 0, 1), ('7', 0.5, 1, 1), ('175 66', 0.9, 2, 2), ('1213', 0.4, 4, 1)
+        ])
+
+    def test_unmatched_components_are_dropped_unless_kept(self):
+        components = [AddressComponent(T.CITY, 'Uppsala', 0.8, 0)]
+        self.assertEqual(AddressMatcher(self.database).match_address(components), [])
+        self.assertEqual(AddressMatcher(self.database, keep_unmatched=True).match_address(components), components)
+
+    def test_streets_outside_the_postal_code_lose_confidence(self):
+        components = [AddressComponent(T.STREET_NAME, 'Danagränd', 0.8, 0),
+                      AddressComponent(T.POSTAL_CODE, '17464', 0.9, 1)]
+        matched = AddressMatcher(self.database, mismatch_factor=0.5).match_address(components)
+        self.assertEqual(matched[0].confidence, 0.4)
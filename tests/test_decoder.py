@@ -0,0 +1,102 @@
+import unittest
+
+from src.address import Address
+from src.address.component import AddressComponent, AddressComponentType, compact
+from src.address.decoder import ComponentDecoder
+from src.app import Application
+
+T = AddressComponentType
+
+POSITIONS = {
+    T.STREET_NAME: 0,
+    T.STREET_NUMBER: 1,
+    T.APARTMENT: 2,
+    T.BLOCK: 3,
+    T.POSTAL_CODE: 3,
+    T.CITY: 4,
+    T.STATE: -1,
+}
+
+
+def component(component_type: AddressComponentType, value: str, confidence: float, position: int) -> AddressComponent:
+    return AddressComponent(component_type, value, confidence, position)
+
+
+class ComponentDecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = ComponentDecoder(POSITIONS)
+
+    def decode(self, components, beam: int = 1):
+        return [(labeling.score, compact(labeling.components)) for labeling in self.decoder.decode(components, beam)]
+
+    def test_empty_input_has_one_empty_labeling(self):
+        self.assertEqual(self.decode([]), [(0.0, ())])
+        self.assertEqual(self.decode([], beam=3), [(0.0, ())])
+
+    def test_bigram_wins_over_overlapping_unigrams(self):
+        bigram = component(T.STREET_NAME, 'Oxenstiernas allé', 2.0, 0)
+        components = [
+            component(T.STREET_NAME, 'Oxenstiernas', 0.8, 0),
+            component(T.CITY, 'allé', 0.7, 1),
+            bigram,
+        ]
+        self.assertEqual(self.decode(components), [(2.0, compact([bigram]))])
+
+    def test_unigrams_win_over_a_weaker_bigram(self):
+        street_name = component(T.STREET_NAME, 'Storgatan', 0.9, 0)
+        street_number = component(T.STREET_NUMBER, '3', 0.9, 1)
+        components = [component(T.STREET_NAME, 'Storgatan 3', 1.2, 0), street_name, street_number]
+        self.assertEqual(self.decode(components), [(1.8, compact([street_name, street_number]))])
+
+    def test_components_follow_the_positions(self):
+        city, street_name = component(T.CITY, 'Järfälla', 0.9, 0), component(T.STREET_NAME, 'Danagränd', 0.5, 1)
+        # A street name cannot follow a city, so only the stronger of the two is kept.
+        self.assertEqual(self.decode([city, street_name]), [(0.9, compact([city]))])
+
+    def test_types_of_the_same_position_come_in_any_order(self):
+        postal_code, block = component(T.POSTAL_CODE, '72461', 0.9, 0), component(T.BLOCK, '12', 0.5, 1)
+        self.assertEqual(self.decode([postal_code, block]), [(1.4, compact([postal_code, block]))])
+
+    def test_each_type_is_used_once(self):
+        first, second = component(T.CITY, 'Upplands', 0.9, 0), component(T.CITY, 'Väsby', 0.8, 1)
+        self.assertEqual(self.decode([first, second]), [(0.9, compact([first]))])
+
+    def test_types_with_a_negative_position_are_never_used(self):
+        state = component(T.STATE, 'Uppland', 5.0, 0)
+        self.assertEqual(self.decode([state]), [(0.0, ())])
+        self.assertNotIn(T.STATE, self.decoder.groups)
+
+    def test_beam_returns_the_best_labelings_first(self):
+        street_name = component(T.STREET_NAME, 'Storgatan', 0.9, 0)
+        street_number = component(T.STREET_NUMBER, '3', 0.6, 1)
+        apartment = component(T.APARTMENT, '3', 0.4, 1)
+        labelings = self.decode([street_name, street_number, apartment], beam=4)
+        self.assertEqual(labelings, [
+            (1.5, compact([street_name, street_number])),
+            (1.3, compact([street_name, apartment])),
+            (0.9, compact([street_name])),
+            (0.6, compact([street_number])),
+        ])
+        self.assertEqual(self.decode([street_name, street_number, apartment]), labelings[:1])
+
+    def test_rank_prefers_more_components_on_equal_scores(self):
+        street_name = component(T.STREET_NAME, 'Storgatan', 0.5, 0)
+        street_number = component(T.STREET_NUMBER, '3', 0.5, 1)
+        bigram = component(T.STREET_NAME, 'Storgatan 3', 1.0, 0)
+        ranked = self.decoder.rank(self.decoder.decode([bigram, street_name, street_number], beam=2))
+        self.assertEqual([len(labeling.components) for labeling in ranked], [2, 1])
+
+    def test_decoders_are_cached_per_country(self):
+        app = Application(mode='PRODUCTION')
+        country_config = app.get_parser('sv').country_config
+        self.assertIs(ComponentDecoder.for_country(country_config), ComponentDecoder.for_country(country_config))
+
+
+class PossibleAddressesTest(unittest.TestCase):
+    def test_readings_are_distinct_and_ranked(self):
+        address = Address(Application(mode='PRODUCTION'), 'Oxbacksgatan 3 lgh 1213, 72461 Västerås', country_code='sv')
+        readings = address.possible_addresses()
+        self.assertEqual(len(readings), len(set(readings)))
+        parser = address.parser
+        labelings = parser.rank_possible_addresses(parser.generate_possible_addresses(address.components))
+        self.assertEqual(readings[0], address.format_address(labelings[0].components))
@@ -0,0 +1,162 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+
+from src.address.component import AddressComponent, AddressComponentType
+from src.address.dedup import SMALL_BLOCK, SMALL_BUCKET, Deduplicator, DisjointSet, MinHasher, jaccard, match_block
+from src.app import Application
+
+RECORDS = [
+    ('a1', 'Oxbacksgatan 3 lgh 1213, 72461 Västerås'),
+    ('a2', 'OXBACKSGATAN 3 LGH 1213, 72461 VÄSTERÅS'),
+    ('a3', 'Oxbacksgatan 3 lgh 1213,  72461 Västerås'),
+    ('b1', 'Danagränd 7, 17566 Järfälla'),
+    ('b2', 'Danagrand 7, 17566 Järfälla'),
+    ('c1', 'Storgatan 12 B, 11455 Stockholm'),
+    ('d1', 'Storgatan 40, 90326 Umeå'),
+    ('e1', 'Kungsgatan 1, 11143 Stockholm'),
+    ('e2', 'Kungsgatan 1 11143 Stockholm'),
+    ('f1', 'Drottninggatan 19, 11151 Stockholm'),
+]
+
+CLUSTERS = [['a1', 'a2', 'a3'], ['b1', 'b2'], ['e1', 'e2']]
+
+
+def large_block(seed: int = 5):
+    """
+    Return a block of unrelated street addresses, one large group of copies of the same address and a few pairs
+    that differ in one word, shuffled, with its clusters.
+    """
+
+    generator = random.Random(seed)
+
+    def word() -> str:
+        return ''.join(generator.choice('bdfghjklmnprstv') + generator.choice('aeiouyåäö') for _ in range(4))
+
+    records = [(f'u{i}', f'{word()} {word()}vägen {generator.randint(1, 99)}') for i in range(120)]
+    copies = [(f'c{i}', 'oxbacksgatan 3 lgh 1213, 72461 västerås' + ' ' * (i % 2)) for i in range(20)]
+    pairs = [(f'p{i}', records[i][1].replace('vägen', 'vagen')) for i in range(5)]
+    clusters = [sorted(record_id for record_id, _ in copies)] + [[f'p{i}', f'u{i}'] for i in range(5)]
+    records += copies + pairs
+    generator.shuffle(records)
+    return records, clusters
+
+
+def clusters_of(pairs) -> list:
+    groups = DisjointSet()
+    for a, b in pairs:
+        groups.union(a, b)
+    return sorted(sorted(group) for group in groups.groups())
+
+
+class MinHasherTest(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher()
+
+    def test_bands_must_divide_the_signature(self):
+        with self.assertRaises(ValueError):
+            MinHasher(num_perm=64, bands=10)
+        self.assertEqual(MinHasher(num_perm=64, bands=16).rows, 4)
+
+    def test_shingles(self):
+        hashes, offsets = self.hasher.shingles(['abcd', 'ab', 'abcabc'])
+        # abc and bcd, the padded "ab ", and abc, bca and cab once each.
+        self.assertEqual(np.diff(offsets).tolist(), [2, 1, 3])
+        first, third = hashes[offsets[0]:offsets[1]], hashes[offsets[2]:offsets[3]]
+        self.assertEqual(len(np.intersect1d(first, third)), 1)
+        self.assertTrue(all(np.all(np.diff(hashes[offsets[i]:offsets[i + 1]].astype(np.int64)) != 0)
+                            for i in range(3)))
+
+    def test_signatures_estimate_the_jaccard_similarity(self):
+        texts = ['oxbacksgatan 3 lgh 1213 72461 västerås', 'oxbacksgatan 3 72461 västerås', 'danagränd 7 järfälla']
+        hashes, offsets = self.hasher.shingles(texts)
+        signatures = MinHasher(num_perm=512, bands=16).signatures(hashes, offsets)
+        for a, b in combinations(range(3), 2):
+            exact = jaccard(hashes[offsets[a]:offsets[a + 1]], hashes[offsets[b]:offsets[b + 1]])
+            estimate = (signatures[a] == signatures[b]).mean()
+            self.assertAlmostEqual(estimate, exact, delta=0.1)
+
+    def test_signatures_are_computed_in_chunks(self):
+        hashes, offsets = self.hasher.shingles([f'storgatan {i}' for i in range(10)])
+        self.assertTrue(np.array_equal(self.hasher.signatures(hashes, offsets, chunk_size=3),
+                                       self.hasher.signatures(hashes, offsets)))
+
+    def test_identical_texts_share_every_bucket(self):
+        hashes, offsets = self.hasher.shingles(['storgatan 3', 'danagränd 7', 'storgatan 3'])
+        buckets = [sorted(bucket.tolist()) for bucket in self.hasher.buckets(self.hasher.signatures(hashes, offsets))]
+        self.assertEqual(buckets, [[0, 2]] * self.hasher.bands)
+
+
+class DisjointSetTest(unittest.TestCase):
+    def test_groups(self):
+        groups = DisjointSet()
+        for a, b in (('a', 'b'), ('c', 'd'), ('b', 'c'), ('e', 'f'), ('a', 'd')):
+            groups.union(a, b)
+        self.assertEqual(sorted(sorted(group) for group in groups.groups()), [['a', 'b', 'c', 'd'], ['e', 'f']])
+        self.assertEqual(groups.find('a'), groups.find('d'))
+        self.assertEqual(groups.sizes[groups.find('a')], 4)
+
+
+class MatchBlockTest(unittest.TestCase):
+    def test_small_block_compares_all_pairs(self):
+        records = [('a', 'storgatan 12 b 11455 stockholm'), ('b', 'storgatan 12b 11455 stockholm'),
+                   ('c', 'storgatan 40 90326 umeå')]
+        self.assertEqual(clusters_of(match_block(records, MinHasher(), 0.6)), [['a', 'b']])
+        self.assertEqual(match_block(records, MinHasher(), 0.95), [])
+
+    def test_large_block_with_banding(self):
+        records, clusters = large_block()
+        self.assertGreater(len(records), SMALL_BLOCK)
+        hasher = MinHasher()
+        hashes, offsets = hasher.shingles([text for _, text in records])
+        self.assertGreater(max(len(bucket) for bucket in hasher.buckets(hasher.signatures(hashes, offsets))),
+                           SMALL_BUCKET)
+
+        self.assertEqual(clusters_of(match_block(records, hasher, 0.6)), clusters)
+
+
+class DeduplicatorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Application(mode='PRODUCTION')
+
+    def test_block_keys(self):
+        deduplicator = Deduplicator(self.app, prefix_length=4, address_prefix_length=8)
+        components = [AddressComponent(AddressComponentType.STREET_NAME, 'Oxbacksgatan', 1.0, 0),
+                      AddressComponent(AddressComponentType.POSTAL_CODE, '724 61', 1.0, 3)]
+        self.assertEqual(deduplicator.block_keys(components, 'oxbacksgatan 3 724 61 västerås'),
+                         ['S:oxba', 'P:72461', 'N:oxbacksg'])
+
+    def test_known_clusters(self):
+        deduplicator = Deduplicator(self.app, partitions=4, workers=1)
+        self.assertEqual(sorted(deduplicator.deduplicate(iter(RECORDS), 'sv')), CLUSTERS)
+
+    def test_partitions_are_streamed_to_disk(self):
+        deduplicator = Deduplicator(self.app, partitions=3)
+        with tempfile.TemporaryDirectory() as directory:
+            count, paths = deduplicator.partition(iter(RECORDS), Path(directory), 'sv')
+            self.assertEqual(count, len(RECORDS))
+            self.assertGreater(len(paths), 1)
+            files = {path.name: [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+                     for path in paths}
+        lines = [line for partition in files.values() for line in partition]
+        # Every record is in the block of its normalized address, and each block is in a single partition.
+        self.assertEqual(sorted({record_id for key, record_id, _ in lines if key.startswith('N:')}),
+                         sorted(record_id for record_id, _ in RECORDS))
+        keys = [{key for key, _, _ in partition} for partition in files.values()]
+        self.assertEqual(sum(len(partition) for partition in keys), len(set.union(*keys)))
+        self.assertIn(['N:oxbacksg', 'a2', 'oxbacksgatan 3 lgh 1213, 72461 västerås'], lines)
+
+    def test_large_input_across_partitions(self):
+        records, clusters = large_block()
+        deduplicator = Deduplicator(self.app, partitions=2, workers=1)
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(sorted(deduplicator.deduplicate(iter(records), 'sv', 50, directory)), clusters)
+            # The partition files are removed when the clusters are found.
+            self.assertEqual(os.listdir(directory), [])
@@ -0,0 +1,115 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+from src.address.detection import CountryDetector, detect_country
+
+
+def fake_langdetect(detected: str):
+    """
+    Return modules standing in for langdetect, which record the seed at the time of each detection.
+    """
+
+    class DetectorFactory:
+        seed = None
+
+    class LangDetectException(Exception):
+        pass
+
+    seeds = []
+
+    def detect(text: str) -> str:
+        seeds.append(DetectorFactory.seed)
+        if not text.strip():
+            raise LangDetectException()
+        return detected
+
+    package = types.ModuleType('langdetect')
+    package.DetectorFactory, package.detect = DetectorFactory, detect
+    exceptions = types.ModuleType('langdetect.lang_detect_exception')
+    exceptions.LangDetectException = LangDetectException
+    modules = {'langdetect': package, 'langdetect.lang_detect_exception': exceptions}
+    return modules, seeds
+
+
+class SignalsTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = CountryDetector()
+
+    def test_short_swedish_address(self):
+        self.assertEqual(self.detector.from_signals('Danagränd 7, 17566 Järfälla'), 'sv')
+        self.assertEqual(detect_country('Danagränd 7, 17566 Järfälla'), 'sv')
+
+    def test_postal_code_pattern(self):
+        self.assertEqual(self.detector.from_signals('Marszałkowska 10, 00-590 Warszawa'), 'pl')
+        self.assertEqual(self.detector.from_signals('Rua Augusta 100, 1100-053 Lisboa'), 'pt')
+        self.assertEqual(self.detector.from_signals('10 Downing Street, London SW1A 2AA'), 'en')
+
+    def test_postal_code_outweighs_diacritics(self):
+        # The ä is a Swedish, Finnish and German letter, the postal code only matches Polish postal codes.
+        self.assertEqual(self.detector.from_signals('Jägera 5, 12-345'), 'pl')
+
+    def test_country_name_or_code_outweighs_postal_code_and_diacritics(self):
+        self.assertEqual(self.detector.from_signals('Danagränd 7, 17566 Järfälla, Finland'), 'fi')
+        self.assertEqual(self.detector.from_signals('Danagränd 7, 17566 Järfälla FI'), 'fi')
+        self.assertEqual(self.detector.from_signals('1 Main Road, 17566 Järfälla, United Kingdom'), 'en')
+
+    def test_short_codes_only_count_in_upper_case(self):
+        self.assertEqual(self.detector.from_signals('Hauptstraße 1, 10115 Berlin DE'), 'de')
+        self.assertEqual(self.detector.from_signals('Calle de'), 'es')
+
+    def test_diacritics_break_ties(self):
+        # Several countries have five digit postal codes, only German has the ß.
+        self.assertEqual(self.detector.from_signals('Groß 1, 10115'), 'de')
+        self.assertIsNone(self.detector.from_signals('Gross 1, 10115'))
+
+    def test_inconclusive(self):
+        self.assertIsNone(self.detector.from_signals('17566'))
+        self.assertIsNone(self.detector.from_signals(''))
+
+
+class DetectorTest(unittest.TestCase):
+    def test_hint_skips_detection(self):
+        detector = CountryDetector()
+        with mock.patch.object(detector, 'from_signals') as from_signals:
+            self.assertEqual(detector.detect('Danagränd 7, 17566 Järfälla', 'en'), 'en')
+        from_signals.assert_not_called()
+        self.assertEqual(len(detector._cache), 0)
+
+    def test_suffix(self):
+        detector = CountryDetector()
+        self.assertEqual(detector.suffix('Danagränd 7, 17566 Järfälla'), '00000 järfälla')
+        self.assertEqual(detector.suffix('Storgatan 3, 17123 JÄRFÄLLA'), '00000 järfälla')
+        self.assertEqual(CountryDetector(suffix_words=1).suffix('Danagränd 7'), '0')
+
+    def test_suffix_cache(self):
+        detector = CountryDetector(cache_size=2)
+        with mock.patch.object(detector, 'from_signals', wraps=detector.from_signals) as from_signals:
+            self.assertEqual(detector.detect('Danagränd 7, 17566 Järfälla'), 'sv')
+            self.assertEqual(detector.detect('Storgatan 3, 17123 Järfälla'), 'sv')
+            self.assertEqual(from_signals.call_count, 1)
+
+            detector.detect('Hauptstraße 1, 10115 Berlin')
+            detector.detect('Danagränd 9, 17566 Järfälla')
+            detector.detect('Rue de Rivoli 1, 75001 Paris')
+            self.assertEqual(from_signals.call_count, 3)
+            self.assertEqual(list(detector._cache), ['00000 järfälla', '00000 paris'])
+
+            detector.detect('Unter den Linden 5, 10117 Berlin')
+            self.assertEqual(from_signals.call_count, 4)
+
+    def test_langdetect_is_seeded(self):
+        detector = CountryDetector(seed=7)
+        modules, seeds = fake_langdetect('it')
+        with mock.patch.dict(sys.modules, modules):
+            self.assertEqual(detector.detect('17566'), 'it')
+            modules['langdetect'].DetectorFactory.seed = 3
+            self.assertEqual(detector.from_language('17566'), 'it')
+        self.assertEqual(seeds, [7, 7])
+
+    def test_langdetect_failure_returns_default(self):
+        detector = CountryDetector(default='sv')
+        modules, _ = fake_langdetect('it')
+        with mock.patch.dict(sys.modules, modules):
+            self.assertEqual(detector.detect(' '), 'sv')
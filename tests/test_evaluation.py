@@ -0,0 +1,141 @@
+import math
+import unittest
+from typing import Optional, Tuple
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus
+from src.address import load_country_config
+from src.address.component import AddressComponentType
+from src.address.country import CountryConfig
+from src.address.evaluation import VectorizedEvaluator
+from src.address.features import FEATURE_NAMES, TokenFeatures, token_features
+from src.address.heuristics import BOOL, COUNT, DISTANCE
+from src.address.parser import AddressParser
+
+COUNTRY_CODES = ('default', 'sv')
+
+
+def legacy_evaluate(
+        country_config: CountryConfig,
+        component_type: AddressComponentType,
+        token: str,
+        position: int
+) -> Optional[Tuple[bool, float]]:
+    """
+    Evaluate a token the way the heuristics were evaluated before they were compiled, one heuristic at a time from
+    the rules and multipliers of the country. Returns None when the evaluation is inconclusive.
+    """
+
+    features = dict(zip(FEATURE_NAMES, token_features(token, position)))
+    confidence, no_confidence = 1.0, 1.0
+    passed, failed = False, False
+    for definition in country_config.rules[component_type]:
+        multiplier = definition.multiplier
+        if definition.option is not None:
+            multiplier = country_config.multiplier(component_type.name, definition.option)
+        value = definition.value
+        if definition.kind == DISTANCE and value is None:
+            value = country_config.positions.get(component_type)
+        if multiplier is None or (definition.kind == DISTANCE and value is None):
+            continue
+        if definition.guard is not None and not features[definition.guard]:
+            continue
+
+        x = features[definition.feature]
+        if definition.kind == BOOL:
+            result, score = definition.operation(x, value), multiplier
+        elif definition.kind == COUNT:
+            result = x > 0
+            score = 1 + (x if value is None else math.sqrt(math.pow(x - value, 2))) * multiplier
+        else:
+            result, score = True, 1 / (math.sqrt(math.pow(x - value, 2)) * multiplier + 1)
+
+        if result:
+            confidence *= score
+            passed = True
+        else:
+            no_confidence *= score
+            failed = True
+
+    if no_confidence > confidence and failed:
+        return False, no_confidence - confidence
+    if confidence > no_confidence and passed:
+        return True, confidence - no_confidence
+    return None
+
+
+class EvaluationTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = generate_corpus(300, seed=3)
+
+    def tokens(self, parser: AddressParser):
+        for address in self.corpus:
+            normalized = parser.normalize_address(address)
+            yield normalized, parser.create_tokens(normalized)
+
+    def assert_same_evaluation(self, expected: Optional[Tuple[bool, float]], actual: Tuple[bool, float], message: str):
+        if expected is None:
+            self.assertEqual(actual, (False, 0.0), message)
+        else:
+            self.assertEqual(bool(actual[0]), expected[0], message)
+            self.assertAlmostEqual(float(actual[1]), expected[1], places=9, msg=message)
+
+
+class VectorizedEvaluatorTest(EvaluationTestCase):
+    def test_matches_legacy_heuristics(self):
+        for country_code in COUNTRY_CODES:
+            country_config = load_country_config(country_code)
+            parser = AddressParser(country_config)
+            for normalized, tokens in self.tokens(parser):
+                evaluations = parser.evaluate_address_components(tokens, normalized)
+                for row, token in enumerate(tokens):
+                    for component_type, rows in evaluations.items():
+                        message = f'{country_code} {token.text!r} {component_type.name}'
+                        expected = legacy_evaluate(country_config, component_type, token.text, token.index)
+                        self.assert_same_evaluation(expected, rows[row], message)
+
+    def test_stacked_addresses_match_single_addresses(self):
+        parser = AddressParser(load_country_config('sv'))
+        evaluator = VectorizedEvaluator.for_country(parser.country_config)
+        features = [TokenFeatures.from_tokens(tokens.texts(), tokens.indexes) for _, tokens in self.tokens(parser)]
+        results, confidences = evaluator.evaluate(TokenFeatures.concatenate(features))
+        self.assertEqual(len(results), sum(map(len, features)))
+        offset = 0
+        for single in features:
+            expected_results, expected_confidences = evaluator.evaluate(single)
+            np.testing.assert_array_equal(results[offset:offset + len(single)], expected_results)
+            np.testing.assert_array_equal(confidences[offset:offset + len(single)], expected_confidences)
+            offset += len(single)
+
+    def test_no_tokens(self):
+        evaluator = VectorizedEvaluator.for_country(load_country_config('sv'))
+        results, confidences = evaluator.evaluate(TokenFeatures.concatenate([]))
+        self.assertEqual(results.shape, (0, len(AddressComponentType)))
+        self.assertEqual(confidences.shape, (0, len(AddressComponentType)))
+
+    def test_no_definitions(self):
+        evaluator = VectorizedEvaluator(load_country_config('sv'), {})
+        results, confidences = evaluator.evaluate(TokenFeatures.from_tokens(['Storgatan', '3'], [0, 1]))
+        self.assertFalse(results.any())
+        self.assertFalse(confidences.any())
+
+    def test_for_country_is_cached(self):
+        country_config = load_country_config('sv')
+        self.assertIs(VectorizedEvaluator.for_country(country_config), VectorizedEvaluator.for_country(country_config))
+
+
+class TokenFeaturesTest(unittest.TestCase):
+    def test_matrix_matches_token_features(self):
+        tokens = ['Storgatan', '3', '12-14', '3/4', 'lgh1201', 'Ö', '']
+        features = TokenFeatures.from_tokens(tokens, range(len(tokens)))
+        self.assertEqual(features.matrix.shape, (len(tokens), len(FEATURE_NAMES)))
+        for row, token in enumerate(tokens):
+            self.assertEqual(features.matrix[row].tolist(), [float(f) for f in token_features(token, row)], token)
+
+    def test_column(self):
+        features = TokenFeatures.from_tokens(['Storgatan', '12'], [4, 5])
+        self.assertEqual(features.column('position').tolist(), [4.0, 5.0])
+        self.assertEqual(features.column('number').tolist(), [0.0, 12.0])
+        self.assertEqual(len(features), 2)
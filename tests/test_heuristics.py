@@ -0,0 +1,85 @@
+import operator
+import unittest
+
+from src.address import load_country_config
+from src.address.component import AddressComponentType
+from src.address.features import FEATURE_NAMES, token_features
+from src.address.heuristics import BOOL, COUNT, DISTANCE, HeuristicDefinition, HeuristicPlan
+from src.address.parser import AddressParser
+from src.exceptions import InconclusiveEvaluationException
+from tests.test_evaluation import COUNTRY_CODES, EvaluationTestCase, legacy_evaluate
+
+
+class HeuristicPlanTest(EvaluationTestCase):
+    def test_plans_match_legacy_heuristics(self):
+        for country_code in COUNTRY_CODES:
+            country_config = load_country_config(country_code)
+            plans = HeuristicPlan.for_country(country_config)
+            for _, tokens in self.tokens(AddressParser(country_config)):
+                for token in tokens:
+                    for component_type, plan in plans.items():
+                        message = f'{country_code} {token.text!r} {component_type.name}'
+                        try:
+                            actual = plan.evaluate(token_features(token.text, token.index))
+                        except InconclusiveEvaluationException:
+                            actual = (False, 0.0)
+                        expected = legacy_evaluate(country_config, component_type, token.text, token.index)
+                        self.assert_same_evaluation(expected, actual, message)
+
+    def test_for_country_is_cached(self):
+        country_config = load_country_config('sv')
+        plans = HeuristicPlan.for_country(country_config)
+        self.assertIs(HeuristicPlan.for_country(country_config), plans)
+        self.assertEqual(set(plans), set(AddressComponentType))
+
+
+class RecordsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.country_config = load_country_config('sv')
+        cls.component_type = AddressComponentType.STREET_NUMBER
+
+    def compile(self, *definitions: HeuristicDefinition) -> HeuristicPlan:
+        return HeuristicPlan.compile(self.component_type, definitions, self.country_config)
+
+    def test_unconfigured_options_are_skipped(self):
+        plan = self.compile(HeuristicDefinition(BOOL, 'no_such_option', 'is_digit', operator.eq, 1))
+        self.assertEqual(plan.records, ())
+        with self.assertRaises(InconclusiveEvaluationException):
+            plan.evaluate(token_features('3', 0))
+
+    def test_records(self):
+        plan = self.compile(
+            HeuristicDefinition(BOOL, None, 'is_digit', operator.eq, 1, multiplier=2),
+            HeuristicDefinition(COUNT, None, 'hyphen_count', value=1, multiplier=3, guard='is_alpha'),
+            HeuristicDefinition(DISTANCE, None, 'position', value=2, multiplier=4),
+        )
+        self.assertEqual(plan.records, (
+            (BOOL, FEATURE_NAMES.index('is_digit'), operator.eq, 1.0, 2.0, -1),
+            (COUNT, FEATURE_NAMES.index('hyphen_count'), None, 1.0, 3.0, FEATURE_NAMES.index('is_alpha')),
+            (DISTANCE, FEATURE_NAMES.index('position'), None, 2.0, 4.0, -1),
+        ))
+
+    def test_distance_defaults_to_configured_position(self):
+        plan = self.compile(HeuristicDefinition(DISTANCE, None, 'position', multiplier=1))
+        expected = self.country_config.positions.get(self.component_type)
+        self.assertEqual([record[3] for record in plan.records], [] if expected is None else [float(expected)])
+
+    def test_evaluate(self):
+        plan = self.compile(HeuristicDefinition(BOOL, None, 'is_digit', operator.eq, 1, multiplier=2))
+        self.assertEqual(plan.evaluate(token_features('3', 0)), (True, 1.0))
+        self.assertEqual(plan.evaluate(token_features('Storgatan', 0)), (False, 1.0))
+
+    def test_guard(self):
+        plan = self.compile(
+            HeuristicDefinition(BOOL, None, 'length', operator.gt, 3, multiplier=2, guard='is_digit'))
+        self.assertEqual(plan.evaluate(token_features('12345', 0)), (True, 1.0))
+        with self.assertRaises(InconclusiveEvaluationException):
+            plan.evaluate(token_features('Storgatan', 0))
+
+    def test_custom_definitions_are_not_cached(self):
+        definitions = {self.component_type: [HeuristicDefinition(BOOL, None, 'is_digit', operator.eq, 1, multiplier=2)]}
+        plans = HeuristicPlan.for_country(self.country_config, definitions)
+        self.assertIsNot(plans, HeuristicPlan.for_country(self.country_config))
+        self.assertEqual(len(plans[self.component_type].records), 1)
+        self.assertEqual(plans[AddressComponentType.CITY].records, ())
@@ -0,0 +1,57 @@
+import re
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).absolute().parent.parent
+
+# The longest accepted time to import the src package, in milliseconds.
+IMPORT_BUDGET_MS = 500
+
+# Modules that are only imported when they are used.
+DEFERRED_MODULES = ('spacy', 'langdetect', 'logging.handlers')
+
+IMPORT_TIME = re.compile(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+src$')
+
+
+def run_python(*arguments: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *arguments], cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_import_within_budget(self):
+        # The fastest of a few fresh interpreters, as reported by python -X importtime.
+        best = float('inf')
+        for _ in range(3):
+            completed = run_python('-X', 'importtime', '-c', 'import src')
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            for line in completed.stderr.splitlines():
+                match = IMPORT_TIME.match(line.strip())
+                if match:
+                    best = min(best, int(match.group(1)) / 1000)
+        self.assertLess(best, IMPORT_BUDGET_MS)
+
+    def test_deferred_modules_are_not_imported(self):
+        completed = run_python(
+            '-c',
+            'import sys\n'
+            'import src\n'
+            f'print(" ".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))'
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertEqual(completed.stdout.strip(), '')
+
+    def test_config_import_has_no_side_effects(self):
+        completed = run_python(
+            '-c',
+            'import os\n'
+            'import pathlib\n'
+            'def refuse(path, *args, **kwargs):\n'
+            '    raise AssertionError(f"{path} was created")\n'
+            'os.mkdir = os.makedirs = pathlib.Path.mkdir = refuse\n'
+            'import config'
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertEqual(completed.stdout, '')
+        self.assertEqual(completed.stderr, '')
@@ -0,0 +1,116 @@
+import io
+import json
+import unittest
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus
+from src.address.pool import ParserPool
+from src.instrumentation import (
+    COUNT_BUCKETS, Aggregates, Instrumentation, JsonLinesSink, PrometheusSink, StatsSink, instruments
+)
+
+
+class StatsSinkTest(unittest.TestCase):
+    def test_histograms_and_counters(self):
+        sink = StatsSink()
+        sink.observe('tokens_per_address', 3)
+        sink.observe_many('tokens_per_address', np.array([1, 600]))
+        sink.increment('cache_lookups_total', 2, (('cache', 'result'), ('result', 'hit')))
+        sink.increment('cache_lookups_total', 1, (('cache', 'result'), ('result', 'miss')))
+
+        histogram = sink.histograms[('tokens_per_address', ())]
+        self.assertEqual(histogram.bounds, COUNT_BUCKETS)
+        self.assertEqual((histogram.count, histogram.sum), (3, 604))
+        self.assertEqual((histogram.counts[0], histogram.counts[2], histogram.counts[-1]), (1, 1, 1))
+        self.assertAlmostEqual(sink.cache_hit_rate(), 2 / 3)
+
+    def test_drain_and_merge(self):
+        worker = StatsSink()
+        worker.observe('stage_seconds', 0.01, (('stage', 'parse_batch'),))
+        worker.increment('country_detections_total', 4, (('method', 'signals'),))
+        aggregates = worker.drain()
+        self.assertEqual((worker.histograms, worker.counters), ({}, {}))
+
+        main = StatsSink()
+        main.observe('stage_seconds', 0.02, (('stage', 'parse_batch'),))
+        main.merge(aggregates)
+        main.merge(aggregates)
+        histogram = main.histograms[('stage_seconds', (('stage', 'parse_batch'),))]
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.sum, 0.04)
+        self.assertEqual(main.counters[('country_detections_total', (('method', 'signals'),))], 8)
+
+
+class PrometheusSinkTest(unittest.TestCase):
+    def test_render(self):
+        sink = PrometheusSink()
+        sink.observe('batch_size', 5)
+        sink.increment('http_requests_total', 1, (('path', '/parse'), ('status', '200')))
+        text = sink.render()
+        self.assertIn('# TYPE buache_batch_size histogram', text)
+        self.assertIn('buache_batch_size_bucket{le="4.0"} 0', text)
+        self.assertIn('buache_batch_size_bucket{le="8.0"} 1', text)
+        self.assertIn('buache_batch_size_bucket{le="+Inf"} 1', text)
+        self.assertIn('buache_batch_size_count 1', text)
+        self.assertIn('buache_http_requests_total{path="/parse",status="200"} 1', text)
+
+
+class JsonLinesSinkTest(unittest.TestCase):
+    def test_lines(self):
+        stream = io.StringIO()
+        sink = JsonLinesSink(stream)
+        sink.observe('batch_size', 5)
+        sink.observe_many('tokens_per_address', np.array([1, 2]))
+        sink.increment('http_requests_total', 2, (('path', '/parse'),))
+        sink.merge(Aggregates({('batch_size', ()): ([0, 1] + [0] * 9, 2.0, 1)}, {('cache_lookups_total', ()): 3}))
+        sink.close()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['type'] for r in records], ['observe', 'observe', 'increment', 'histogram', 'increment'])
+        self.assertEqual(records[1]['values'], [1, 2])
+        self.assertEqual(records[2]['labels'], {'path': '/parse'})
+        self.assertEqual((records[3]['bounds'], records[3]['count']), (list(COUNT_BUCKETS), 1))
+        self.assertEqual(records[4]['value'], 3)
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_disabled_without_sinks(self):
+        instrumentation = Instrumentation()
+        self.assertFalse(instrumentation.enabled)
+        with instrumentation.stage('parse_batch'):
+            pass
+
+        sink = instrumentation.attach(StatsSink())
+        self.assertTrue(instrumentation.enabled)
+        with instrumentation.stage('parse_batch'):
+            pass
+        instrumentation.increment('cache_lookups_total', 1, {'result': 'hit', 'cache': 'result'})
+        instrumentation.detach(sink)
+        self.assertFalse(instrumentation.enabled)
+
+        self.assertEqual(sorted(dict(labels)['clock'] for name, labels in sink.histograms), ['cpu', 'wall'])
+        self.assertEqual(list(sink.counters), [('cache_lookups_total', (('cache', 'result'), ('result', 'hit')))])
+
+
+class WorkerMetricsTest(unittest.TestCase):
+    def test_workers_send_their_measurements_back(self):
+        corpus = generate_corpus(300, seed=2)
+        sink = instruments.attach(StatsSink())
+        try:
+            with ParserPool(2, ('sv',), metrics=True) as pool:
+                self.assertEqual(sum(1 for _ in pool.parse_many(corpus, 'sv', chunk_size=50)), len(corpus))
+        finally:
+            instruments.detach(sink)
+
+        stages = {dict(labels)['stage'] for name, labels in sink.histograms if name == 'stage_seconds'}
+        self.assertIn('parse_batch', stages)
+        tokens = sink.histograms[('tokens_per_address', ())]
+        self.assertEqual(tokens.count, len(corpus))
+        detections = sink.counters[('country_detections_total', (('method', 'hint'),))]
+        self.assertEqual(detections, len(corpus))
+
+    def test_workers_without_metrics(self):
+        with ParserPool(1, ('sv',), metrics=False) as pool:
+            self.assertFalse(pool.metrics)
+            self.assertEqual(len(pool.submit(['Danagränd 7, 17566 Järfälla'], 'sv').result()), 1)
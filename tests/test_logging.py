@@ -0,0 +1,94 @@
+import atexit
+import logging
+import unittest
+
+import config
+from config.logging.formatter import BuacheFormatter
+
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.NOTSET)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+class Counted:
+    """
+    A message argument that counts how often it is formatted.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self) -> str:
+        self.count += 1
+        return 'counted'
+
+
+class LevelMethodTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.Logger('tests.logging')
+        self.recorder = Recorder()
+        self.logger.addHandler(self.recorder)
+
+    def test_levels(self):
+        self.assertEqual((logging.VERBOSE, logging.DEBUGX, logging.TRACE), (15, 5, 1))
+        self.assertEqual(logging.getLevelName(logging.DEBUGX), 'DEBUGX')
+
+    def test_each_method_logs_at_its_own_level(self):
+        self.logger.setLevel(logging.TRACE)
+        self.logger.verbose('verbose')
+        self.logger.debugx('debugx')
+        self.logger.trace('trace')
+        self.assertEqual([(r.levelno, r.getMessage()) for r in self.recorder.records],
+                         [(logging.VERBOSE, 'verbose'), (logging.DEBUGX, 'debugx'), (logging.TRACE, 'trace')])
+
+    def test_disabled_levels_do_not_format(self):
+        self.logger.setLevel(logging.DEBUG)
+        counted = Counted()
+        self.logger.debugx('%s', counted)
+        self.logger.trace('%s', counted)
+        self.assertEqual((self.recorder.records, counted.count), ([], 0))
+
+        self.logger.verbose('%s %d', counted, 3)
+        self.assertEqual(self.recorder.records[0].getMessage(), 'counted 3')
+        self.assertEqual(counted.count, 1)
+
+    def test_records_report_the_caller(self):
+        self.logger.setLevel(logging.TRACE)
+        self.logger.verbose('caller')
+        record = self.recorder.records[0]
+        self.assertEqual((record.funcName, record.filename), ('test_records_report_the_caller', 'test_logging.py'))
+
+
+class FormatterTest(unittest.TestCase):
+    def test_one_formatter_per_level(self):
+        formatter = BuacheFormatter()
+        self.assertEqual(set(formatter.formatters), set(BuacheFormatter.FORMATS))
+        record = logging.LogRecord('tests', logging.DEBUGX, __file__, 1, 'message %s', ('value',), None)
+        text = formatter.format(record)
+        self.assertTrue(text.startswith(BuacheFormatter.level2))
+        self.assertIn('message value', text)
+
+    def test_unknown_level(self):
+        record = logging.LogRecord('tests', 42, __file__, 1, 'message', (), None)
+        self.assertIn('message', BuacheFormatter().format(record))
+
+
+class QueueHandlersTest(unittest.TestCase):
+    def test_records_reach_the_original_handlers(self):
+        logger = logging.Logger('tests.queue')
+        recorder = Recorder()
+        logger.addHandler(recorder)
+
+        listener = config.queue_handlers(logger)
+        try:
+            self.assertEqual([type(h).__name__ for h in logger.handlers], ['QueueHandler'])
+            logger.warning('queued %d', 1)
+        finally:
+            listener.stop()
+            atexit.unregister(listener.stop)
+        self.assertEqual([r.getMessage() for r in recorder.records], ['queued 1'])
@@ -0,0 +1,118 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+from typing import NamedTuple
+from unittest import mock
+
+from src.address.component import AddressComponentType
+from src.address.ml_parser import MLAddressParser
+from src.app import Application
+from src.cli import main
+
+
+class Entity(NamedTuple):
+    label_: str
+    text: str
+    start_char: int
+
+
+class Doc:
+    """
+    A parsed document of the stand-in model: numbers are CARDINAL entities, the last word is a GPE entity and other
+    words are FAC entities.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.ents = []
+        start = 0
+        words = text.split()
+        for index, word in enumerate(words):
+            start = text.index(word, start)
+            label = 'CARDINAL' if word.isdigit() else 'GPE' if index == len(words) - 1 else 'FAC'
+            self.ents.append(Entity(label, word, start))
+            start += len(word)
+
+
+class Language:
+    """
+    Stands in for a spaCy model, recording the arguments of every call of pipe.
+    """
+
+    def __init__(self):
+        self.pipes = []
+
+    def __call__(self, text: str) -> Doc:
+        return Doc(text)
+
+    def pipe(self, texts, as_tuples: bool = False, batch_size: int = 1000, n_process: int = 1):
+        self.pipes.append((batch_size, n_process))
+        for item in texts:
+            if as_tuples:
+                yield Doc(item[0]), item[1]
+            else:
+                yield Doc(item)
+
+
+def types_and_values(components):
+    return [(c.component_type, c.component_value, c.position) for c in components]
+
+
+class MLAddressParserTest(unittest.TestCase):
+    def setUp(self):
+        self.nlp = Language()
+        patcher = mock.patch('src.address.ml_parser.load_model', return_value=self.nlp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_components(self):
+        components = MLAddressParser().parse_address('Danagränd 7 17566 Järfälla')
+        self.assertEqual(types_and_values(components), [
+            (AddressComponentType.STREET_NAME, 'Danagränd', 0),
+            (AddressComponentType.STREET_NUMBER, '7', 1),
+            (AddressComponentType.POSTAL_CODE, '17566', 2),
+            (AddressComponentType.CITY, 'Järfälla', 3),
+        ])
+        country = MLAddressParser().parse_address('Storgatan Sweden')[-1]
+        self.assertEqual(country.component_type, AddressComponentType.COUNTRY)
+
+    def test_parse_batch_uses_the_settings_of_the_parser(self):
+        parser = MLAddressParser(batch_size=32, n_process=2)
+        addresses = ['Danagränd 7 Järfälla', 'Storgatan 3 Stockholm']
+        results = parser.parse_batch(addresses)
+        self.assertEqual([types_and_values(r) for r in results],
+                         [types_and_values(parser.parse_address(a)) for a in addresses])
+        self.assertEqual(self.nlp.pipes, [(32, 2)])
+
+        list(parser.parse_many(addresses, batch_size=8, n_process=3))
+        self.assertEqual(self.nlp.pipes[-1], (8, 3))
+
+    def test_application_streams_all_addresses_through_one_pipe(self):
+        app = Application(mode='PRODUCTION')
+        addresses = ['Danagränd 7 17566 Järfälla', 'Storgatan 3 11122 Stockholm', 'Kungsgatan 1 Uppsala']
+        results = list(app.parse_many(iter(addresses), 'sv', batch_size=2, use_ml=True, n_process=4))
+        self.assertEqual(self.nlp.pipes, [(2, 4)])
+        self.assertEqual([string for string, _, _ in results], addresses)
+        self.assertEqual({code for _, code, _ in results}, {'sv'})
+        parser = app.get_parser('sv', use_ml=True)
+        self.assertEqual([types_and_values(c) for _, _, c in results],
+                         [types_and_values(parser.parse_address(a)) for a in addresses])
+
+    def test_application_decodes_ml_results(self):
+        app = Application(mode='PRODUCTION')
+        results = list(app.parse_many(['Danagränd 7 17566 Järfälla'], 'sv', use_ml=True, decode=True, n_process=2))
+        self.assertEqual(self.nlp.pipes, [(1000, 2)])
+        types = [c.component_type for c in results[0][2]]
+        self.assertEqual(len(types), len(set(types)))
+
+    def test_command_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = Path(directory) / 'addresses.txt', Path(directory) / 'components.jsonl'
+            source.write_text('Danagränd 7 17566 Järfälla\nStorgatan 3 Stockholm\n', encoding='utf-8')
+            with mock.patch('config.setup_logging'), redirect_stderr(io.StringIO()):
+                main(['parse', '-i', str(source), '-o', str(target), '--country', 'sv', '--ml', '--ml-processes', '2',
+                      '--batch-size', '16'])
+            self.assertEqual(len(target.read_text(encoding='utf-8').splitlines()), 2)
+        self.assertEqual(self.nlp.pipes, [(16, 2)])
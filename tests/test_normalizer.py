@@ -0,0 +1,48 @@
+import unittest
+
+from src.address.country import load_country_config
+from src.address.normalizer import AbbreviationNormalizer
+
+
+class AbbreviationNormalizerTest(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = AbbreviationNormalizer({
+            'GATAN': ('g', 'g.', 'gt'),
+            'VÄGEN': ('v', 'v.'),
+            'LÄGENHET': ('lgh',),
+        })
+
+    def test_replaces_abbreviations(self):
+        self.assertEqual(self.normalizer.normalize('Storg. 3 lgh 1201'), 'Storg. 3 LÄGENHET 1201')
+        self.assertEqual(self.normalizer.normalize('Stor g. 3'), 'Stor GATAN 3')
+
+    def test_longest_abbreviation_wins(self):
+        self.assertEqual(self.normalizer.normalize('Kungs gt 1'), 'Kungs GATAN 1')
+        self.assertEqual(self.normalizer.normalize('Kungs g. 1'), 'Kungs GATAN 1')
+
+    def test_only_whole_words_match(self):
+        self.assertEqual(self.normalizer.normalize('Gvägen 7 gv'), 'Gvägen 7 gv')
+
+    def test_case_is_ignored(self):
+        self.assertEqual(self.normalizer.normalize('Ring V. 2'), 'Ring VÄGEN 2')
+
+    def test_without_abbreviations(self):
+        normalizer = AbbreviationNormalizer({})
+        self.assertIsNone(normalizer.pattern)
+        self.assertEqual(normalizer.normalize('Storgatan 3'), 'Storgatan 3')
+
+    def test_compiled_pattern_is_reused(self):
+        abbreviations = {'GATAN': ('g', 'g.', 'gt')}
+        pattern = AbbreviationNormalizer(abbreviations).pattern.pattern
+        normalizer = AbbreviationNormalizer(abbreviations, pattern=pattern)
+        self.assertEqual(normalizer.pattern.pattern, pattern)
+        self.assertEqual(normalizer.normalize('Stor gt 3'), 'Stor GATAN 3')
+
+    def test_for_country_is_cached(self):
+        country_config = load_country_config('sv')
+        self.assertIs(AbbreviationNormalizer.for_country(country_config),
+                      AbbreviationNormalizer.for_country(country_config))
+
+    def test_whitespace_is_collapsed(self):
+        self.assertEqual(self.normalizer.normalize(' Storgatan \t 3  lgh\n1201 '), 'Storgatan 3 LÄGENHET 1201')
+        self.assertEqual(AbbreviationNormalizer({}).normalize('Storgatan\t\t3'), 'Storgatan 3')
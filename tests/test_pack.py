@@ -0,0 +1,103 @@
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from src.address import country, pack
+from src.address.component import AddressComponentType
+from src.address.country import compile_country_config, config_files, load_country_config
+from src.address.features import FEATURE_NAMES
+from src.address.pack import CountryPack, plan_records
+from src.address.rules import KINDS, RuleSet, generate_source
+from src.exceptions import ConfigurationError
+
+# The tables a pack stores indexes into, by pack version. A pack written with other tables reads back other rules,
+# so when one of them changes, increase pack.VERSION and add the new tables here.
+POSITIONAL_TABLES = {
+    1: {
+        'component_types': {
+            'STREET_NAME': 1, 'STREET_NUMBER': 2, 'BUILDING': 3, 'ENTRANCE': 4, 'APARTMENT': 5, 'CO': 6, 'BLOCK': 7,
+            'POSTAL_CODE': 8, 'CITY': 9, 'STATE': 10, 'COUNTRY': 11
+        },
+        'kinds': ('bool', 'count', 'distance'),
+        'operators': ('==', '!=', '<', '<=', '>', '>='),
+        'features': ('position', 'length', 'is_digit', 'is_alpha', 'first_is_upper', 'first_is_alpha', 'last_is_alpha',
+                     'starts_with_lgh', 'number', 'slash_count', 'hyphen_count', 'alpha_count'),
+    }
+}
+
+
+class CountryPackTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'sv.pack')
+        CountryPack.build('sv', cls.path).close()
+        cls.compiled = compile_country_config('sv', config_files('sv'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def open(self, path: str = None, **arguments) -> CountryPack:
+        country_pack = CountryPack(path or self.path, **arguments)
+        self.addCleanup(country_pack.close)
+        return country_pack
+
+    def test_round_trip(self):
+        country_pack = self.open()
+        snapshot = country_pack.country_config
+        self.assertEqual(country_pack.country_code, 'sv')
+        self.assertEqual(country_pack.source_fingerprint, self.compiled.fingerprint)
+        self.assertEqual(snapshot.fingerprint, country_pack.digest)
+        for field in snapshot._fields:
+            if field != 'fingerprint':
+                self.assertEqual(getattr(snapshot, field), getattr(self.compiled, field), field)
+        self.assertEqual(generate_source(plan_records(snapshot)), generate_source(plan_records(self.compiled)))
+
+    def test_stale_packs_are_refused(self):
+        with mock.patch.object(pack, 'config_fingerprint', return_value='changed'):
+            with self.assertRaisesRegex(ConfigurationError, 'build it again'), self.assertLogs(pack.__name__, 'ERROR'):
+                CountryPack(self.path)
+            country_pack = self.open(check_source=False)
+            self.assertEqual(country_pack.source_fingerprint, self.compiled.fingerprint)
+
+            # Workers do not compare the pack they are sent with the configuration files again.
+            self.assertEqual(pickle.loads(pickle.dumps(country_pack)).digest, country_pack.digest)
+
+    def test_rules_are_loaded_without_compiling(self):
+        with mock.patch.object(RuleSet, 'compile', side_effect=AssertionError('compiled')):
+            country_pack = self.open()
+        self.assertEqual(country_pack.rule_set.key, country_pack.digest)
+
+    def test_rules_of_another_python_are_compiled_again(self):
+        path = os.path.join(self.directory.name, 'other.pack')
+        with mock.patch.object(sys.implementation, 'cache_tag', 'other-99'):
+            CountryPack.build('sv', path).close()
+
+        with mock.patch.object(RuleSet, 'compile', wraps=RuleSet.compile) as compile_rules:
+            country_pack = self.open(path)
+        self.assertEqual(country_pack.text('rules.python'), 'other-99')
+        compile_rules.assert_called_once()
+        self.assertEqual(country_pack.rule_set.key, country_pack.digest)
+        stored = RuleSet(marshal.loads(country_pack.sections.view('rules.code'))).functions
+        for ct, function in country_pack.rule_set.functions.items():
+            self.assertEqual(function.__code__.co_code, stored[ct].__code__.co_code, ct)
+
+    def test_install(self):
+        country_pack = self.open()
+        with mock.patch.dict(country._installed):
+            country_pack.install()
+            self.assertIs(load_country_config('sv'), country_pack.country_config)
+        self.assertIsNot(load_country_config('sv'), country_pack.country_config)
+
+    def test_positional_tables(self):
+        self.assertEqual({
+            'component_types': {ct.name: ct.value for ct in AddressComponentType},
+            'kinds': KINDS,
+            'operators': pack.OPERATOR_SYMBOLS,
+            'features': FEATURE_NAMES,
+        }, POSITIONAL_TABLES[pack.VERSION])
@@ -0,0 +1,128 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from src.address.component import AddressComponent, AddressComponentType
+from src.address.database import AddressDatabase, AddressMatcher
+from src.address.phonetic import PhoneticEncoder, PhoneticIndex, double_metaphone, swedish_phonetic
+from src.address.spelling import VOCABULARIES, SpellingCorrector
+
+T = AddressComponentType
+
+ROWS = [
+    {'street': 'Oxbacksgatan', 'number': '3', 'postal_code': '724 61', 'city': 'Västerås'},
+    {'street': 'Sjöbergsgatan', 'number': '1', 'postal_code': '724 62', 'city': 'Västerås'},
+    {'street': 'Danagränd', 'number': '7', 'postal_code': '175 66', 'city': 'Järfälla'},
+    {'street': 'Danagränd', 'number': '9', 'postal_code': '175 66', 'city': 'Järfälla'},
+    {'street': 'Tjärnvägen', 'number': '2', 'postal_code': '175 67', 'city': 'Järfälla'},
+]
+
+
+class SwedishPhoneticTest(unittest.TestCase):
+    def assert_same_key(self, *words: str):
+        encoder = PhoneticEncoder('sv')
+        self.assertEqual(len({encoder.encode_phonetic(word) for word in words}), 1, words)
+
+    def test_vowels_that_are_spelled_differently(self):
+        self.assert_same_key('Västerås', 'Vesterås', 'Vesteros', 'VÄSTERÅS')
+        self.assert_same_key('Järfälla', 'Jerfälla', 'Jerfela')
+
+    def test_sje_and_tje_sounds(self):
+        self.assert_same_key('Sjöberg', 'Skjöberg', 'Schöberg')
+        self.assert_same_key('Tjärna', 'Kjärna')
+
+    def test_consonants_that_are_spelled_differently(self):
+        self.assert_same_key('Stockholm', 'Stokholm')
+        self.assert_same_key('Qvist', 'Kvist')
+        self.assert_same_key('Uppsala', 'Upsala')
+
+    def test_different_names_have_different_keys(self):
+        encoder = PhoneticEncoder('sv')
+        self.assertNotEqual(encoder.encode_phonetic('Västerås'), encoder.encode_phonetic('Stockholm'))
+        self.assertNotEqual(encoder.encode_phonetic('Danagränd'), encoder.encode_phonetic('Dalagränd'))
+
+    def test_alternate_keys(self):
+        self.assertEqual(PhoneticEncoder('sv').encode_keys('Göteborg'), ('JÖTEBORG', 'GÖTEBORG'))
+        self.assertEqual(PhoneticEncoder('sv').encode_keys('Västerås'), ('VESTEROS',))
+
+    def test_max_length(self):
+        self.assertEqual(swedish_phonetic('Västerås', 4), ('VEST', 'VEST'))
+
+    def test_words_are_encoded_separately(self):
+        self.assertEqual(PhoneticEncoder('sv').encode_phonetic('Upplands  Väsby!'), 'UPLANDS VESBY')
+        self.assertEqual(PhoneticEncoder('sv').encode_keys('- !'), ('',))
+
+
+class DoubleMetaphoneTest(unittest.TestCase):
+    def test_shared_keys(self):
+        for first, second in (('Smith', 'Schmidt'), ('Snyder', 'Schneider'), ('Thomas', 'Tomas'),
+                              ('Catherine', 'Kathryn'), ('Philip', 'Filip'), ('Knight', 'Night')):
+            self.assertTrue(set(double_metaphone(first)) & set(double_metaphone(second)), (first, second))
+
+    def test_keys(self):
+        self.assertEqual(double_metaphone('Smith'), ('SM0', 'XMT'))
+        self.assertEqual(double_metaphone('Schmidt'), ('XMT', 'SMT'))
+        self.assertEqual(double_metaphone('School'), ('SKL', 'SKL'))
+        self.assertEqual(double_metaphone('Xavier'), ('SFR', 'SFR'))
+
+    def test_other_languages_use_double_metaphone(self):
+        self.assertEqual(PhoneticEncoder('fr').encode_keys('Smith'), PhoneticEncoder('en').encode_keys('Smith'))
+
+    def test_encode_many(self):
+        encoder = PhoneticEncoder('en')
+        self.assertEqual(encoder.encode_many(['Smith', 'Schmidt', 'Smith']),
+                         [encoder.encode_keys('Smith'), encoder.encode_keys('Schmidt'), encoder.encode_keys('Smith')])
+
+
+class PhoneticIndexTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.database = AddressDatabase.compile(ROWS, os.path.join(self.directory, 'register.db'))
+        self.addCleanup(self.database.close)
+        self.index = PhoneticIndex.from_database(self.database, os.path.join(self.directory, 'sv.phon'))
+        self.addCleanup(self.index.close)
+
+    def test_vocabularies_of_the_database(self):
+        self.assertEqual(self.database.vocabularies(VOCABULARIES), {
+            T.STREET_NAME: [('Danagränd', 2), ('Oxbacksgatan', 1), ('Sjöbergsgatan', 1), ('Tjärnvägen', 1)],
+            T.CITY: [('Järfälla', 3), ('Västerås', 2)],
+        })
+
+    def test_from_database_matches_compile(self):
+        path = os.path.join(self.directory, 'compiled.phon')
+        index = PhoneticIndex.compile(self.database.vocabularies(VOCABULARIES), path)
+        self.addCleanup(index.close)
+        self.assertEqual(index.sections.digest, self.index.sections.digest)
+
+        spelling = SpellingCorrector.from_database(self.database, os.path.join(self.directory, 'sv.spell'), 'sv')
+        self.addCleanup(spelling.close)
+        self.assertEqual(spelling.lookup(T.CITY, 'Jarfalla'), ('Järfälla', 2))
+
+    def test_match_phonetic(self):
+        self.assertEqual(self.index.match_phonetic(T.CITY, 'Vesterås'), 'Västerås')
+        self.assertEqual(self.index.match_phonetic(T.STREET_NAME, 'Schöbergsgatan'), 'Sjöbergsgatan')
+        self.assertEqual(self.index.match_phonetic(T.STREET_NAME, 'Kjärnvägen'), 'Tjärnvägen')
+        self.assertIsNone(self.index.match_phonetic(T.CITY, 'Stockholm'))
+        self.assertIsNone(self.index.match_phonetic(T.POSTAL_CODE, '72461'))
+        self.assertEqual(self.index.candidates(T.POSTAL_CODE, '72461'), [])
+
+    def test_candidates_are_ordered_by_count(self):
+        path = os.path.join(self.directory, 'en.phon')
+        index = PhoneticIndex.compile({T.STREET_NAME: [('Smith Street', 1), ('Schmidt Street', 4)]}, path, 'en')
+        self.addCleanup(index.close)
+        self.assertEqual(index.candidates(T.STREET_NAME, 'Smyth Street'), ['Schmidt Street', 'Smith Street'])
+        self.assertEqual(index.candidates(T.STREET_NAME, 'Smyth Street', limit=1), ['Schmidt Street'])
+
+    def test_pickle_reopens_the_index(self):
+        index = pickle.loads(pickle.dumps(self.index))
+        self.addCleanup(index.close)
+        self.assertEqual(index.encoder.language, 'sv')
+        self.assertEqual(index.match_phonetic(T.CITY, 'Vesterås'), 'Västerås')
+
+    def test_matcher_falls_back_to_the_phonetic_index(self):
+        matcher = AddressMatcher(self.database, phonetic=self.index, phonetic_score=0.8)
+        matched = matcher.match_address([AddressComponent(T.CITY, 'Vesterås', 0.5, 3)])
+        self.assertEqual([(c.component_value, c.confidence) for c in matched], [('Västerås', 0.4)])
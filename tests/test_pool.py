@@ -0,0 +1,48 @@
+import unittest
+from itertools import islice
+
+from benchmarks.corpus import generate_corpus
+from src.address.component import compact
+from src.address.pool import ParserPool, parse_chunk, parse_chunk_compact
+from src.app import Application
+
+
+def results(app: Application, corpus, country_code: str = None):
+    return [
+        (string, code, compact(components))
+        for string, code, components in app.parse_many(corpus, country_code, batch_size=250)
+    ]
+
+
+class ParserPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = generate_corpus(2000, seed=5, duplicate_share=0.2)
+
+    def test_pool_matches_serial_parsing(self):
+        serial = Application(mode='PRODUCTION')
+        pooled = Application(mode='PRODUCTION', workers=2)
+        try:
+            for country_code in ('sv', None):
+                self.assertEqual(results(pooled, self.corpus, country_code), results(serial, self.corpus, country_code))
+        finally:
+            pooled.close()
+
+    def test_input_is_read_lazily(self):
+        consumed = []
+
+        def strings():
+            for string in self.corpus:
+                consumed.append(string)
+                yield string
+
+        with ParserPool(1, ('sv',), max_pending=2) as pool:
+            first = list(islice(pool.parse_many(strings(), 'sv', chunk_size=100), 1))
+        self.assertEqual(first[0][0], self.corpus[0])
+        self.assertLessEqual(len(consumed), 3 * 100)
+
+    def test_compact_chunks_match_chunks(self):
+        chunk = self.corpus[:300]
+        expected = [(code, compact(components)) for code, components in parse_chunk(chunk)]
+        self.assertEqual(parse_chunk_compact(chunk), expected)
+        self.assertEqual(parse_chunk_compact([]), [])
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import config
+from src.address import load_country_config
+from src.address.pack import plan_records
+from src.address.rules import RuleSet, parse_line
+from src.exceptions import RuleException
+
+
+class ParseLineTest(unittest.TestCase):
+    def test_fields(self):
+        self.assertEqual(parse_line('bool number > 0 if is_digit'),
+                         {'kind': 'bool', 'feature': 'number', 'operator': '>', 'criteria': 0, 'guard': 'is_digit'})
+        self.assertEqual(parse_line('count length >= 2.5 * 0.5'),
+                         {'kind': 'count', 'feature': 'length', 'operator': '>=', 'criteria': 2.5, 'multiplier': 0.5})
+        self.assertEqual(parse_line('bool is_digit'), {'kind': 'bool', 'feature': 'is_digit'})
+
+    def test_bad_lines(self):
+        for line in ('bool', 'bool number > 0 1'):
+            with self.assertRaises(RuleException):
+                parse_line(line)
+
+
+class RuleSetCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.folder = Path(directory.name)
+        self.country_config = load_country_config('sv')
+        self.records = plan_records(self.country_config)
+        self.key = RuleSet.artifact_key(self.country_config)
+
+    def test_nothing_is_written_without_a_folder(self):
+        with mock.patch.object(config, 'rules_cache_folder', None), \
+                mock.patch.object(RuleSet, 'save', side_effect=AssertionError('saved')):
+            rule_set = RuleSet.for_country(self.country_config, self.records)
+        self.assertEqual(rule_set.key, self.key)
+        self.assertEqual(set(rule_set.functions), set(self.records))
+
+    def test_compiled_rules_are_saved_and_loaded(self):
+        saved = RuleSet.for_country(self.country_config, self.records, self.folder)
+        self.assertEqual(os.listdir(self.folder), ['sv.rules'])
+
+        with mock.patch.object(RuleSet, 'compile', side_effect=AssertionError('compiled')):
+            loaded = RuleSet.for_country(self.country_config, self.records, self.folder)
+        self.assertEqual((loaded.key, loaded.code), (saved.key, saved.code))
+
+    def test_configured_folder(self):
+        with mock.patch.object(config, 'rules_cache_folder', self.folder):
+            RuleSet.for_country(self.country_config, self.records)
+        self.assertTrue((self.folder / 'sv.rules').is_file())
+
+    def test_rules_of_another_configuration_are_compiled_again(self):
+        RuleSet.compile(self.records, 'other').save(self.folder / 'sv.rules')
+        self.assertIsNone(RuleSet.load(self.folder / 'sv.rules', self.key))
+
+        rule_set = RuleSet.for_country(self.country_config, self.records, self.folder)
+        self.assertEqual(rule_set.key, self.key)
+        self.assertEqual(RuleSet.load(self.folder / 'sv.rules', self.key).code, rule_set.code)
+
+    def test_unreadable_files_are_ignored(self):
+        (self.folder / 'sv.rules').write_bytes(b'not marshalled')
+        self.assertIsNone(RuleSet.load(self.folder / 'sv.rules', self.key))
+        self.assertIsNone(RuleSet.load(self.folder / 'missing.rules', self.key))
+
+    def test_failing_to_save_is_not_fatal(self):
+        blocked = self.folder / 'file'
+        blocked.write_text('')
+        with self.assertLogs('src.address.rules', 'WARNING'):
+            rule_set = RuleSet.for_country(self.country_config, self.records, blocked)
+        self.assertEqual(rule_set.key, self.key)
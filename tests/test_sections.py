@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.address.sections import (
+    HEADER, PostingLists, SectionFile, StringTable, pack_postings, pack_strings, stable_hash, write_sections
+)
+from src.exceptions import ConfigurationError
+
+MAGIC = b'BUACHETS'
+
+
+class SectionFileTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.sections')
+
+    def open(self, *arguments) -> SectionFile:
+        sections = SectionFile(self.path, *arguments)
+        self.addCleanup(sections.close)
+        return sections
+
+    def test_round_trip(self):
+        numbers = np.arange(5, dtype='<u4')
+        weights = np.array([0.5, 1.5], dtype='<f8')
+        digest = write_sections(self.path, MAGIC, {'numbers': numbers, 'blob': b'abc', 'weights': weights}, 2)
+        sections = self.open(MAGIC, 2)
+        self.assertEqual(list(sections), ['numbers', 'blob', 'weights'])
+        self.assertIn('blob', sections)
+        self.assertEqual((sections.version, sections.digest), (2, digest))
+        self.assertEqual(sections.array('numbers').tolist(), numbers.tolist())
+        self.assertEqual(bytes(sections.array('blob')), b'abc')
+        self.assertEqual(sections.array('weights').tolist(), [0.5, 1.5])
+        self.assertEqual(sections.view('numbers').tolist(), numbers.tolist())
+
+    def test_sections_are_aligned(self):
+        write_sections(self.path, MAGIC, {'a': b'x', 'b': np.arange(3, dtype='<u8')})
+        sections = self.open(MAGIC)
+        self.assertTrue(all(offset % 8 == 0 for _, offset, _ in sections.entries.values()))
+        self.assertEqual(sections.array('b').tolist(), [0, 1, 2])
+
+    def test_digest_depends_on_the_data(self):
+        first = write_sections(self.path, MAGIC, {'a': b'x'})
+        self.assertEqual(write_sections(self.path, MAGIC, {'a': b'x'}), first)
+        self.assertNotEqual(write_sections(self.path, MAGIC, {'a': b'y'}), first)
+        self.assertNotEqual(write_sections(self.path, MAGIC, {'b': b'x'}), first)
+
+    def test_no_temporary_file_is_left(self):
+        write_sections(self.path, MAGIC, {'a': b'x'})
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['test.sections'])
+
+    def test_wrong_magic(self):
+        write_sections(self.path, b'BUACHEDB', {'a': b'x'})
+        with self.assertRaisesRegex(ConfigurationError, 'is not a BUACHETS file'):
+            SectionFile(self.path, MAGIC)
+
+    def test_wrong_version(self):
+        write_sections(self.path, MAGIC, {'a': b'x'}, 2)
+        with self.assertRaisesRegex(ConfigurationError, 'format version 2, not 1'):
+            SectionFile(self.path, MAGIC, 1)
+
+    def test_empty_and_short_files(self):
+        for content in (b'', MAGIC):
+            with open(self.path, 'wb') as output:
+                output.write(content)
+            with self.assertRaises(ConfigurationError):
+                SectionFile(self.path, MAGIC)
+
+    def test_truncated_file(self):
+        write_sections(self.path, MAGIC, {'a': np.arange(100, dtype='<u8')})
+        with open(self.path, 'r+b') as output:
+            output.truncate(HEADER.size + 100)
+        with self.assertRaisesRegex(ConfigurationError, 'truncated'):
+            SectionFile(self.path, MAGIC)
+
+    def test_missing_sections(self):
+        write_sections(self.path, MAGIC, {'a': b'x'})
+        sections = self.open(MAGIC)
+        with self.assertRaisesRegex(ConfigurationError, 'no section "b"'):
+            sections.array('b')
+        with self.assertRaisesRegex(ConfigurationError, 'no section "b"'):
+            sections.view('b')
+
+
+class StringTableTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'strings.sections')
+        self.keys = sorted(['sundbyberg', 'sundsvall', 'stockholm', 'västerås', 'växjö', 'å'],
+                           key=lambda key: key.encode('utf-8'))
+        offsets, data = pack_strings(self.keys)
+        hashes, posting_offsets, postings = pack_postings([stable_hash('a'), stable_hash('b'), stable_hash('a')],
+                                                          [3, 1, 2])
+        write_sections(path, MAGIC, {
+            'keys.offsets': offsets, 'keys.data': data,
+            'empty.offsets': pack_strings([])[0], 'empty.data': b'',
+            'h.hashes': hashes, 'h.posting_offsets': posting_offsets, 'h.postings': postings
+        })
+        self.sections = SectionFile(path, MAGIC)
+        self.addCleanup(self.sections.close)
+        self.table = StringTable(self.sections, 'keys')
+
+    def test_items(self):
+        self.assertEqual(len(self.table), len(self.keys))
+        self.assertEqual([self.table[i] for i in range(len(self.table))], self.keys)
+
+    def test_find(self):
+        for index, key in enumerate(self.keys):
+            self.assertEqual(self.table.find(key), index, key)
+        for key in ('', 'sundby', 'Stockholm', 'ö', 'a', 'zzz'):
+            self.assertEqual(self.table.find(key), -1, key)
+
+    def test_find_in_an_empty_table(self):
+        table = StringTable(self.sections, 'empty')
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.find('a'), -1)
+        self.assertEqual(list(table.prefixed('a')), [])
+
+    def test_prefixed(self):
+        self.assertEqual([self.table[i] for i in self.table.prefixed('sund')], ['sundbyberg', 'sundsvall'])
+        self.assertEqual([self.table[i] for i in self.table.prefixed('sund', limit=1)], ['sundbyberg'])
+        self.assertEqual([self.table[i] for i in self.table.prefixed('vä')], ['västerås', 'växjö'])
+        self.assertEqual(list(self.table.prefixed('x')), [])
+
+    def test_posting_lists(self):
+        postings = PostingLists(self.sections, 'h')
+
+        def lookup(*keys):
+            return postings.lookup(np.array([stable_hash(key) for key in keys], dtype='<u8')).tolist()
+
+        self.assertEqual(lookup('a'), [2, 3])
+        self.assertEqual(lookup('a', 'b'), [1, 2, 3])
+        self.assertEqual(lookup('c'), [])
+
+    def test_stable_hash(self):
+        self.assertEqual(stable_hash('västerås'), stable_hash('västerås'))
+        self.assertNotEqual(stable_hash('västerås'), stable_hash('vesterås'))
+        self.assertLess(stable_hash('västerås'), 2 ** 64)
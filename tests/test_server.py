@@ -0,0 +1,176 @@
+import asyncio
+import json
+import unittest
+from typing import Dict, List, Tuple
+
+from src.address.component import as_dict
+from src.app import Application
+from src.exceptions import ServiceOverloaded
+from src.server import AddressService, MicroBatcher
+
+ADDRESSES = ['Oxbacksgatan 3 lgh 1213, 72461 Västerås', 'Danagränd 7, 17566 Järfälla', 'Storgatan 3, 11122 Stockholm']
+
+
+async def request(port: int, method: str, path: str, body: object = None,
+                  headers: Dict[str, str] = None) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Send one request on a new connection and return the status, headers and body of the response.
+    """
+
+    payload = b'' if body is None else body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    headers = {'Content-Length': str(len(payload)), 'Connection': 'close', **(headers or {})}
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f'{method} {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n'
+    writer.write(head.encode('latin-1') + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split(' ')[1]), response_headers, content
+
+
+class RecordingService:
+    """
+    Stands in for an AddressService, recording the chunks it is asked to parse. Parsing waits for release.
+    """
+
+    def __init__(self):
+        self.chunks: List[List[str]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def parse_chunk(self, strings, country_code=None):
+        self.chunks.append(list(strings))
+        await self.release.wait()
+        return [(country_code or 'sv', []) for _ in strings]
+
+
+class MicroBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_addresses_are_batched(self):
+        service = RecordingService()
+        batcher = MicroBatcher(service, max_batch_size=4, max_delay=0.05)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.parse(f'Storgatan {n}', 'sv') for n in range(10)))
+        await batcher.stop()
+
+        self.assertEqual(results, [('sv', [])] * 10)
+        self.assertEqual([len(chunk) for chunk in service.chunks], [4, 4, 2])
+        self.assertEqual([a for chunk in service.chunks for a in chunk], [f'Storgatan {n}' for n in range(10)])
+        self.assertEqual(batcher.pending, 0)
+
+    async def test_countries_are_parsed_separately(self):
+        service = RecordingService()
+        batcher = MicroBatcher(service, max_batch_size=10, max_delay=0.05)
+        batcher.start()
+        results = await asyncio.gather(batcher.parse('a', 'sv'), batcher.parse('b', 'en'), batcher.parse('c', 'sv'))
+        await batcher.stop()
+        self.assertEqual([code for code, _ in results], ['sv', 'en', 'sv'])
+        self.assertEqual(sorted(service.chunks), [['a', 'c'], ['b']])
+
+    async def test_reserve(self):
+        batcher = MicroBatcher(RecordingService(), max_pending=3)
+        batcher.reserve(2)
+        with self.assertRaises(ServiceOverloaded):
+            batcher.reserve(2)
+        batcher.release(2)
+        batcher.reserve(3)
+
+
+class AddressServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.app = Application(mode='PRODUCTION')
+        self.service = AddressService(self.app, max_batch_size=2, max_delay=0.01, max_pending=4, max_request_size=3,
+                                      max_body_size=1000)
+        await self.service.start('127.0.0.1', 0)
+        self.port = self.service.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.service.stop()
+
+    def expected(self, address: str) -> dict:
+        return as_dict(next(Application(mode='PRODUCTION').parse_many([address], 'sv')))
+
+    async def test_parse(self):
+        responses = await asyncio.gather(*(
+            request(self.port, 'POST', '/parse', {'address': a, 'country_code': 'sv'}) for a in ADDRESSES))
+        for address, (status, _, body) in zip(ADDRESSES, responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body), self.expected(address))
+
+    async def test_parse_batch(self):
+        document = {'addresses': ADDRESSES, 'country_code': 'sv'}
+        status, _, body = await request(self.port, 'POST', '/parse/batch', document)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['results'], [self.expected(a) for a in ADDRESSES])
+
+    async def test_bad_requests(self):
+        self.assertEqual((await request(self.port, 'POST', '/parse', b'{not json'))[0], 400)
+        self.assertEqual((await request(self.port, 'POST', '/parse', {'address': ' '}))[0], 400)
+        self.assertEqual((await request(self.port, 'POST', '/parse/batch', {'addresses': [1]}))[0], 400)
+        self.assertEqual((await request(self.port, 'GET', '/unknown'))[0], 404)
+        status, headers, _ = await request(self.port, 'GET', '/parse')
+        self.assertEqual((status, headers['Allow']), (405, 'POST'))
+
+    async def test_oversized_requests(self):
+        status, _, body = await request(self.port, 'POST', '/parse', b'', {'Content-Length': '1001'})
+        self.assertEqual(status, 413)
+        self.assertIn(b'1001 bytes', body)
+        status, _, _ = await request(self.port, 'POST', '/parse/batch', {'addresses': ADDRESSES * 2})
+        self.assertEqual(status, 413)
+
+    async def test_full_queue(self):
+        self.service.batcher.reserve(4)
+        try:
+            status, headers, _ = await request(self.port, 'POST', '/parse', {'address': ADDRESSES[0]})
+            self.assertEqual((status, headers['Retry-After']), (429, '1'))
+            status, _, _ = await request(self.port, 'POST', '/parse/batch', {'addresses': ADDRESSES[:1]})
+            self.assertEqual(status, 429)
+        finally:
+            self.service.batcher.release(4)
+        self.assertEqual((await request(self.port, 'POST', '/parse', {'address': ADDRESSES[0]}))[0], 200)
+
+    async def test_metrics(self):
+        await request(self.port, 'POST', '/parse', {'address': ADDRESSES[0], 'country_code': 'sv'})
+        status, headers, body = await request(self.port, 'GET', '/metrics')
+        text = body.decode('utf-8')
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('buache_http_requests_total{path="/parse",status="200"} 1', text)
+        self.assertIn('buache_batch_size_count 1', text)
+        self.assertIn('buache_pending_addresses 0', text)
+
+    async def test_keep_alive(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        for _ in range(2):
+            writer.write(b'GET /health HTTP/1.1\r\n\r\n')
+            lines = (await reader.readuntil(b'\r\n\r\n')).split(b'\r\n')
+            length = int(next(line for line in lines if line.startswith(b'Content-Length')).split(b': ')[1])
+            self.assertEqual(json.loads(await reader.readexactly(length))['status'], 'ok')
+        writer.close()
+
+    async def test_shutdown_answers_accepted_requests(self):
+        pending = asyncio.ensure_future(request(self.port, 'POST', '/parse', {'address': ADDRESSES[1]}))
+        while not self.service.batcher.pending:
+            await asyncio.sleep(0.001)
+        await self.service.stop()
+
+        status, _, body = await pending
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['address'], ADDRESSES[1])
+        self.assertFalse(self.service.accepting)
+        with self.assertRaises(OSError):
+            await request(self.port, 'GET', '/health')
+
+    async def test_decode(self):
+        await self.service.stop()
+        self.service = AddressService(Application(mode='PRODUCTION'), decode=True)
+        await self.service.start('127.0.0.1', 0)
+        port = self.service.server.sockets[0].getsockname()[1]
+
+        status, _, body = await request(port, 'POST', '/parse', {'address': ADDRESSES[0], 'country_code': 'sv'})
+        self.assertEqual(status, 200)
+        expected = next(Application(mode='PRODUCTION').parse_many([ADDRESSES[0]], 'sv', decode=True))
+        self.assertEqual(json.loads(body), as_dict(expected))
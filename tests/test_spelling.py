@@ -0,0 +1,174 @@
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src.address import load_country_config
+from src.address.component import AddressComponent, AddressComponentType, compact
+from src.address.parser import AddressParser
+from src.address.pool import parse_chunk
+from src.address.spelling import SpellingCorrector, deletes, edit_distance
+
+T = AddressComponentType
+
+VOCABULARIES = {
+    T.STREET_NAME: [('Kungsgatan', 5), ('Kungsängen', 1), ('Storgatan', 3), ('Storgatan', 2), ('Sturgatan', 1),
+                    ('Drottninggatan', 2)],
+    T.CITY: [('Stockholm', 3), ('Västerås', 1), ('Upplands Väsby', 1)],
+}
+
+
+class DeletesTest(unittest.TestCase):
+    def test_deletes(self):
+        self.assertEqual(deletes('abc', 0), {'abc'})
+        self.assertEqual(deletes('abc', 1), {'abc', 'bc', 'ac', 'ab'})
+        self.assertEqual(deletes('abc', 2), {'abc', 'bc', 'ac', 'ab', 'a', 'b', 'c'})
+
+    def test_single_characters_are_not_deleted(self):
+        self.assertEqual(deletes('a', 2), {'a'})
+        self.assertEqual(deletes('aa', 2), {'aa', 'a'})
+
+
+class EditDistanceTest(unittest.TestCase):
+    def test_edits(self):
+        self.assertEqual(edit_distance('kungsgatan', 'kungsgatan', 2), 0)
+        self.assertEqual(edit_distance('kungsgatan', 'kungsgata', 2), 1)
+        self.assertEqual(edit_distance('kungsgatan', 'kungsgatann', 2), 1)
+        self.assertEqual(edit_distance('kungsgatan', 'kungsgatin', 2), 1)
+        self.assertEqual(edit_distance('', 'ab', 2), 2)
+
+    def test_transpositions_are_one_edit(self):
+        self.assertEqual(edit_distance('kungsgtaan', 'kungsgatan', 2), 1)
+        self.assertEqual(edit_distance('ab', 'ba', 2), 1)
+        self.assertEqual(edit_distance('kungsgtaan', 'kungsgatan', 2), edit_distance('kungsgatan', 'kungsgtaan', 2))
+
+    def test_limit_cuts_off(self):
+        self.assertEqual(edit_distance('stockholm', 'västerås', 2), 3)
+        self.assertEqual(edit_distance('stockholm', 'västerås', 0), 1)
+        self.assertEqual(edit_distance('abc', 'abcdef', 2), 3)
+        self.assertEqual(edit_distance('abcd', 'bcda', 1), 2)
+        self.assertEqual(edit_distance('abcd', 'bcda', 2), 2)
+
+
+class SpellingCorrectorTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'sv.spell')
+        self.corrector = SpellingCorrector.compile(VOCABULARIES, self.path, 'sv')
+        self.addCleanup(self.corrector.close)
+
+    def test_settings(self):
+        self.assertEqual(self.corrector.country_code, 'sv')
+        self.assertEqual((self.corrector.max_distance, self.corrector.prefix_length), (2, 7))
+
+    def test_lookup(self):
+        self.assertEqual(self.corrector.lookup(T.STREET_NAME, 'Kungsgtaan'), ('Kungsgatan', 1))
+        self.assertEqual(self.corrector.lookup(T.STREET_NAME, 'KUNGSGATAN'), ('Kungsgatan', 0))
+        self.assertEqual(self.corrector.lookup(T.CITY, 'Stokholm'), ('Stockholm', 1))
+        self.assertEqual(self.corrector.lookup(T.CITY, 'upplands  väsby'), ('Upplands Väsby', 0))
+        self.assertEqual(self.corrector.lookup(T.CITY, 'Göteborg'), (None, 3))
+        self.assertEqual(self.corrector.lookup(T.POSTAL_CODE, '11455'), (None, 3))
+
+    def test_ties_go_to_the_most_common_term(self):
+        # Storgatan and Sturgatan are both one edit from Stprgatan, Storgatan occurs five times.
+        self.assertEqual(self.corrector.lookup(T.STREET_NAME, 'Stprgatan'), ('Storgatan', 1))
+
+    def test_known(self):
+        self.assertTrue(self.corrector.known(T.STREET_NAME, 'storgatan'))
+        self.assertFalse(self.corrector.known(T.STREET_NAME, 'Stprgatan'))
+        self.assertFalse(self.corrector.known(T.APARTMENT, '1213'))
+
+    def test_correct_components(self):
+        components = [
+            AddressComponent(T.STREET_NAME, 'Kungsgtaan', 0.9, 0),
+            AddressComponent(T.STREET_NUMBER, '3', 0.5, 1),
+            AddressComponent(T.CITY, 'Stockholm', 0.8, 2),
+        ]
+        corrected = self.corrector.correct_components(components)
+        expected = ((T.STREET_NAME.value, 'Kungsgatan', 0, 0.81, 1),) + compact(components[1:])
+        self.assertEqual(compact(corrected), expected)
+        self.assertIs(corrected[2], components[2])
+        self.assertEqual(self.corrector.correct_spelling('Kungsängn'), 'Kungsängen')
+        self.assertEqual(self.corrector.correct_spelling('Xyzzy'), 'Xyzzy')
+
+    def test_corrections_keep_the_words_of_the_value(self):
+        corrected = self.corrector.correct_components([AddressComponent(T.CITY, 'Upplands Vösby', 0.5, 3)])
+        self.assertEqual((corrected[0].component_value, corrected[0].span), ('Upplands Väsby', 2))
+
+    def test_cache_is_a_bounded_lru(self):
+        corrector = SpellingCorrector(self.path, cache_size=2)
+        self.addCleanup(corrector.close)
+        for value in ('Kungsgtaan', 'Stprgatan', 'Kungsgtaan', 'Drotninggatan'):
+            corrector.lookup(T.STREET_NAME, value)
+        self.assertEqual(list(corrector._cache), [(T.STREET_NAME, 'kungsgtaan'), (T.STREET_NAME, 'drotninggatan')])
+
+    def test_cached_lookups_do_not_search(self):
+        self.corrector.lookup(T.STREET_NAME, 'Kungsgtaan')
+        with mock.patch.object(self.corrector, 'search', side_effect=AssertionError('searched')):
+            self.assertEqual(self.corrector.lookup(T.STREET_NAME, 'kungsgtaan'), ('Kungsgatan', 1))
+
+    def test_concurrent_lookups(self):
+        corrector = SpellingCorrector(self.path, cache_size=3)
+        self.addCleanup(corrector.close)
+        values = ['Kungsgtaan', 'Stprgatan', 'Drotninggatan', 'Kungsängn', 'Sturgatn'] * 40
+        expected = [self.corrector.lookup(T.STREET_NAME, value) for value in values]
+        failures = []
+
+        def look_up():
+            if [corrector.lookup(T.STREET_NAME, value) for value in values] != expected:
+                failures.append(threading.current_thread().name)
+
+        threads = [threading.Thread(target=look_up) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertLessEqual(len(corrector._cache), 3)
+
+    def test_pickle_reopens_the_index(self):
+        corrector = pickle.loads(pickle.dumps(SpellingCorrector(self.path, penalty=0.2, cache_size=5)))
+        self.addCleanup(corrector.close)
+        self.assertEqual((corrector.path, corrector.penalty, corrector.cache_size), (self.path, 0.2, 5))
+        self.assertEqual(corrector.lookup(T.CITY, 'Vesterås'), ('Västerås', 1))
+
+
+class ParserSpellingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.corrector = SpellingCorrector.compile(VOCABULARIES, os.path.join(directory.name, 'sv.spell'), 'sv')
+        self.addCleanup(self.corrector.close)
+        self.parser = AddressParser(load_country_config('sv'), spelling=self.corrector)
+
+    def test_candidates_are_not_corrected(self):
+        with mock.patch.object(self.corrector, 'lookup', side_effect=AssertionError('looked up')):
+            self.parser.parse_address('Kungsgtaan 3, 11455 Stokholm')
+            self.parser.parse_batch(['Kungsgtaan 3, 11455 Stokholm'])
+
+    def test_only_the_chosen_components_are_corrected(self):
+        chosen = AddressComponent(T.STREET_NAME, 'Kungsgtaan', 0.9, 0)
+        candidates = [chosen, AddressComponent(T.CITY, 'Kungsgtaan', 0.4, 0),
+                      AddressComponent(T.CITY, 'Stokholm', 0.8, 1)]
+        with mock.patch.object(self.corrector, 'lookup', wraps=self.corrector.lookup) as lookup:
+            resolved = self.parser.resolve_conflicts(candidates)
+        self.assertEqual([c.component_value for c in resolved], ['Kungsgatan', 'Stockholm'])
+        self.assertEqual([call.args for call in lookup.call_args_list],
+                         [(T.STREET_NAME, 'Kungsgtaan'), (T.CITY, 'Stokholm')])
+
+    def test_possible_addresses_are_corrected(self):
+        candidates = [AddressComponent(T.STREET_NAME, 'Kungsgtaan', 0.9, 0),
+                      AddressComponent(T.CITY, 'Stokholm', 0.8, 1)]
+        labelings = self.parser.generate_possible_addresses(candidates, 2)
+        self.assertEqual([c.component_value for c in labelings[0].components], ['Kungsgatan', 'Stockholm'])
+        self.assertEqual(labelings[0].score, round(0.81 + 0.72, 2))
+
+    def test_chunks_are_decoded_where_they_are_parsed(self):
+        address = 'Oxbacksgatan 3 lgh 1213, 72461 Västerås'
+        [(code, components)] = parse_chunk([address], 'sv', lambda code: self.parser, decode=True)
+        self.assertEqual(code, 'sv')
+        expected = self.parser.resolve_conflicts(self.parser.parse_address(address))
+        self.assertEqual(compact(components), compact(expected))
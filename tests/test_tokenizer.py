@@ -0,0 +1,52 @@
+import unittest
+
+from src.address.country import load_country_config
+from src.address.parser import AddressParser
+from src.address.tokenizer import Token, Tokenizer
+from src.exceptions import AddressTokenizationException
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_unigrams_come_before_bigrams(self):
+        tokens = Tokenizer((1, 2)).tokenize('Danagränd 7 Järfälla')
+        self.assertEqual(list(tokens), [
+            Token('Danagränd', 0, 9, 0, 1),
+            Token('7', 10, 11, 1, 1),
+            Token('Järfälla', 12, 20, 2, 1),
+            Token('Danagränd 7', 0, 11, 0, 2),
+            Token('7 Järfälla', 10, 20, 1, 2),
+        ])
+
+    def test_sizes(self):
+        self.assertEqual(Tokenizer((3, 1, 1)).sizes, (1, 3))
+        self.assertEqual(Tokenizer((3,)).tokenize('a b c d').texts(), ['a b c', 'b c d'])
+        self.assertEqual(len(Tokenizer((3,)).tokenize('a b')), 0)
+        for sizes in ((), (0, 1), (-1,)):
+            with self.assertRaises(AddressTokenizationException):
+                Tokenizer(sizes)
+
+    def test_empty_address(self):
+        self.assertEqual(len(Tokenizer().tokenize('  ')), 0)
+
+    def test_table_columns(self):
+        tokens = Tokenizer((1, 2)).tokenize('a bb c')
+        self.assertEqual(tokens.text(4), 'bb c')
+        self.assertEqual((list(tokens.indexes), list(tokens.sizes)), ([0, 1, 2, 0, 1], [1, 1, 1, 2, 2]))
+
+
+class ParserTokensTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = AddressParser(load_country_config('sv'))
+
+    def test_spacing_does_not_change_tokens(self):
+        expected = self.parser.create_tokens(self.parser.normalize_address('Oxbacksgatan 3 72461 Västerås')).texts()
+        for spaced in ('Oxbacksgatan  3 72461\tVästerås', ' Oxbacksgatan 3\n72461   Västerås '):
+            tokens = self.parser.create_tokens(self.parser.normalize_address(spaced))
+            self.assertEqual(tokens.texts(), expected)
+
+    def test_spacing_does_not_change_components(self):
+        expected = self.parser.parse_batch(['Oxbacksgatan 3 72461 Västerås'])[0]
+        for parse in (self.parser.parse_address, lambda a: self.parser.parse_batch([a])[0]):
+            components = parse('Oxbacksgatan \t3  72461\tVästerås')
+            self.assertEqual([(c.component_type, c.component_value, c.position, c.confidence) for c in components],
+                             [(c.component_type, c.component_value, c.position, c.confidence) for c in expected])